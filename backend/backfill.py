@@ -0,0 +1,239 @@
+"""Score a historical range of timestamps into the prediction store.
+
+Usage (inside the backend container):
+    python backfill.py --start 2020-05-11 --end 2020-06-11
+    python backfill.py --start 2020-05-11 --end 2020-06-11 --racks 0 2 --fws 4 6
+
+Timestamps already stored for every requested FW are skipped, so an
+interrupted backfill resumes where it stopped. Rows written by this command
+within the retention window are picked up by a running backend at its next
+restart, older ones are not rolled up; use POST /backfill to backfill through
+the running service instead.
+"""
+import os
+import time
+import pickle
+import logging
+import argparse
+import threading
+import pandas as pd
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from pipeline import get_pools, shutdown_pools, submit_fetch, replace_fetch_pool, fetch_and_preprocess_range, request_inference, MAX_RACKS_IN_FLIGHT
+from prediction_store import PredictionStore
+from data_fetch import list_racks
+
+logger = logging.getLogger(__name__)
+
+fw_values = [4, 6, 12, 24, 32, 64, 96, 192, 288]
+
+# Timestamps per bulk read; 96 is one day of 15-minute snapshots
+BACKFILL_CHUNK_SIZE = int(os.environ.get("BACKFILL_CHUNK_SIZE", 96))
+
+
+class BackfillProgress:
+    """Counters of a backfill run, safe to read while it is running."""
+
+    def __init__(self):
+        self.total = 0
+        self.skipped = 0
+        self.done = 0
+        self.failed = 0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def start(self, total, skipped):
+        with self._lock:
+            self.total = total
+            self.skipped = skipped
+            self.started = time.time()
+
+    def add(self, done, failed):
+        with self._lock:
+            self.done += done
+            self.failed += failed
+
+    def finish(self):
+        with self._lock:
+            self.finished = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            if self.started is None:
+                return {"running": False, "total": 0}
+            elapsed = (self.finished or time.time()) - self.started
+            processed = self.done + self.failed
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            return {
+                "running": self.finished is None,
+                "total": self.total,
+                "skipped": self.skipped,
+                "done": self.done,
+                "failed": self.failed,
+                "elapsed_s": round(elapsed, 1),
+                "snapshots_per_s": round(rate, 2),
+                "eta_s": round((self.total - processed) / rate, 1) if rate else None,
+            }
+
+
+def load_timestamps(path="common_ts.pickle"):
+    with open(path, "rb") as f:
+        return sorted(pickle.load(f))
+
+def to_utc(value):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+def select_range(timestamps, start=None, end=None):
+    """Timestamps within [start, end]; either bound may be None."""
+    start = to_utc(start) if start is not None else None
+    end = to_utc(end) if end is not None else None
+    return [
+        ts for ts in timestamps
+        if (start is None or ts >= start) and (end is None or ts <= end)
+    ]
+
+def plan_backfill(store, timestamps, racks, fws, chunk_size=BACKFILL_CHUNK_SIZE):
+    """(rack, timestamps) chunks still missing from the store, and the number of rack snapshots skipped."""
+    jobs = []
+    skipped = 0
+    for rack in racks:
+        stored = store.stored_keys(rack, fws, timestamps[0], timestamps[-1]) if timestamps else set()
+        missing = [ts for ts in timestamps if str(ts) not in stored]
+        skipped += len(timestamps) - len(missing)
+        for i in range(0, len(missing), chunk_size):
+            jobs.append((rack, missing[i:i + chunk_size]))
+    return jobs, skipped
+
+def infer_chunk(rack, fws, preprocessed):
+    """Inference for every preprocessed snapshot of a chunk: (rows to store, failed snapshots)."""
+    rows = []
+    failed = 0
+    for ts, graph_payload, _, _ in preprocessed:
+        if graph_payload is None:
+            failed += 1
+            continue
+        try:
+            result = request_inference(rack, fws, graph_payload)
+        except Exception as e:
+            logger.error(f"Inference error for ts={ts}, rack={rack}: {e}")
+            failed += 1
+            continue
+        for fw in fws:
+            prediction = result["predictions"].get(str(fw))
+            if prediction is not None:
+                rows.append((ts, rack, fw, prediction))
+    return rows, failed
+
+def run_backfill(store, timestamps, racks, fws, chunk_size=BACKFILL_CHUNK_SIZE, on_rows=None, progress=None):
+    """Backfill every (rack, timestamp) not yet in the store.
+
+    Chunks are bulk-read in the fetch process pool and scored in the
+    inference thread pool, with at most MAX_RACKS_IN_FLIGHT chunks between
+    the two. Chunks of one rack are fetched one at a time, so its timestamp
+    index is never rebuilt by two workers at once. Each chunk is written in one store transaction, so an
+    interrupted run loses at most the chunks in flight. A chunk whose fetch
+    worker died is retried once in a new pool. `on_rows` is called with the
+    rows of every written chunk.
+    """
+    progress = progress or BackfillProgress()
+    jobs, skipped = plan_backfill(store, timestamps, racks, fws, chunk_size)
+    progress.start(sum(len(chunk) for _, chunk in jobs), skipped)
+    logger.info(f"Backfill of {len(timestamps)} timestamps x {len(racks)} racks: {progress.total} snapshots to score, {skipped} already stored")
+
+    _, inference_pool = get_pools()
+    fetches = {}  # future -> (rack, chunk, pool, retried)
+    inferences = {}  # future -> number of snapshots
+    in_flight = 0
+    fetching = set()  # racks with a chunk in the fetch pool
+
+    def submit_fetches():
+        nonlocal in_flight
+        while in_flight < MAX_RACKS_IN_FLIGHT:
+            job = next((job for job in jobs if job[0] not in fetching), None)
+            if job is None:
+                return
+            jobs.remove(job)
+            rack, chunk = job
+            pool, future = submit_fetch(fetch_and_preprocess_range, rack, chunk)
+            fetches[future] = (rack, chunk, pool, False)
+            fetching.add(rack)
+            in_flight += 1
+
+    submit_fetches()
+    while fetches or inferences:
+        done, _ = wait(list(fetches) + list(inferences), return_when=FIRST_COMPLETED)
+        for future in done:
+            if future in fetches:
+                rack, chunk, pool, retried = fetches.pop(future)
+                fetching.discard(rack)
+                try:
+                    preprocessed = future.result()
+                except BrokenProcessPool as e:
+                    if not retried:
+                        replace_fetch_pool(pool)
+                        pool, retry = submit_fetch(fetch_and_preprocess_range, rack, chunk)
+                        fetches[retry] = (rack, chunk, pool, True)
+                        fetching.add(rack)
+                        continue
+                    logger.error(f"Backfill fetch error for rack={rack}, {chunk[0]} .. {chunk[-1]}: {e}")
+                    progress.add(0, len(chunk))
+                    in_flight -= 1
+                    continue
+                except Exception as e:
+                    logger.error(f"Backfill fetch error for rack={rack}, {chunk[0]} .. {chunk[-1]}: {e}")
+                    progress.add(0, len(chunk))
+                    in_flight -= 1
+                    continue
+                inferences[inference_pool.submit(infer_chunk, rack, fws, preprocessed)] = len(chunk)
+            else:
+                size = inferences.pop(future)
+                in_flight -= 1
+                try:
+                    rows, failed = future.result()
+                except Exception as e:
+                    logger.error(f"Backfill inference error: {e}")
+                    progress.add(0, size)
+                    continue
+                store.append(rows)
+                if on_rows is not None:
+                    on_rows(rows)
+                progress.add(size - failed, failed)
+                stats = progress.snapshot()
+                logger.info(
+                    f"Backfill {stats['done'] + stats['failed']}/{stats['total']} snapshots "
+                    f"({stats['failed']} failed) | {stats['snapshots_per_s']} snapshots/s | ETA {stats['eta_s']}s"
+                )
+        submit_fetches()
+
+    progress.finish()
+    stats = progress.snapshot()
+    logger.info(f"✅ Backfill finished: {stats['done']} scored, {stats['failed']} failed, {stats['skipped']} skipped in {stats['elapsed_s']}s ({stats['snapshots_per_s']} snapshots/s)")
+    return progress
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    parser = argparse.ArgumentParser(description="Score a historical timestamp range into the prediction store.")
+    parser.add_argument("--start", help="first timestamp to score (default: first in --timestamps), naive values are UTC")
+    parser.add_argument("--end", help="last timestamp to score (default: last in --timestamps)")
+    parser.add_argument("--racks", type=int, nargs="*", help="rack ids to score (default: every directory under DATA_DIR)")
+    parser.add_argument("--fws", type=int, nargs="*", default=fw_values, help="future windows to score")
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE, help="timestamps per bulk read")
+    parser.add_argument("--timestamps", default="common_ts.pickle", help="pickled timestamp list to select the range from")
+    parser.add_argument("--store", default="/app/storage/predictions.sqlite", help="prediction store to write into")
+    args = parser.parse_args()
+
+    racks = args.racks
+    if not racks:
+        racks = list_racks()
+
+    timestamps = select_range(load_timestamps(args.timestamps), args.start, args.end)
+    try:
+        run_backfill(PredictionStore(args.store), timestamps, racks, args.fws, args.chunk_size)
+    finally:
+        shutdown_pools()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compare the DataFrame + MinMaxScaler preprocessing path with the float32 array path.
+
+Usage (inside the backend container):
+    python bench_preprocess.py [--rack 0] [--count 50] [--wire-format npy]
+
+For `count` timestamps of the rack, times fetch and preprocessing (up to the
+encoded request body) of:
+  dataframe   data_fetch -> scale_df -> to_numpy -> encode
+  array       fetch_array -> in-place per-snapshot min-max -> encode
+  array+rack  fetch_array -> in-place min-max with build_scaling_stats.py ranges -> encode
+and the largest difference of the array path's scaled values from the
+dataframe path. Uses the rack store when RACK_STORE_DIR has the rack.
+"""
+import time
+import pickle
+import argparse
+import numpy as np
+
+from data_fetch import data_fetch, fetch_array
+from data_preprocessing import scale_df, minmax_scale_, encode_payload, load_rack_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rack", type=int, default=0)
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--wire-format", default="npy")
+    args = parser.parse_args()
+
+    with open("common_ts.pickle", "rb") as f:
+        timestamps = sorted(pickle.load(f))[:args.count]
+    stats = load_rack_stats(args.rack)
+
+    def dataframe_path(ts):
+        start = time.perf_counter()
+        df = data_fetch(args.rack, ts)
+        fetched = time.perf_counter()
+        x = scale_df(df).to_numpy(dtype=np.float32)
+        encode_payload(x, args.wire_format)
+        return fetched - start, time.perf_counter() - fetched, x
+
+    def array_path(ts, rack_stats=None):
+        start = time.perf_counter()
+        x = fetch_array(args.rack, ts)
+        fetched = time.perf_counter()
+        if rack_stats is not None:
+            minmax_scale_(x, *rack_stats)
+        else:
+            minmax_scale_(x)
+        encode_payload(x, args.wire_format)
+        return fetched - start, time.perf_counter() - fetched, x
+
+    paths = [("dataframe", dataframe_path), ("array", array_path)]
+    if stats is not None:
+        paths.append(("array+rack", lambda ts: array_path(ts, stats)))
+    else:
+        print(f"no scaling stats for rack {args.rack}, run build_scaling_stats.py to include array+rack")
+
+    # warm-up: builds the file index and opens the store
+    for _, path in paths:
+        path(timestamps[0])
+
+    reference = {}
+    print(f"{'path':<11} {'fetch ms':>9} {'preprocess ms':>14} {'total ms':>9} {'max |diff|':>11}")
+    for name, path in paths:
+        fetch_ms, preprocess_ms, max_diff = [], [], 0.0
+        for ts in timestamps:
+            fetch_s, preprocess_s, x = path(ts)
+            fetch_ms.append(fetch_s * 1000)
+            preprocess_ms.append(preprocess_s * 1000)
+            if name == "dataframe":
+                reference[ts] = x
+            elif name == "array":
+                max_diff = max(max_diff, float(np.abs(x - reference[ts]).max()))
+        diff = f"{max_diff:.1e}" if name == "array" else "-"
+        print(f"{name:<11} {np.median(fetch_ms):>9.3f} {np.median(preprocess_ms):>14.3f} "
+              f"{np.median(fetch_ms) + np.median(preprocess_ms):>9.3f} {diff:>11}")
+
+if __name__ == "__main__":
+    main()
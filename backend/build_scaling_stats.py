@@ -0,0 +1,55 @@
+"""Compute per-rack, per-feature min/max telemetry ranges for SCALING_MODE=rack.
+
+Usage (inside the backend container):
+    python build_scaling_stats.py                # every rack directory under DATA_DIR
+    python build_scaling_stats.py --racks 0 2 8
+"""
+import os
+import logging
+import argparse
+import numpy as np
+
+from data_fetch import get_cols, list_racks, list_rack_files, read_file
+from data_preprocessing import SCALING_STATS_DIR, stats_path
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def rack_stats(rack, cols):
+    """Feature-wise min and max over every clean row of every node of the rack."""
+    mins = np.full(len(cols), np.inf)
+    maxs = np.full(len(cols), -np.inf)
+    for file_path in list_rack_files(rack):
+        # same row selection and column order as data_fetch
+        values = read_file(file_path).reindex(columns=cols).fillna(0).to_numpy(dtype=np.float32)
+        if len(values):
+            mins = np.minimum(mins, values.min(axis=0))
+            maxs = np.maximum(maxs, values.max(axis=0))
+
+    # features never observed scale like constant ones
+    unseen = mins > maxs
+    mins[unseen] = maxs[unseen] = 0
+    return mins.astype(np.float32), maxs.astype(np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute per-rack feature ranges for SCALING_MODE=rack.")
+    parser.add_argument("--racks", type=int, nargs="*", help="rack ids (default: every directory under DATA_DIR)")
+    args = parser.parse_args()
+
+    racks = args.racks
+    if not racks:
+        racks = list_racks()
+
+    cols = get_cols()
+    os.makedirs(SCALING_STATS_DIR, exist_ok=True)
+    for rack in racks:
+        mins, maxs = rack_stats(rack, cols)
+        path = stats_path(rack)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, mins=mins, maxs=maxs, columns=np.array(cols))
+        os.replace(tmp_path, path)
+        logger.info(f"✅ rack {rack}: feature ranges written to {path}")
+
+if __name__ == "__main__":
+    main()
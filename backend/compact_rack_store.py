@@ -0,0 +1,89 @@
+"""Compact the node-major `/data/{rack}/{node}.parquet` files into a rack store.
+
+Usage (inside the backend container):
+    python compact_rack_store.py                # every rack directory under DATA_DIR
+    python compact_rack_store.py --racks 0 2 8
+"""
+import os
+import json
+import shutil
+import pickle
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+from data_fetch import get_cols, list_racks, list_rack_files, get_node_name, read_file
+from rack_store import RACK_STORE_DIR, rack_dir
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def load_timestamp_index(path="common_ts.pickle"):
+    with open(path, "rb") as f:
+        timestamps = pickle.load(f)
+    index = pd.DatetimeIndex(sorted(timestamps))
+    if index.tz is None:
+        index = index.tz_localize("UTC")
+    return index.as_unit("ns").asi8
+
+def compact_rack(rack, ts_index, cols):
+    files = list_rack_files(rack)
+    nodes = [get_node_name(file_path) for file_path in files]
+
+    # build into a temporary directory and swap it in, readers never see a partial store
+    final_dir = rack_dir(rack)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    shape = (len(ts_index), len(files), len(cols))
+    features = np.lib.format.open_memmap(os.path.join(tmp_dir, "features.npy"), mode="w+", dtype=np.float32, shape=shape)
+    valid = np.zeros(shape[:2], dtype=bool)
+
+    for j, file_path in enumerate(files):
+        df = read_file(file_path)
+        node_ts = pd.DatetimeIndex(df["timestamp"])
+        if node_ts.tz is None:
+            node_ts = node_ts.tz_localize("UTC")
+        node_ns = node_ts.as_unit("ns").asi8
+
+        pos = np.searchsorted(ts_index, node_ns)
+        pos = np.minimum(pos, len(ts_index) - 1)
+        hit = ts_index[pos] == node_ns
+
+        values = df.reindex(columns=cols).fillna(0).to_numpy(dtype=np.float32)
+        features[pos[hit], j, :] = values[hit]
+        valid[pos[hit], j] = True
+        logger.info(f"rack {rack}: node {nodes[j]} compacted ({hit.sum()} of {len(df)} rows on the timestamp index)")
+
+    features.flush()
+    del features
+    np.save(os.path.join(tmp_dir, "valid.npy"), valid)
+    np.save(os.path.join(tmp_dir, "timestamps.npy"), ts_index)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({"nodes": nodes, "columns": cols}, f)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    logger.info(f"✅ rack {rack} compacted into {final_dir} with shape {shape}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact per-node parquet telemetry into timestamp-major rack stores.")
+    parser.add_argument("--racks", type=int, nargs="*", help="rack ids to compact (default: every directory under DATA_DIR)")
+    parser.add_argument("--timestamps", default="common_ts.pickle", help="pickled timestamp list defining the time axis")
+    args = parser.parse_args()
+
+    racks = args.racks
+    if not racks:
+        racks = list_racks()
+
+    ts_index = load_timestamp_index(args.timestamps)
+    cols = get_cols()
+    os.makedirs(RACK_STORE_DIR, exist_ok=True)
+    for rack in racks:
+        compact_rack(rack, ts_index, cols)
+
+if __name__ == "__main__":
+    main()
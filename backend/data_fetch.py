@@ -2,9 +2,36 @@ import os
 import pandas as pd
 import numpy as np
 import pickle
+import logging
+import tempfile
 import warnings
+import threading
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from rack_store import get_rack_store
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+logger = logging.getLogger(__name__)
+
+# Root of the telemetry, one directory of {node}.parquet files per rack
+DATA_DIR = os.environ.get("DATA_DIR", "/data")
+# Directory holding the persistent timestamp -> row-group index (one pickle per rack)
+TS_INDEX_DIR = os.environ.get("TS_INDEX_DIR", "/app/storage/ts_index")
+
+_cols = None
+_rack_files = {}  # rack -> (dir mtime_ns, sorted file paths)
+_rack_index = {}  # rack -> {file_path: file index entry}
+_index_lock = threading.Lock()
+
+
+def get_cols():
+    global _cols
+    if _cols is None:
+        with open("col_list.pickle", "rb") as f:
+            _cols = pickle.load(f)
+    return _cols
+
 def read_file(node_path):
     node_data = pd.read_parquet(node_path)
     node_data = node_data.dropna()
@@ -17,11 +44,18 @@ def get_node_name(file_path):
 
     return int(node)
 
-def data_fetch(rack, ts):
-    data_dir = f"/data/{rack}/"
+def list_racks():
+    """Ids of the rack directories under DATA_DIR."""
+    return sorted(int(name) for name in os.listdir(DATA_DIR) if name.isdigit())
 
-    with open("col_list.pickle","rb") as f:
-        cols = pickle.load(f)
+def list_rack_files(rack):
+    """Sorted node files of a rack, re-listed only when the directory changes."""
+    data_dir = os.path.join(DATA_DIR, str(rack))
+    dir_mtime = os.stat(data_dir).st_mtime_ns
+
+    cached = _rack_files.get(rack)
+    if cached is not None and cached[0] == dir_mtime:
+        return cached[1]
 
     files = []
     # loop over the contents of the directory
@@ -34,17 +68,266 @@ def data_fetch(rack, ts):
 
     # Sort using the custom function
     sorted_files = sorted(files, key=get_node_name)
-    
-    fetched_data_df = pd.DataFrame(columns=cols)
-    for file_path in sorted_files:
-        df = read_file(file_path)
-        df_ts = df[df['timestamp'] == ts]
-        fetched_data_df = pd.concat([fetched_data_df,df_ts])
-    
+    _rack_files[rack] = (dir_mtime, sorted_files)
+    return sorted_files
+
+def to_ns(ts):
+    """Timestamp as int64 nanoseconds since epoch, naive values taken as UTC."""
+    ts = pd.Timestamp(ts)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return ts.value
+
+def build_file_index(file_path, stat):
+    """Per-row-group [min, max] timestamp ranges of a parquet file.
+
+    Uses the row-group statistics when the writer stored them and falls
+    back to reading the timestamp column of that row group otherwise.
+    """
+    pf = pq.ParquetFile(file_path)
+    ts_col = pf.schema_arrow.get_field_index("timestamp")
+    n_groups = pf.metadata.num_row_groups
+
+    mins = np.empty(n_groups, dtype=np.int64)
+    maxs = np.empty(n_groups, dtype=np.int64)
+    for i in range(n_groups):
+        stats = pf.metadata.row_group(i).column(ts_col).statistics
+        if stats is not None and stats.has_min_max:
+            mins[i], maxs[i] = to_ns(stats.min), to_ns(stats.max)
+        else:
+            col = pf.read_row_group(i, columns=["timestamp"]).column(0).to_pandas()
+            if len(col) == 0:
+                # empty row group can never match, keep an inverted range
+                mins[i], maxs[i] = 1, 0
+            else:
+                mins[i], maxs[i] = to_ns(col.min()), to_ns(col.max())
+
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "ts_type": pf.schema_arrow.field("timestamp").type,
+        "mins": mins,
+        "maxs": maxs,
+    }
+
+def rack_index_path(rack):
+    return os.path.join(TS_INDEX_DIR, f"{rack}.pickle")
+
+def load_rack_index(rack):
+    index = _rack_index.get(rack)
+    if index is not None:
+        return index
+
+    index = {}
+    path = rack_index_path(rack)
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                index = pickle.load(f)
+        except Exception:
+            # a corrupt index is only a cache, rebuild it from the files
+            index = {}
+    _rack_index[rack] = index
+    return index
+
+def save_rack_index(rack, index):
+    """Atomically replace the rack's index file.
+
+    Fetch worker processes may index the same rack concurrently, so each
+    writes its own temp file; the last replace wins.
+    """
+    os.makedirs(TS_INDEX_DIR, exist_ok=True)
+    path = rack_index_path(rack)
+    fd, tmp_path = tempfile.mkstemp(dir=TS_INDEX_DIR, prefix=f"{rack}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(index, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def get_file_indexes(rack, files):
+    """Index entries for every file of the rack, refreshed when a file changes."""
+    with _index_lock:
+        index = load_rack_index(rack)
+        changed = False
+        for file_path in files:
+            stat = os.stat(file_path)
+            entry = index.get(file_path)
+            if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                index[file_path] = build_file_index(file_path, stat)
+                changed = True
+
+        stale = set(index) - set(files)
+        for file_path in stale:
+            del index[file_path]
+
+        if changed or stale:
+            try:
+                save_rack_index(rack, index)
+            except OSError as e:
+                # the in-memory index is valid; the file is only a cache for the next process
+                logger.warning(f"Could not save the timestamp index of rack {rack}: {e}")
+        return [index[file_path] for file_path in files]
+
+def read_node_table(file_path, entry, ts_ns, ts, cols):
+    """Arrow table of one node file at `ts`, reading only the row groups that can hold it."""
+    row_groups = np.nonzero((entry["mins"] <= ts_ns) & (entry["maxs"] >= ts_ns))[0]
+    if len(row_groups) == 0:
+        return None
+
+    fragment = next(ds.dataset(file_path, format="parquet").get_fragments())
+    fragment = fragment.subset(row_group_ids=row_groups.tolist())
+    names = set(fragment.physical_schema.names)
+    ts_filter = ds.field("timestamp") == pa.scalar(ts, type=entry["ts_type"])
+    table = fragment.to_table(columns=[c for c in cols if c in names] + ["timestamp"], filter=ts_filter)
+    if table.num_rows == 0:
+        return None
+    return table
+
+def read_node_at(file_path, entry, ts_ns, ts, cols):
+    """Rows of one node file at `ts` as a DataFrame, without incomplete rows."""
+    table = read_node_table(file_path, entry, ts_ns, ts, cols)
+    if table is None:
+        return None
+    return table.to_pandas().dropna()
+
+def table_to_array(table, cols):
+    """Feature rows of an arrow table as float32 (rows x len(cols)).
+
+    Columns missing from the table are 0 and rows with any null value
+    (timestamp included) are dropped, like reindex + dropna + fillna(0).
+    """
+    x, keep = table_rows(table, cols)
+    return x if keep.all() else x[keep]
+
+def table_rows(table, cols):
+    """(float32 rows x len(cols), mask of complete rows) of an arrow table, see table_to_array."""
+    x = np.zeros((table.num_rows, len(cols)), dtype=np.float32)
+    keep = np.ones(table.num_rows, dtype=bool)
+    names = set(table.column_names)
+    for j, col in enumerate(cols):
+        if col in names:
+            values = table.column(col).to_numpy(zero_copy_only=False)
+            x[:, j] = values
+            keep &= ~np.isnan(x[:, j])
+    keep &= ~np.asarray(table.column("timestamp").is_null())
+    return x, keep
+
+def fetch_array(rack, ts):
+    """data_fetch as one writable, C-contiguous float32 (nodes x features) array.
+
+    Skips pandas entirely; the result can be scaled in place and encoded as
+    the request body without further copies.
+    """
+    cols = get_cols()
+    ts_ns = to_ns(ts)
+
+    store = get_rack_store(rack)
+    if store is not None:
+        snapshot = store.snapshot(ts_ns)
+        if snapshot is not None:
+            # the store is a read-only mapping, scaling needs a private copy
+            return np.array(snapshot, dtype=np.float32, order="C")
+
+    sorted_files = list_rack_files(rack)
+    entries = get_file_indexes(rack, sorted_files)
+
+    arrays = []
+    for file_path, entry in zip(sorted_files, entries):
+        table = read_node_table(file_path, entry, ts_ns, ts, cols)
+        if table is not None:
+            arrays.append(table_to_array(table, cols))
+
+    if not arrays:
+        return np.zeros((0, len(cols)), dtype=np.float32)
+    return np.concatenate(arrays)
+
+def read_node_range(file_path, entry, ts_ns, cols):
+    """Rows of one node file at any of the sorted `ts_ns`, in one scan of the row groups covering them."""
+    row_groups = np.nonzero((entry["mins"] <= ts_ns[-1]) & (entry["maxs"] >= ts_ns[0]))[0]
+    if len(row_groups) == 0:
+        return None
+
+    fragment = next(ds.dataset(file_path, format="parquet").get_fragments())
+    fragment = fragment.subset(row_group_ids=row_groups.tolist())
+    names = set(fragment.physical_schema.names)
+    wanted = pa.array(np.asarray(ts_ns, dtype="datetime64[ns]")).cast(entry["ts_type"])
+    ts_filter = ds.field("timestamp").isin(wanted)
+    table = fragment.to_table(columns=[c for c in cols if c in names] + ["timestamp"], filter=ts_filter)
+    if table.num_rows == 0:
+        return None
+
+    return table.to_pandas().dropna()
+
+def finish_frame(frames, cols):
+    """Node rows of one timestamp -> the feature frame returned by data_fetch."""
+    if frames:
+        fetched_data_df = pd.concat(frames).reindex(columns=cols + ["timestamp"])
+    else:
+        fetched_data_df = pd.DataFrame(columns=cols + ["timestamp"])
+
     fetched_data_df = fetched_data_df.reset_index(drop=True)
     fetched_data_df = fetched_data_df.drop(columns=["timestamp"])
     return fetched_data_df.fillna(0)
 
+def data_fetch_range(rack, timestamps):
+    """data_fetch for many timestamps of one rack: yields (ts, frame) in order.
+
+    Each node file is opened and scanned once for the whole batch instead of
+    once per timestamp, which is what makes backfilling long ranges fast.
+    """
+    cols = get_cols()
+    ts_ns = np.array([to_ns(ts) for ts in timestamps], dtype=np.int64)
+
+    store = get_rack_store(rack)
+    snapshots = {}
+    if store is not None:
+        for i, value in enumerate(ts_ns):
+            snapshot = store.snapshot(value)
+            if snapshot is not None:
+                snapshots[i] = pd.DataFrame(snapshot, columns=store.columns, copy=False)
+
+    missing = np.array([value for i, value in enumerate(ts_ns) if i not in snapshots], dtype=np.int64)
+    by_ts = {}  # ts ns -> node frames in node order
+    if len(missing):
+        wanted = np.unique(missing)
+        sorted_files = list_rack_files(rack)
+        entries = get_file_indexes(rack, sorted_files)
+        for file_path, entry in zip(sorted_files, entries):
+            df_node = read_node_range(file_path, entry, wanted, cols)
+            if df_node is None:
+                continue
+            node_ns = pd.to_datetime(df_node["timestamp"], utc=True).dt.as_unit("ns").astype("int64")
+            for value, df_ts in df_node.groupby(node_ns.to_numpy(), sort=False):
+                by_ts.setdefault(value, []).append(df_ts)
+
+    for i, ts in enumerate(timestamps):
+        if i in snapshots:
+            yield ts, snapshots[i]
+        else:
+            yield ts, finish_frame(by_ts.get(ts_ns[i], []), cols)
+
+def data_fetch(rack, ts):
+    cols = get_cols()
+    ts_ns = to_ns(ts)
+
+    # Compacted rack store: a slice of the memory-mapped tensor, no parquet decode
+    store = get_rack_store(rack)
+    if store is not None:
+        snapshot = store.snapshot(ts_ns)
+        if snapshot is not None:
+            return pd.DataFrame(snapshot, columns=store.columns, copy=False)
 
+    sorted_files = list_rack_files(rack)
+    entries = get_file_indexes(rack, sorted_files)
 
+    frames = []
+    for file_path, entry in zip(sorted_files, entries):
+        df_ts = read_node_at(file_path, entry, ts_ns, ts, cols)
+        if df_ts is not None:
+            frames.append(df_ts)
 
+    return finish_frame(frames, cols)
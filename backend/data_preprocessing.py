@@ -1,8 +1,20 @@
+import io
+import os
 import pandas as pd
 import numpy as np
 import torch
 from sklearn import preprocessing
 
+# Must match NPY_CONTENT_TYPE in gnn_inference/wire.py
+NPY_CONTENT_TYPE = "application/x-npy"
+
+# Min-max scaling: "snapshot" fits each snapshot like the original MinMaxScaler,
+# "rack" uses the per-rack feature ranges written by build_scaling_stats.py
+SCALING_MODE = os.environ.get("SCALING_MODE", "snapshot")
+SCALING_STATS_DIR = os.environ.get("SCALING_STATS_DIR", "/app/storage/scaling_stats")
+
+_rack_stats = {}  # rack -> (file mtime_ns, (mins, ranges))
+
 def scale_df(df):
     scaler = preprocessing.MinMaxScaler()
     names = df.columns
@@ -11,6 +23,42 @@ def scale_df(df):
 
     return df
 
+def minmax_scale_(x, mins=None, ranges=None):
+    """Min-max scale the columns of a float32 array in place, like MinMaxScaler.
+
+    Without mins/ranges each column is fitted on x itself; constant columns
+    get a range of 1 (sklearn's zero-range handling) and so scale to 0.
+    """
+    if mins is None:
+        mins = x.min(axis=0)
+        ranges = x.max(axis=0) - mins
+        ranges[ranges == 0] = 1
+    x -= mins
+    x /= ranges
+    return x
+
+def stats_path(rack):
+    return os.path.join(SCALING_STATS_DIR, f"{rack}.npz")
+
+def load_rack_stats(rack):
+    """(mins, ranges) float32 feature vectors of a rack, None if never computed."""
+    path = stats_path(rack)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = _rack_stats.get(rack)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with np.load(path) as stats:
+        mins = stats["mins"].astype(np.float32)
+        ranges = (stats["maxs"] - stats["mins"]).astype(np.float32)
+    ranges[ranges == 0] = 1
+    _rack_stats[rack] = (mtime, (mins, ranges))
+    return mins, ranges
+
 def make_edge_index(num_nodes):
     edges = []
     for i in range(num_nodes):
@@ -22,15 +70,40 @@ def make_edge_index(num_nodes):
     edge_index = list(map(list, zip(*edges)))
     return edge_index
 
-def pre_process(df):
-    scaled_df = scale_df(df)
-    df_feat = scaled_df.to_numpy()
+def pre_process(df, wire_format="json", rack=None):
+    # Always a private copy: scaling is in place, and frames may be read-only
+    # views (pandas 3 copy-on-write, rack-store memmaps)
+    return pre_process_array(np.array(df, dtype=np.float32), wire_format, rack)
+
+def pre_process_array(x, wire_format="json", rack=None):
+    """Scale a float32 (nodes x features) array in place and encode it."""
+    return encode_payload(scale_array(x, rack), wire_format)
+
+def scale_array(x, rack=None):
+    """Scale a float32 (nodes x features) array in place.
+
+    With SCALING_MODE=rack and stats available for `rack`, the rack's
+    historical ranges are used instead of fitting on the snapshot.
+    """
+    if len(x) == 0:
+        raise ValueError("no node data to preprocess")
+    stats = load_rack_stats(rack) if SCALING_MODE == "rack" and rack is not None else None
+    if stats is not None:
+        minmax_scale_(x, *stats)
+    else:
+        minmax_scale_(x)
+    return x
 
-    edge_index = make_edge_index(df.shape[0])
+def encode_payload(x, wire_format="json"):
+    """Keyword arguments for requests.post carrying x in the given wire format.
 
-    return {
-        "x": df_feat.tolist(),
-        "edge_index": edge_index
-    }
+    "npy" sends the float32 matrix as a raw .npy body, "json" as nested lists.
+    edge_index is omitted in both: the inference service uses its cached chain
+    adjacency for the rack, which is what make_edge_index would describe.
+    """
+    if wire_format == "npy":
+        buf = io.BytesIO()
+        np.save(buf, np.ascontiguousarray(x, dtype="<f4"))
+        return {"data": buf.getvalue(), "headers": {"Content-Type": NPY_CONTENT_TYPE}}
 
-    
+    return {"json": {"x": x.tolist()}}
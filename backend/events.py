@@ -0,0 +1,60 @@
+import os
+import json
+import asyncio
+import threading
+
+# Seconds between keep-alive comments on idle /events streams
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", 5))
+
+
+def event_id(timestamp, rack=None):
+    return str(timestamp) if rack is None else f"{timestamp}:{rack}"
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: cycle\ndata: {json.dumps(event)}\n\n"
+
+
+class CycleEvents:
+    """Broadcasts "cycle completed" events from the scheduler thread to SSE clients.
+
+    The event id is the cycle's timestamp, or "timestamp:rack" for the
+    per-rack events of stream ingest, so a client reconnecting with
+    Last-Event-ID only gets the latest event if it has not seen it yet.
+    """
+
+    def __init__(self, timestamp=None):
+        self.latest = {"id": event_id(timestamp), "timestamp": timestamp} if timestamp is not None else None
+        self.subscribers = set()  # (event loop, queue) of each open stream
+        self._lock = threading.Lock()
+
+    def publish(self, timestamp, **details):
+        event = {"id": event_id(timestamp, details.get("rack")), "timestamp": str(timestamp), **details}
+        with self._lock:
+            self.latest = event
+            subscribers = list(self.subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def stream(self, last_event_id=None, heartbeat=SSE_HEARTBEAT_SECONDS):
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self.subscribers.add(subscriber)
+            latest = self.latest
+        try:
+            if latest is not None and latest["id"] != last_event_id:
+                yield format_event(latest)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            with self._lock:
+                self.subscribers.discard(subscriber)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self.subscribers), "latest": self.latest}
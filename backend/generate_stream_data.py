@@ -0,0 +1,81 @@
+"""Append synthetic telemetry to `{out}/{rack}/{node}.parquet`, one row group per node and step.
+
+Stands in for the collectors when trying INGEST_MODE=stream locally: each
+step rewrites every node file of a rack with one more row group, one node
+after the other, so the backend sees racks that are briefly incomplete.
+
+Usage (inside the backend container):
+    python generate_stream_data.py --out /tmp/stream --racks 0 2 --steps 10 --every 30
+    DATA_DIR=/tmp/stream INGEST_MODE=stream uvicorn main:app
+"""
+import os
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_fetch import get_cols
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def make_row_group(ts, cols, rng, nan_rate):
+    """One-row table of random features at `ts`; with probability nan_rate one feature is null."""
+    values = rng.random(len(cols))
+    if rng.random() < nan_rate:
+        values[rng.integers(len(cols))] = np.nan
+    arrays = [pa.array([value], type=pa.float64()) for value in values]
+    arrays.append(pa.array([ts.value // 1000], type=pa.timestamp("us", tz="UTC")))
+    return pa.Table.from_arrays(arrays, names=cols + ["timestamp"])
+
+
+def append_row_group(path, table, tmp_dir):
+    """Rewrite `path` with its existing row groups plus `table`, swapped in atomically."""
+    tmp_path = os.path.join(tmp_dir, os.path.basename(path))
+    existing = pq.ParquetFile(path) if os.path.exists(path) else None
+    with pq.ParquetWriter(tmp_path, table.schema) as writer:
+        if existing is not None:
+            for i in range(existing.num_row_groups):
+                writer.write_table(existing.read_row_group(i))
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append synthetic per-node telemetry row groups at a fixed interval.")
+    parser.add_argument("--out", default="/tmp/stream", help="data root, one directory per rack (DATA_DIR of the backend)")
+    parser.add_argument("--racks", type=int, nargs="+", default=[0])
+    parser.add_argument("--nodes", type=int, default=20, help="node files per rack")
+    parser.add_argument("--start", help="first timestamp (default: now, floored to --freq)")
+    parser.add_argument("--freq", default="15min", help="telemetry step between timestamps")
+    parser.add_argument("--steps", type=int, default=10, help="timestamps to append")
+    parser.add_argument("--every", type=float, default=30, help="seconds to wait between steps")
+    parser.add_argument("--nan-rate", type=float, default=0.0, help="share of node rows with a missing feature")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cols = get_cols()
+    rng = np.random.default_rng(args.seed)
+    start = pd.Timestamp(args.start, tz="UTC") if args.start else pd.Timestamp.now(tz="UTC").floor(args.freq)
+    # temporary files outside the rack directories, where they would be taken for node files
+    tmp_dir = os.path.join(args.out, ".tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    for rack in args.racks:
+        os.makedirs(os.path.join(args.out, str(rack)), exist_ok=True)
+
+    for step in range(args.steps):
+        ts = start + step * pd.Timedelta(args.freq)
+        for rack in args.racks:
+            for node in range(args.nodes):
+                path = os.path.join(args.out, str(rack), f"{node}.parquet")
+                append_row_group(path, make_row_group(ts, cols, rng, args.nan_rate), tmp_dir)
+        logger.info(f"Appended ts={ts} for racks={args.racks} ({step + 1}/{args.steps})")
+        if step + 1 < args.steps:
+            time.sleep(args.every)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import httpx
+
+from metrics import DEADLINE_MISSES, INFERENCE_RETRY_COUNT
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_URL = os.environ.get("INFERENCE_URL", "http://gnn_inference:10000")
+# Concurrent inference requests, also the size of the keep-alive connection pool
+INFERENCE_CONCURRENCY = int(os.environ.get("INFERENCE_CONCURRENCY", 8))
+# Timeout of a single attempt, and total budget of a request including retries (s)
+INFERENCE_TIMEOUT = float(os.environ.get("INFERENCE_TIMEOUT", 10))
+INFERENCE_DEADLINE = float(os.environ.get("INFERENCE_DEADLINE", 30))
+# Retries after a failed attempt, with exponential backoff starting at INFERENCE_BACKOFF (s)
+INFERENCE_RETRIES = int(os.environ.get("INFERENCE_RETRIES", 3))
+INFERENCE_BACKOFF = float(os.environ.get("INFERENCE_BACKOFF", 0.5))
+
+# Worth retrying: the service is restarting, overloaded or timed out upstream
+RETRY_STATUS = {429, 502, 503, 504}
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class InferenceClient:
+    """Async client of the inference service over one keep-alive connection pool.
+
+    At most INFERENCE_CONCURRENCY requests are in flight; each request is
+    retried with exponential backoff and jitter on connection errors,
+    timeouts and retryable statuses until it succeeds or its deadline passes.
+    """
+
+    def __init__(self, base_url=INFERENCE_URL, concurrency=INFERENCE_CONCURRENCY):
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=INFERENCE_TIMEOUT,
+        )
+        self.slots = asyncio.Semaphore(concurrency)
+        self.retries = 0
+        self.deadline_misses = 0
+
+    async def predict(self, rack, fws, graph_payload, deadline=INFERENCE_DEADLINE):
+        """All-horizon prediction of one rack snapshot; graph_payload as built by encode_payload."""
+        kwargs = {"json": graph_payload["json"]} if "json" in graph_payload else {
+            "content": graph_payload["data"],
+            "headers": graph_payload["headers"],
+        }
+        expires = time.monotonic() + deadline
+
+        async with self.slots:
+            for attempt in range(INFERENCE_RETRIES + 1):
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    response = await self.client.post(
+                        f"/predict/{rack}", params={"fws": fws}, timeout=min(INFERENCE_TIMEOUT, remaining), **kwargs
+                    )
+                    if response.status_code not in RETRY_STATUS:
+                        response.raise_for_status()
+                        return response.json()
+                    error = f"HTTP {response.status_code}"
+                except httpx.TransportError as e:  # includes timeouts
+                    error = repr(e)
+
+                if attempt == INFERENCE_RETRIES:
+                    raise RuntimeError(f"rack {rack}: giving up after {attempt + 1} attempts ({error})")
+                backoff = INFERENCE_BACKOFF * 2 ** attempt * (0.5 + random.random())
+                if time.monotonic() + backoff >= expires:
+                    break
+                self.retries += 1
+                INFERENCE_RETRY_COUNT.inc()
+                logger.warning(f"Inference attempt {attempt + 1} for rack {rack} failed ({error}), retrying in {backoff:.2f}s")
+                await asyncio.sleep(backoff)
+
+        self.deadline_misses += 1
+        DEADLINE_MISSES.labels(kind="inference").inc()
+        raise DeadlineExceeded(f"rack {rack}: no response within the {deadline}s deadline")
+
+    def stats(self):
+        return {"retries": self.retries, "deadline_misses": self.deadline_misses}
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_fetch import get_cols, get_node_name, list_rack_files, table_rows
+
+logger = logging.getLogger(__name__)
+
+# "replay" walks common_ts.pickle on the cycle scheduler, "stream" tails new rows under DATA_DIR
+INGEST_MODE = os.environ.get("INGEST_MODE", "replay")
+# Seconds between polls of the rack directories in stream mode
+INGEST_POLL_SECONDS = float(os.environ.get("INGEST_POLL_SECONDS", 5))
+# Incomplete timestamps buffered per node; the oldest are dropped beyond this
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", 16))
+# Per-rack cursors, so a restart resumes where the previous run stopped
+INGEST_CURSOR_DIR = os.environ.get("INGEST_CURSOR_DIR", "/app/storage/ingest")
+
+
+class RackTail:
+    """Incremental reader of one rack's node files.
+
+    Collectors rewrite {node}.parquet with row groups appended, so row groups
+    already read never change. New rows are buffered per node until every
+    node of the rack has a complete (non-null) row for a timestamp, which is
+    then returned as a nodes x features snapshot by every poll until it is
+    acknowledged with ack(), once its predictions are stored. Pending
+    timestamps older than an acknowledged one can no longer be emitted and
+    are dropped. The cursor keeps the newest acknowledged timestamp and, per
+    file, the first row group still holding a pending row, so a restart
+    re-reads exactly the rows not stored yet. Without a saved cursor, reading
+    starts at the current end of every file.
+    """
+
+    def __init__(self, rack, cursor_dir=INGEST_CURSOR_DIR, max_pending=INGEST_MAX_PENDING):
+        self.rack = rack
+        self.path = os.path.join(cursor_dir, f"{rack}.json")
+        self.max_pending = max_pending
+        self.row_groups = {}  # file name -> row groups read
+        self.emitted = None  # ns of the newest acknowledged timestamp
+        self.pending = {}  # node -> {ts ns: (row group, float32 feature row)}
+        self.saved = None
+        self.file_stats = {}  # file name -> (mtime_ns, size) at the last read
+        self.rows_read = 0
+        self.snapshots = 0
+        self.dropped = 0
+        self.fresh = not os.path.exists(self.path)
+        if not self.fresh:
+            with open(self.path) as f:
+                cursor = json.load(f)
+            self.row_groups = cursor["row_groups"]
+            self.emitted = cursor["emitted"]
+            self.saved = cursor
+
+    def cursor(self):
+        row_groups = {}
+        for name, read in self.row_groups.items():
+            buffer = self.pending.get(get_node_name(name), {})
+            row_groups[name] = min((row_group for row_group, _ in buffer.values()), default=read)
+        return {"row_groups": row_groups, "emitted": self.emitted}
+
+    def save(self):
+        cursor = self.cursor()
+        if cursor == self.saved:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cursor, f)
+        os.replace(tmp_path, self.path)
+        self.saved = cursor
+
+    def poll(self):
+        """Read the row groups appended since the last poll; returns [(ts ns, snapshot)] complete and not yet acknowledged, oldest first."""
+        cols = get_cols()
+        files = list_rack_files(self.rack)
+        for file_path in files:
+            name = os.path.basename(file_path)
+            stat = os.stat(file_path)
+            if self.file_stats.get(name) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            self.file_stats[name] = (stat.st_mtime_ns, stat.st_size)
+
+            pf = pq.ParquetFile(file_path)
+            start = self.row_groups.get(name, pf.num_row_groups if self.fresh else 0)
+            if start > pf.num_row_groups:
+                # replaced by a shorter file; rows up to the emitted timestamp are ignored anyway
+                start = 0
+            if start < pf.num_row_groups:
+                names = set(pf.schema_arrow.names)
+                columns = [c for c in cols if c in names] + ["timestamp"]
+                for i in range(start, pf.num_row_groups):
+                    self.add_rows(get_node_name(file_path), i, pf.read_row_group(i, columns=columns), cols)
+            self.row_groups[name] = pf.num_row_groups
+        self.fresh = False
+
+        self.save()
+        return self.complete([get_node_name(file_path) for file_path in files])
+
+    def add_rows(self, node, row_group, table, cols):
+        x, keep = table_rows(table, cols)
+        ts_ns = table.column("timestamp").cast(pa.timestamp("ns", tz="UTC")).fill_null(0).to_numpy().astype(np.int64)
+        buffer = self.pending.setdefault(node, {})
+        for row, value, complete in zip(x, ts_ns, keep):
+            if complete and (self.emitted is None or value > self.emitted):
+                buffer[int(value)] = (row_group, row)
+        self.rows_read += table.num_rows
+        if len(buffer) > self.max_pending:
+            for value in sorted(buffer)[:len(buffer) - self.max_pending]:
+                del buffer[value]
+                self.dropped += 1
+
+    def complete(self, nodes):
+        if not nodes or any(node not in self.pending for node in nodes):
+            return []
+        ready = set.intersection(*(set(self.pending[node]) for node in nodes))
+        return [(value, np.stack([self.pending[node][value][1] for node in nodes])) for value in sorted(ready)]
+
+    def ack(self, value):
+        """Mark the snapshot at `value` stored: drop it and older pending rows, and save the cursor."""
+        for buffer in self.pending.values():
+            stale = [v for v in buffer if v <= value]
+            self.dropped += sum(v < value for v in stale)
+            for v in stale:
+                del buffer[v]
+        self.emitted = value
+        self.snapshots += 1
+        self.save()
+
+    def stats(self):
+        return {
+            "emitted": str(pd.Timestamp(self.emitted, tz="UTC")) if self.emitted is not None else None,
+            "pending": {str(node): len(buffer) for node, buffer in sorted(self.pending.items()) if buffer},
+            "rows_read": self.rows_read,
+            "snapshots": self.snapshots,
+            "dropped_node_rows": self.dropped,
+        }
+
+
+class StreamIngest:
+    """Polls every rack's RackTail and hands each newly complete snapshot to
+    `await on_snapshot(rack, ts, x, fetch_ms)`, oldest first per rack.
+
+    Polls never overlap; racks are polled concurrently in worker threads and
+    fetch_ms is the poll's read time amortized over its snapshots. A snapshot
+    is acknowledged (and the rack's cursor advanced) only once on_snapshot
+    returns; if it raises, the rack's remaining snapshots wait and the failed
+    one is handed over again at the next poll. Its predictions may thus be
+    written twice after a crash, which the store's (rack, ts, FW) key absorbs.
+    """
+
+    def __init__(self, racks, on_snapshot, interval=INGEST_POLL_SECONDS):
+        self.tails = {rack: RackTail(rack) for rack in racks}
+        self.on_snapshot = on_snapshot
+        self.interval = interval
+        self.task = None
+        self.polls = 0
+        self.errors = 0
+        self.failed_snapshots = 0
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def loop(self):
+        while True:
+            await self.poll_once()
+            await asyncio.sleep(self.interval)
+
+    async def poll_once(self):
+        await asyncio.gather(*(self.poll_rack(rack, tail) for rack, tail in self.tails.items()))
+        self.polls += 1
+
+    async def poll_rack(self, rack, tail):
+        try:
+            start_read = time.perf_counter()
+            snapshots = await asyncio.to_thread(tail.poll)
+            read_time = (time.perf_counter() - start_read) * 1000  # ms
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Ingest poll failed for rack={rack}: {e}")
+            return
+
+        for value, x in snapshots:
+            ts = pd.Timestamp(value, tz="UTC")
+            logger.info(f"Ingested complete snapshot for ts={ts}, rack={rack}")
+            try:
+                await self.on_snapshot(rack, ts, x, read_time / len(snapshots))
+            except Exception as e:
+                self.failed_snapshots += 1
+                logger.error(f"Ingested snapshot ts={ts}, rack={rack} not stored, retrying at the next poll: {e}")
+                return
+            await asyncio.to_thread(tail.ack, value)
+
+    def stats(self):
+        return {
+            "mode": "stream",
+            "poll_interval_s": self.interval,
+            "polls": self.polls,
+            "errors": self.errors,
+            "failed_snapshots": self.failed_snapshots,
+            "racks": {str(rack): tail.stats() for rack, tail in self.tails.items()},
+        }
@@ -1,18 +1,32 @@
 import os
 import pickle
 import logging
-import requests
-from fastapi import FastAPI, HTTPException
+import pandas as pd
+from typing import List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 import time
-from apscheduler.schedulers.background import BackgroundScheduler
-
-from data_fetch import data_fetch
-from data_preprocessing import pre_process
+import hashlib
+import threading
+from fastapi.responses import StreamingResponse
+import asyncio
+
+from pipeline import run_cycle, run_snapshot, pipeline_stats, shutdown_pools
+from inference_client import InferenceClient
+from prediction_store import PredictionStore
+from prediction_index import PredictionIndex, downsample, json_rows
+from overview import build_overview, thresholds_fw
+from events import CycleEvents
+from backfill import BackfillProgress, run_backfill, select_range
+from profiling import CycleProfiler, PROFILE_INTERVAL_MS
+from scheduler import CycleScheduler, prioritize
+from ingest import INGEST_MODE, StreamIngest
+from metrics import observe_stage, register_stats, metrics_response, stage_percentiles
 
 app = FastAPI()
 
 #rack_ids = [0, 2, 8, 9, 10, 11, 12, 14, 15, 16, 17, 18, 22, 24, 25, 26, 28, 29, 30, 32, 33, 34, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48]
 rack_ids = [0,2,8,9,10]
+fw_values = [4, 6, 12, 24, 32, 64, 96, 192, 288]
 
 log_dir = "/app/logs"
 data_dir = "/app/storage"
@@ -35,131 +49,440 @@ with open("common_ts.pickle", "rb") as f:
 
 timestamps = sorted(timestamps)
 
-index = 0  # pointer to next timestamp
+index = 0  # pointer to next timestamp, advanced by the scheduler under state_lock
+
+# Guards index and the overview, which the scheduler and backfill threads both update
+state_lock = threading.Lock()
+
+# Short horizons first, so the most actionable predictions land earliest in a cycle
+fw_groups = prioritize(fw_values)
 
-# File path to store latest predictions persistently
+# Legacy pickle of all predictions, imported once into the prediction store
 PREDICTIONS_PATH = os.path.join(data_dir, "latest_predictions.pickle")
+STORE_PATH = os.path.join(data_dir, "predictions.sqlite")
+
+prediction_store = PredictionStore(STORE_PATH)
+prediction_store.migrate_pickle(PREDICTIONS_PATH)
+
+# Resume after the last stored timestamp instead of replaying from the start
+last_ts = prediction_store.last_timestamp()
+if last_ts is not None:
+    ts_positions = {str(ts): i for i, ts in enumerate(timestamps)}
+    if last_ts in ts_positions:
+        index = ts_positions[last_ts] + 1
+        logger.info(f"Resuming after last stored timestamp {last_ts} (index {index})")
+
+# rack -> fw -> ring buffer of recent scores plus hourly/daily rollups, served by
+# /results without touching the store; memory is bounded by the buffer capacities.
+# Rollups are restored from the store, so only the retention window is replayed
+# (the whole history once, on the first start with an empty rollup table)
+prediction_index = PredictionIndex(thresholds_fw)
+prediction_index.restore(*prediction_store.load_rollups())
+resume_after = prediction_index.resume_after()
+loaded = prediction_index.load(prediction_store.iter_predictions(since=resume_after))
+logger.info(f"Indexed {loaded} stored predictions after {resume_after or 'the beginning'}")
+
+# Serializes rollup flushes, so an older flush never overwrites a newer one
+rollup_lock = threading.Lock()
+
+def persist_rollups():
+    with rollup_lock:
+        prediction_index.rebuild_rollups(prediction_store.series_rows)
+        prediction_store.save_rollups(*prediction_index.dirty_rollups())
+
+persist_rollups()
 
-# Try to load previous predictions from disk
-if os.path.exists(PREDICTIONS_PATH):
-    with open(PREDICTIONS_PATH, "rb") as f:
-        latest_predictions = pickle.load(f)
-    logger.info(f"Loaded existing latest_predictions from {PREDICTIONS_PATH}")
-else:
-    latest_predictions = {}
+# Racks x FWs anomaly counts, rebuilt once per cycle and served as-is by /overview
+overview_body, overview_etag = build_overview(prediction_index, rack_ids, fw_values)
 
-def save_predictions():
+# "cycle completed" notifications for /events, starting from the last stored cycle
+cycle_events = CycleEvents(last_ts)
+
+# Timings of the latest scored snapshot per rack: rack -> {"timestamp": ts, "timings": {fw: dict of timings}}
+latest_timings = {}
+
+# Stack sampling of the next N cycles, armed through POST /admin/profile
+cycle_profiler = CycleProfiler()
+
+# Keep-alive connection pool to the inference service, opened at startup
+inference_client = None
+
+async def infer_rack(ts, rack, fws, graph_payload, fetch_time, preprocess_time, serialize_time):
     try:
-        with open(PREDICTIONS_PATH, "wb") as f:
-            pickle.dump(latest_predictions, f)
-        logger.info("✅ Saved latest_predictions to disk.")
+        # --- Inference Timing ---
+        start_inference = time.perf_counter()
+        result = await inference_client.predict(rack, fws, graph_payload)
+        request_time = (time.perf_counter() - start_inference) * 1000  # ms
     except Exception as e:
-        logger.error(f"Failed to save latest_predictions: {e}")
+        logger.error(f"Inference error for ts={ts}, rack={rack}: {e}")
+        raise
+    observe_stage("http", rack, request_time)
+
+    # Store prediction and timings per future window
+    rows = []
+    ts_key = str(ts)
+    rack_timings = latest_timings.get(rack)
+    # the latest cycle wins even when its timestamp is older (the replay wraps around);
+    # FW groups of the same snapshot merge into one entry
+    if rack_timings is None or rack_timings["timestamp"] != ts_key:
+        rack_timings = {"timestamp": ts_key, "timings": {}}
+        latest_timings[rack] = rack_timings
+    for fw in fws:
+        prediction = result["predictions"].get(str(fw))
+        if prediction is None:
+            logger.error(f"Inference error for ts={ts}, fw={fw}, rack={rack}: missing from response")
+            continue
+
+        rows.append((ts, rack, fw, prediction))
+        observe_stage("inference", rack, result["timings"][str(fw)], fw)
+        rack_timings["timings"][fw] = {
+            "FW": fw,
+            "Data Fetch (ms)": round(fetch_time),
+            "Preprocessing (ms)": round(preprocess_time),
+            "Inference (ms)": round(result["timings"][str(fw)]),
+            "Request (ms)": round(request_time)
+        }
+
+    # SQLite commits block, keep them off the event loop
+    await asyncio.to_thread(prediction_store.append, rows)
+    for row in rows:
+        prediction_index.insert(*row)
+    logger.info(f"Prediction successful for ts={ts}, rack={rack}, fws={fws}")
+
+def refresh_overview():
+    global overview_body, overview_etag
+    with state_lock:
+        overview_body, overview_etag = build_overview(prediction_index, rack_ids, fw_values)
+
+async def run_scheduled_prediction(deadline=None):
+    global index
+    with state_lock:
+        if index >= len(timestamps):
+            logger.info("✅ All timestamps processed, resetting index to 0")
+            index = 0
+        ts = timestamps[index]
+    logger.info(f"Processing telemetry data for timestamp: {ts}")
+
+    sampler = cycle_profiler.begin()
+    summary = await run_cycle(ts, rack_ids, fw_groups, infer_rack, cycle_profiler if sampler is not None else None, deadline)
+    cycle_profiler.end(sampler)
+    refresh_overview()
+    await asyncio.to_thread(persist_rollups)
+    cycle_events.publish(ts)
 
-# This dict can be exposed via an API or returned somehow
-latest_timings = {}  # key: f"{ts}|{fw}|{rack}", value: dict of timings
+    with state_lock:
+        index += 1
+    return summary
 
-def run_scheduled_prediction():
+def skip_timestamps(count):
+    """Drop the next `count` timestamps of a scheduler that fell behind."""
     global index
-    if index >= len(timestamps):
-        logger.info("✅ All timestamps processed, resetting index to 0")
-        index = 0
+    with state_lock:
+        first = timestamps[index % len(timestamps)]
+        last = timestamps[(index + count - 1) % len(timestamps)]
+        index = (index + count) % len(timestamps)
+    return {"timestamps": count, "first": str(first), "last": str(last)}
 
-    ts = timestamps[index]
-    logger.info(f"Processing telemetry data for timestamp: {ts}")
+async def on_ingested_snapshot(rack, ts, x, fetch_time):
+    await run_snapshot(ts, rack, x, fw_groups, infer_rack, fetch_time)
+    refresh_overview()
+    await asyncio.to_thread(persist_rollups)
+    cycle_events.publish(ts, rack=rack)
+
+# One cycle per 15-minute slot on the server's event loop, never overlapping;
+# read endpoints stay on the threadpool
+cycle_scheduler = CycleScheduler(run_scheduled_prediction, skip_timestamps)
 
-    for rack in rack_ids:
-        try:
-            # --- Data Fetch Timing ---
-            start_fetch = time.perf_counter()
-            fetched_df = data_fetch(rack, ts)
-            fetch_time = (time.perf_counter() - start_fetch) * 1000  # ms
-
-            # --- Preprocessing Timing ---
-            start_preprocess = time.perf_counter()
-            graph_payload = pre_process(fetched_df)
-            preprocess_time = (time.perf_counter() - start_preprocess) * 1000  # ms
-
-            for fw in [4, 6, 12, 24, 32, 64, 96, 192, 288]:
-                try:
-                    # --- Inference Timing ---
-                    start_inference = time.perf_counter()
-                    url = f"http://gnn_inference:10000/predict/{fw}/{rack}"
-                    response = requests.post(url, json=graph_payload, timeout=10)
-                    response.raise_for_status()
-                    inference_time = (time.perf_counter() - start_inference) * 1000  # ms
-
-                    # Store prediction and timings
-                    prediction = response.json()
-                    key = f"{ts}|{fw}|{rack}"
-                    latest_predictions[key] = prediction
-
-                    latest_timings[key] = {
-                        "FW": fw,
-                        "Data Fetch (ms)": round(fetch_time),
-                        "Preprocessing (ms)": round(preprocess_time),
-                        "Inference (ms)": round(inference_time)
-                    }
-
-                    logger.info(f"Prediction successful for ts={ts}, fw={fw}, rack={rack}")
-
-                except Exception as e:
-                    logger.error(f"Inference error for ts={ts}, fw={fw}, rack={rack}: {e}")
-
-        except Exception as e:
-            logger.error(f"Error during prediction for ts={ts}, rack={rack}: {e}")
-
-    save_predictions()
-    index += 1
+# In stream mode new telemetry rows drive inference instead of the scheduler
+stream_ingest = StreamIngest(rack_ids, on_ingested_snapshot) if INGEST_MODE == "stream" else None
 
 @app.on_event("startup")
-def start_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(run_scheduled_prediction, "interval", minutes=15)
-    scheduler.start()
-    logger.info("Scheduler started — running prediction every 15 minute")
+async def start_scheduler():
+    global inference_client
+    inference_client = InferenceClient()
+    if stream_ingest is not None:
+        stream_ingest.start()
+        logger.info(f"Stream ingest started — polling {len(rack_ids)} racks every {stream_ingest.interval:g} s")
+        return
+    cycle_scheduler.start()
+    logger.info(f"Scheduler started — running prediction every {cycle_scheduler.interval / 60:g} minutes ({cycle_scheduler.policy} when behind)")
+
+@app.on_event("shutdown")
+async def stop_pipeline():
+    if stream_ingest is not None:
+        await stream_ingest.stop()
+    await cycle_scheduler.stop()
+    persist_rollups()
+    shutdown_pools()
+    if inference_client is not None:
+        await inference_client.aclose()
+
+@app.get("/pipeline/stats")
+def get_pipeline_stats():
+    stats = pipeline_stats()
+    if inference_client is not None:
+        stats["inference_client"] = inference_client.stats()
+    stats["prediction_index"] = prediction_index.stats()
+    stats["scheduler"] = cycle_scheduler.stats()
+    stats["ingest"] = stream_ingest.stats() if stream_ingest is not None else {"mode": INGEST_MODE}
+    return stats
+
+# Stats dicts also exported as gauges on /metrics, read at scrape time
+register_stats("backend_pipeline", get_pipeline_stats)
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: stage and cycle histograms, deadline misses, pipeline and index gauges, process RSS."""
+    return metrics_response()
+
+
+@app.post("/admin/profile", status_code=202)
+def start_profile(cycles: int = Query(1, ge=1, le=96), interval_ms: float = Query(PROFILE_INTERVAL_MS, gt=0)):
+    """Sample the stacks of the next `cycles` cycles into a collapsed-stack file under /app/logs/profiles."""
+    try:
+        cycle_profiler.arm(cycles, interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return cycle_profiler.status()
+
+@app.get("/admin/profile")
+def get_profile_status():
+    return cycle_profiler.status()
+
 
+backfill_progress = BackfillProgress()
+backfill_thread = None
+
+def run_backfill_job(range_timestamps, racks, fws):
+    def index_rows(rows):
+        for row in rows:
+            prediction_index.insert(*row)
+        persist_rollups()
+    try:
+        run_backfill(prediction_store, range_timestamps, racks, fws, on_rows=index_rows, progress=backfill_progress)
+    except Exception as e:
+        logger.error(f"Backfill failed: {e}")
+        backfill_progress.finish()
+    refresh_overview()
+
+@app.post("/backfill", status_code=202)
+def start_backfill(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    racks: Optional[List[int]] = Query(None),
+    fws: Optional[List[int]] = Query(None),
+):
+    """Score [start, end] of common_ts in the background; progress at GET /backfill."""
+    global backfill_progress, backfill_thread
+    if backfill_thread is not None and backfill_thread.is_alive():
+        raise HTTPException(status_code=409, detail="A backfill is already running")
+
+    try:
+        range_timestamps = select_range(timestamps, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid range: {e}")
+
+    backfill_progress = BackfillProgress()
+    backfill_thread = threading.Thread(
+        target=run_backfill_job,
+        args=(range_timestamps, racks or rack_ids, fws or fw_values),
+        name="backfill",
+        daemon=True,
+    )
+    backfill_thread.start()
+    return {"timestamps": len(range_timestamps), "racks": racks or rack_ids, "fws": fws or fw_values}
+
+@app.get("/backfill")
+def get_backfill_progress():
+    return backfill_progress.snapshot()
+
+@app.get("/events")
+def get_events(request: Request):
+    """Server-Sent Events stream with one "cycle" event per completed scheduler cycle."""
+    last_event_id = request.headers.get("last-event-id")
+    return StreamingResponse(
+        cycle_events.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def not_modified(request, etag):
+    """304 response when the client already has this ETag, for clients polling instead of streaming."""
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+def make_etag(*parts):
+    return '"' + hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:20] + '"'
+
+@app.get("/overview")
+def get_overview(request: Request):
+    cached = not_modified(request, overview_etag)
+    if cached is not None:
+        return cached
+    return Response(content=overview_body, media_type="application/json", headers={"ETag": overview_etag})
+
+def to_ts_key(value, name):
+    """Query timestamp -> the str(pd.Timestamp) key format of stored predictions (UTC)."""
+    if value is None:
+        return None
+    try:
+        ts = pd.Timestamp(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} timestamp {value!r}")
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    return str(ts)
 
 @app.get("/results/{rack}")
-def get_latest_predictions(rack: int):
-    rack_predictions = []
-    for key, pred in latest_predictions.items():
-        ts, fw_str, rack_str = key.split("|")
-        fw = int(fw_str)
-        r = int(rack_str)
-        if r == rack:
-            rack_predictions.append({"timestamp": ts, "fw": fw, "prediction": pred})
-
-    if not rack_predictions:
+def get_latest_predictions(
+    request: Request,
+    response: Response,
+    rack: int,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    fw: Optional[List[int]] = Query(None),
+    latest_only: bool = False,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+):
+    if rack not in prediction_index:
         raise HTTPException(status_code=404, detail=f"No predictions found for rack {rack}")
 
-    rack_predictions.sort(key=lambda x: (x["timestamp"], x["fw"]))
+    etag = make_etag(rack, prediction_index.version(rack), request.url.query)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers["ETag"] = etag
+
+    rack_predictions, total = prediction_index.query(
+        rack,
+        since=to_ts_key(since, "since"),
+        until=to_ts_key(until, "until"),
+        fws=set(fw) if fw else None,
+        latest_only=latest_only,
+        limit=limit,
+        offset=offset,
+    )
+
+    return {"rack": rack, "predictions": rack_predictions, "total": total, "offset": offset, "limit": limit}
+
+@app.get("/results/{rack}/matrix")
+def get_prediction_matrix(
+    request: Request,
+    response: Response,
+    rack: int,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    fw: Optional[List[int]] = Query(None),
+    max_points: Optional[int] = Query(None, ge=1),
+    agg: Literal["min", "max", "mean"] = "mean",
+):
+    """Columnar nodes x time score matrix per FW, downsampled to max_points time buckets."""
+    if rack not in prediction_index:
+        raise HTTPException(status_code=404, detail=f"No predictions found for rack {rack}")
+
+    etag = make_etag(rack, prediction_index.version(rack), request.url.query)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers["ETag"] = etag
+
+    num_nodes = 0
+    fws = {}
+    series = prediction_index.matrix(rack, to_ts_key(since, "since"), to_ts_key(until, "until"), set(fw) if fw else None)
+    for fw_value, (timestamps, scores) in series.items():
+        num_nodes = max(num_nodes, scores.shape[1])
+        bucket_timestamps, bucket_scores = downsample(timestamps, scores, max_points, agg)
+        fws[str(fw_value)] = {
+            "timestamps": bucket_timestamps,
+            "scores": json_rows(bucket_scores.T),  # nodes x time
+            "latest_timestamp": timestamps[-1],
+            "latest": json_rows(scores[-1]),
+        }
+
+    return {
+        "rack": rack,
+        "nodes": [f"{i:02d}" for i in range(num_nodes)],
+        "agg": agg,
+        "max_points": max_points,
+        "fws": fws,
+    }
+
+@app.get("/results/{rack}/rollups")
+def get_prediction_rollups(
+    request: Request,
+    response: Response,
+    rack: int,
+    resolution: Literal["hourly", "daily"] = "hourly",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    fw: Optional[List[int]] = Query(None),
+):
+    """Per-node max score and anomaly count per hourly or daily bucket, beyond the raw retention horizon."""
+    if rack not in prediction_index:
+        raise HTTPException(status_code=404, detail=f"No predictions found for rack {rack}")
 
-    return {"rack": rack, "predictions": rack_predictions}
+    etag = make_etag(rack, prediction_index.version(rack), request.url.query)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers["ETag"] = etag
+
+    num_nodes = 0
+    fws = {}
+    series = prediction_index.rollup(rack, resolution, to_ts_key(since, "since"), to_ts_key(until, "until"), set(fw) if fw else None)
+    for fw_value, (buckets, maxes, anomalies, snapshots) in series.items():
+        num_nodes = max(num_nodes, maxes.shape[1])
+        fws[str(fw_value)] = {
+            "timestamps": buckets,
+            "max": json_rows(maxes.T),  # nodes x buckets
+            "anomalies": anomalies.T.tolist(),
+            "snapshots": snapshots.tolist(),
+        }
+
+    return {
+        "rack": rack,
+        "resolution": resolution,
+        "thresholds": {str(fw_value): thresholds_fw[fw_value] for fw_value in series},
+        "nodes": [f"{i:02d}" for i in range(num_nodes)],
+        "fws": fws,
+    }
 
 @app.get("/timings/{rack}/latest")
-def get_latest_timings_for_rack(rack: int):
-    # Filter timings for the rack
-    rack_timings = []
-    for key, timing in latest_timings.items():
-        ts, fw_str, rack_str = key.split("|")
-        if int(rack_str) == rack:
-            rack_timings.append((ts, timing, int(fw_str)))
-
-    if not rack_timings:
+def get_latest_timings_for_rack(request: Request, response: Response, rack: int):
+    rack_timings = latest_timings.get(rack)
+    if rack_timings is None:
         raise HTTPException(status_code=404, detail=f"No timing data found for rack {rack}")
 
-    # Find the latest timestamp
-    latest_ts = max(ts for ts, _, _ in rack_timings)
-
-    # Return timings only for the latest timestamp
-    latest_data = []
-    for ts, timing, fw in rack_timings:
-        if ts == latest_ts:
-            entry = {"FW": fw, **timing, "timestamp": ts}
-            latest_data.append(entry)
+    latest_ts = rack_timings["timestamp"]
+    etag = make_etag(rack, latest_ts, sorted(rack_timings["timings"]))
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    response.headers["ETag"] = etag
 
     # Sort by FW for consistent chart ordering
-    latest_data.sort(key=lambda x: x["FW"])
+    latest_data = [
+        {**timing, "timestamp": latest_ts}
+        for _, timing in sorted(rack_timings["timings"].items())
+    ]
 
-    return {"rack": rack, "timestamp": latest_ts, "timings": latest_data}
\ No newline at end of file
+    return {"rack": rack, "timestamp": latest_ts, "timings": latest_data}
+
+@app.get("/timings/{rack}/percentiles")
+def get_timing_percentiles(rack: int):
+    """p50/p90/p99 per stage and FW from the stage histograms since startup (bucket-interpolated)."""
+    percentiles = stage_percentiles(rack)
+    if not percentiles:
+        raise HTTPException(status_code=404, detail=f"No timing data found for rack {rack}")
+
+    rows = [
+        {
+            "Stage": stage,
+            "FW": fw,
+            "count": count,
+            **{f"p{round(q * 100)} (ms)": round(v * 1000, 3) if v is not None else None for q, v in quantiles.items()},
+        }
+        for (stage, fw), (count, quantiles) in sorted(percentiles.items(), key=lambda item: (item[0][0], item[0][1] != "all", item[0][1].zfill(4)))
+    ]
+    return {"rack": rack, "timings": rows}
@@ -0,0 +1,100 @@
+import math
+from prometheus_client import Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from fastapi import Response
+
+# Bucket upper bounds (s): stage latencies span sub-millisecond preprocessing
+# to multi-second inference under load, cycles run up to the 15 min interval
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CYCLE_BUCKETS = (1, 2.5, 5, 10, 30, 60, 120, 300, 600, 900, 1800)
+
+# Stages per rack snapshot: fetch, preprocess, serialize and http are shared by
+# all FWs of a request (fw="all"), inference is the service's per-FW forward time
+STAGE_SECONDS = Histogram(
+    "backend_stage_seconds", "Latency of one prediction pipeline stage", ["stage", "rack", "fw"], buckets=LATENCY_BUCKETS
+)
+CYCLE_SECONDS = Histogram("backend_cycle_seconds", "Duration of a scheduled prediction cycle", buckets=CYCLE_BUCKETS)
+DEADLINE_MISSES = Counter(
+    "backend_deadline_misses", "Inference requests past their deadline and cycles past the schedule interval", ["kind"]
+)
+INFERENCE_RETRY_COUNT = Counter("backend_inference_retries", "Inference request attempts retried after a failure")
+# Deadline minus finish time of each cycle (s), negative when it overran its slot
+CYCLE_SLACK_SECONDS = Histogram(
+    "backend_cycle_slack_seconds", "Time left before the deadline when a cycle finished",
+    buckets=(-600, -300, -60, -10, 0, 10, 60, 300, 600, 900),
+)
+SKIPPED_WORK = Counter("backend_skipped_work", "Scheduler slots skipped when behind, and FWs dropped past a cycle deadline", ["kind"])
+
+
+def observe_stage(stage, rack, ms, fw="all"):
+    STAGE_SECONDS.labels(stage=stage, rack=str(rack), fw=str(fw)).observe(ms / 1000)
+
+
+class StatsCollector:
+    """Exposes the numeric leaves of a stats() dict as gauges at scrape time.
+
+    {"stages": {"fetch": {"in_flight": 1}}} becomes <prefix>_stages_fetch_in_flight;
+    booleans, strings and None are skipped.
+    """
+
+    def __init__(self, prefix, stats):
+        self.prefix = prefix
+        self.stats = stats
+
+    def collect(self):
+        for name, value in flatten(self.prefix, self.stats()):
+            yield GaugeMetricFamily(name, f"{name} from the service's stats", value=value)
+
+
+def flatten(prefix, stats):
+    for key, value in stats.items():
+        name = f"{prefix}_{key}".replace("+", "_").replace("-", "_").replace(" ", "_")
+        if isinstance(value, dict):
+            yield from flatten(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def register_stats(prefix, stats):
+    REGISTRY.register(StatsCollector(prefix, stats))
+
+
+def metrics_response():
+    """Prometheus text exposition of every metric, including process RSS and CPU."""
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+def histogram_quantile(q, buckets):
+    """Quantile estimate from cumulative (upper bound, count) buckets, as Prometheus' histogram_quantile.
+
+    Interpolates linearly within the bucket holding the q-th observation;
+    falls back to the largest finite bound when it lands in +Inf.
+    """
+    total = buckets[-1][1]
+    if not total:
+        return None
+    rank = q * total
+    lower, below = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if math.isinf(bound):
+                return lower
+            return lower + (bound - lower) * (rank - below) / (count - below) if count > below else lower
+        lower, below = bound, count
+    return lower
+
+
+def stage_percentiles(rack, quantiles=(0.5, 0.9, 0.99)):
+    """{(stage, fw): (observation count, {q: seconds})} of a rack's stage histograms."""
+    buckets = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_bucket") and sample.labels["rack"] == str(rack):
+                key = (sample.labels["stage"], sample.labels["fw"])
+                buckets.setdefault(key, []).append((float(sample.labels["le"]), sample.value))
+
+    result = {}
+    for key, series in buckets.items():
+        series.sort()
+        result[key] = (int(series[-1][1]), {q: histogram_quantile(q, series) for q in quantiles})
+    return result
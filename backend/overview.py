@@ -0,0 +1,47 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# Anomaly thresholds per future window; override with a JSON object such as
+# ANOMALY_THRESHOLDS='{"4": 0.15}' to change individual FWs
+thresholds_fw = {
+    4: 0.133077,
+    6: 0.111795,
+    12: 0.078974,
+    24: 0.060513,
+    32: 0.067949,
+    64: 0.061026,
+    96: 0.068462,
+    192: 0.068205,
+    288: 0.074615,
+}
+thresholds_fw.update({int(fw): float(t) for fw, t in json.loads(os.environ.get("ANOMALY_THRESHOLDS", "{}")).items()})
+
+
+def build_overview(prediction_index, rack_ids, fw_values):
+    """Racks x FWs count of nodes above threshold in each (rack, FW)'s latest prediction.
+
+    Returns the serialized response body and its ETag, which only changes with the content.
+    """
+    counts = np.zeros((len(rack_ids), len(fw_values)), dtype=int)
+    rack_timestamps = []
+    for rack_idx, rack in enumerate(rack_ids):
+        latest, _ = prediction_index.query(rack, fws=set(fw_values), latest_only=True)
+        for pred in latest:
+            scores = np.asarray(pred["prediction"]["prediction"])
+            counts[rack_idx, fw_values.index(pred["fw"])] = int((scores > thresholds_fw[pred["fw"]]).sum())
+        rack_timestamps.append(max((pred["timestamp"] for pred in latest), default=None))
+
+    valid_timestamps = [ts for ts in rack_timestamps if ts is not None]
+    overview = {
+        "timestamp": max(valid_timestamps) if valid_timestamps else None,
+        "racks": list(rack_ids),
+        "fws": list(fw_values),
+        "thresholds": {str(fw): thresholds_fw[fw] for fw in fw_values},
+        "rack_timestamps": rack_timestamps,
+        "counts": counts.tolist(),
+    }
+    body = json.dumps(overview, sort_keys=True).encode()
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    return body, etag
@@ -0,0 +1,304 @@
+import os
+import time
+import asyncio
+import logging
+import requests
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from data_fetch import fetch_array, data_fetch_range
+from data_preprocessing import pre_process, scale_array, encode_payload
+from inference_client import INFERENCE_URL, INFERENCE_CONCURRENCY
+from metrics import CYCLE_SECONDS, observe_stage
+from profiling import sample_call
+
+logger = logging.getLogger(__name__)
+
+# Concurrency limits of the staged prediction pipeline; scheduled cycles send
+# inference requests from the event loop (INFERENCE_CONCURRENCY), backfills
+# from INFERENCE_WORKERS threads
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", os.cpu_count() or 1))
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 8))
+MAX_RACKS_IN_FLIGHT = int(os.environ.get("MAX_RACKS_IN_FLIGHT", 2 * FETCH_WORKERS))
+
+# Request body format sent to the inference service: "npy" (binary) or "json"
+WIRE_FORMAT = os.environ.get("WIRE_FORMAT", "npy")
+
+
+class StageStats:
+    """Queue depth and throughput counters of one pipeline stage."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.in_flight = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def queued(self):
+        # work submitted beyond the worker count is waiting in the executor queue
+        return max(self.in_flight - self.workers, 0)
+
+    def submitted(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_queued = max(self.max_queued, self.queued())
+
+    def finished(self, ok=True):
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def reset(self):
+        with self._lock:
+            self.max_queued = 0
+            self.completed = 0
+            self.failed = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queued": self.queued(),
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+fetch_stats = StageStats("fetch+preprocess", FETCH_WORKERS)
+inference_stats = StageStats("inference", INFERENCE_CONCURRENCY)
+last_cycle = {}
+
+_fetch_pool = None
+_inference_pool = None
+_pool_lock = threading.Lock()
+fetch_pool_restarts = 0
+_session = requests.Session()
+
+
+def new_fetch_pool():
+    # spawn: the scheduler process is multi-threaded, forking it is unsafe
+    return ProcessPoolExecutor(max_workers=FETCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def get_pools():
+    global _fetch_pool, _inference_pool
+    with _pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = new_fetch_pool()
+            _inference_pool = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+        return _fetch_pool, _inference_pool
+
+def replace_fetch_pool(broken):
+    """Swap a fetch pool broken by a dead worker (OOM kill, crash in a native
+    reader) for a new one and return it; racing callers get the same new pool.
+    """
+    global _fetch_pool, fetch_pool_restarts
+    with _pool_lock:
+        if _fetch_pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _fetch_pool = new_fetch_pool()
+            fetch_pool_restarts += 1
+            logger.warning(f"Fetch worker died, replaced the fetch pool (restart {fetch_pool_restarts})")
+        return _fetch_pool
+
+def submit_fetch(fn, *args):
+    """(pool, pool.submit(fn, *args)) in the fetch pool, replaced first if it is already broken."""
+    pool, _ = get_pools()
+    try:
+        return pool, pool.submit(fn, *args)
+    except BrokenProcessPool:
+        pool = replace_fetch_pool(pool)
+        return pool, pool.submit(fn, *args)
+
+async def run_fetch(fn, *args):
+    """await fn(*args) in the fetch pool; when its worker dies, retried once in a new pool."""
+    pool, future = submit_fetch(fn, *args)
+    try:
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        replace_fetch_pool(pool)
+        _, future = submit_fetch(fn, *args)
+        return await asyncio.wrap_future(future)
+
+def shutdown_pools():
+    global _fetch_pool, _inference_pool
+    with _pool_lock:
+        if _fetch_pool is not None:
+            _fetch_pool.shutdown(cancel_futures=True)
+            _inference_pool.shutdown(cancel_futures=True)
+            _fetch_pool = _inference_pool = None
+
+def fetch_and_preprocess(rack, ts):
+    # --- Data Fetch Timing ---
+    start_fetch = time.perf_counter()
+    x = fetch_array(rack, ts)
+    fetch_time = (time.perf_counter() - start_fetch) * 1000  # ms
+
+    # --- Preprocessing Timing ---
+    start_preprocess = time.perf_counter()
+    scale_array(x, rack)
+    preprocess_time = (time.perf_counter() - start_preprocess) * 1000  # ms
+
+    # --- Serialization Timing ---
+    start_serialize = time.perf_counter()
+    graph_payload = encode_payload(x, WIRE_FORMAT)
+    serialize_time = (time.perf_counter() - start_serialize) * 1000  # ms
+
+    return graph_payload, fetch_time, preprocess_time, serialize_time
+
+def fetch_and_preprocess_range(rack, timestamps):
+    """fetch_and_preprocess over a batch of timestamps with one bulk read.
+
+    Returns [(ts, graph_payload, fetch_ms, preprocess_ms)], with graph_payload
+    None for timestamps whose data could not be preprocessed. The fetch time
+    is the bulk read amortized over the batch.
+    """
+    start_fetch = time.perf_counter()
+    frames = list(data_fetch_range(rack, timestamps))
+    fetch_time = (time.perf_counter() - start_fetch) * 1000 / max(len(frames), 1)  # ms
+
+    results = []
+    for ts, fetched_df in frames:
+        start_preprocess = time.perf_counter()
+        try:
+            graph_payload = pre_process(fetched_df, WIRE_FORMAT, rack)
+        except Exception as e:
+            logger.error(f"Preprocessing error for ts={ts}, rack={rack}: {e}")
+            graph_payload = None
+        preprocess_time = (time.perf_counter() - start_preprocess) * 1000  # ms
+        results.append((ts, graph_payload, fetch_time, preprocess_time))
+    return results
+
+def request_inference(rack, fws, graph_payload, timeout=10):
+    """POST one rack snapshot to the inference service for all horizons (blocking, for worker threads)."""
+    response = _session.post(f"{INFERENCE_URL}/predict/{rack}", params={"fws": fws}, timeout=timeout, **graph_payload)
+    response.raise_for_status()
+    return response.json()
+
+def pipeline_stats():
+    return {
+        "stages": {stats.name: stats.snapshot() for stats in (fetch_stats, inference_stats)},
+        "max_racks_in_flight": MAX_RACKS_IN_FLIGHT,
+        "fetch_pool_restarts": fetch_pool_restarts,
+        "last_cycle": last_cycle,
+    }
+
+async def run_snapshot(ts, rack, x, fw_groups, infer, fetch_time=0.0):
+    """Preprocess and infer one already-read rack snapshot (stream ingest), horizon groups in order.
+
+    Unlike run_cycle, a failed group stops the snapshot and re-raises, so the
+    ingest keeps the snapshot queued instead of losing it.
+    """
+    # --- Preprocessing Timing ---
+    start_preprocess = time.perf_counter()
+    scale_array(x, rack)
+    preprocess_time = (time.perf_counter() - start_preprocess) * 1000  # ms
+
+    # --- Serialization Timing ---
+    start_serialize = time.perf_counter()
+    graph_payload = encode_payload(x, WIRE_FORMAT)
+    serialize_time = (time.perf_counter() - start_serialize) * 1000  # ms
+
+    for stage, ms in zip(("fetch", "preprocess", "serialize"), (fetch_time, preprocess_time, serialize_time)):
+        observe_stage(stage, rack, ms)
+    for fws in fw_groups:
+        inference_stats.submitted()
+        try:
+            await infer(ts, rack, fws, graph_payload, fetch_time, preprocess_time, serialize_time)
+        except Exception:
+            inference_stats.finished(ok=False)
+            raise
+        inference_stats.finished()
+
+async def run_cycle(ts, racks, fw_groups, infer, profiler=None, deadline=None):
+    """Run fetch+preprocess and inference for all racks of one timestamp.
+
+    Fetch+preprocess runs in a process pool while inference requests are
+    coroutines on the event loop, so rack N+1 is being fetched while rack N
+    is inferred. Horizons are inferred in the order of `fw_groups`: every
+    rack's first group (the most actionable, short horizons) completes
+    before any later group starts, reusing the fetched payloads. Groups not
+    yet started when `deadline` (time.monotonic()) passes are skipped.
+
+    `await infer(ts, rack, fws, graph_payload, fetch_time, preprocess_time,
+    serialize_time)` is called once per rack and group and is expected to
+    log its own errors; raising only marks the request as failed in the
+    stage counters. At most MAX_RACKS_IN_FLIGHT racks are between fetch
+    submission and the end of their inference at any time. With an armed
+    CycleProfiler, fetch workers sample their own stacks and hand them to
+    `profiler`. Returns the cycle summary, also kept in last_cycle.
+    """
+    rack_slots = asyncio.Semaphore(MAX_RACKS_IN_FLIGHT)
+    fetch_stats.reset()
+    inference_stats.reset()
+    start_cycle = time.perf_counter()
+    fetched = {}  # rack -> (graph_payload, fetch_time, preprocess_time, serialize_time)
+
+    async def infer_group(rack, fws):
+        inference_stats.submitted()
+        try:
+            await infer(ts, rack, fws, *fetched[rack])
+        except Exception:
+            inference_stats.finished(ok=False)
+        else:
+            inference_stats.finished()
+
+    async def process_rack(rack):
+        async with rack_slots:
+            fetch_stats.submitted()
+            try:
+                if profiler is None:
+                    result = await run_fetch(fetch_and_preprocess, rack, ts)
+                else:
+                    result, stacks = await run_fetch(sample_call, profiler.interval_ms, fetch_and_preprocess, rack, ts)
+                    profiler.add(stacks, "fetch_worker")
+            except Exception as e:
+                fetch_stats.finished(ok=False)
+                logger.error(f"Error during prediction for ts={ts}, rack={rack}: {e}")
+                return
+            fetch_stats.finished()
+            for stage, ms in zip(("fetch", "preprocess", "serialize"), result[1:]):
+                observe_stage(stage, rack, ms)
+
+            fetched[rack] = result
+            await infer_group(rack, fw_groups[0])
+
+    await asyncio.gather(*(process_rack(rack) for rack in racks))
+
+    skipped_fws = []
+    for fws in fw_groups[1:]:
+        if deadline is not None and time.monotonic() >= deadline:
+            skipped_fws.extend(fws)
+            continue
+        async def process_group(rack, fws=fws):
+            async with rack_slots:
+                await infer_group(rack, fws)
+        await asyncio.gather(*(process_group(rack) for rack in fetched))
+
+    duration = time.perf_counter() - start_cycle
+    CYCLE_SECONDS.observe(duration)
+    last_cycle.clear()
+    last_cycle.update({
+        "timestamp": str(ts),
+        "racks": len(racks),
+        "duration_s": round(duration, 3),
+        "fetch_max_queued": fetch_stats.max_queued,
+        "inference_max_queued": inference_stats.max_queued,
+        "skipped_fws": skipped_fws,
+    })
+    logger.info(
+        f"Cycle for ts={ts} finished in {last_cycle['duration_s']}s | "
+        f"fetch+preprocess max queued={fetch_stats.max_queued}, failed={fetch_stats.failed} | "
+        f"inference max queued={inference_stats.max_queued}, failed={inference_stats.failed}"
+        + (f" | past deadline, skipped fws={skipped_fws}" if skipped_fws else "")
+    )
+    return dict(last_cycle)
@@ -0,0 +1,516 @@
+import os
+import heapq
+import threading
+import numpy as np
+import pandas as pd
+from itertools import islice
+
+# Raw predictions kept per (rack, FW): at most PREDICTION_WINDOW snapshots and none
+# older than PREDICTION_RETENTION_HOURS before the newest (2016 x 15 min = 21 days)
+PREDICTION_WINDOW = int(os.environ.get("PREDICTION_WINDOW", 2016))
+PREDICTION_RETENTION_HOURS = float(os.environ.get("PREDICTION_RETENTION_HOURS", 21 * 24))
+# Buckets kept per (rack, FW) of the hourly and daily rollups of evicted predictions
+ROLLUP_HOURLY_WINDOW = int(os.environ.get("ROLLUP_HOURLY_WINDOW", 30 * 24))
+ROLLUP_DAILY_WINDOW = int(os.environ.get("ROLLUP_DAILY_WINDOW", 2 * 365))
+
+HOUR_NS = 3600 * 10**9
+ROLLUP_RESOLUTIONS = {"hourly": HOUR_NS, "daily": 24 * HOUR_NS}
+
+RAW_COLUMNS = {"scores": (np.float32, np.nan, True), "nodes": (np.int16, 0, False)}
+ROLLUP_COLUMNS = {"max": (np.float32, np.nan, True), "anomalies": (np.int16, 0, True), "snapshots": (np.int32, 0, False)}
+
+
+def to_ns(value):
+    """Timestamp key (str or pd.Timestamp, naive values are UTC) -> int64 ns since the epoch."""
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    return (ts.tz_localize("UTC") if ts.tzinfo is None else ts).value
+
+def to_int(value):
+    return int(value) if value is not None else None
+
+def ts_strings(ns):
+    """int64 ns array -> the str(pd.Timestamp) keys used everywhere else in the backend."""
+    return pd.to_datetime(np.asarray(ns, dtype=np.int64), utc=True).astype(str).tolist()
+
+def json_rows(matrix):
+    """Matrix -> nested lists with missing (NaN) values as None."""
+    if not np.isnan(matrix).any():
+        return matrix.tolist()
+    return np.where(np.isnan(matrix), None, matrix.astype(object)).tolist()
+
+
+def downsample(timestamps, scores, max_points, agg="mean"):
+    """Reduce a T x N score matrix to at most max_points equal-size time buckets.
+
+    Each bucket is labelled with its first timestamp; agg is min, max or mean
+    over the bucket, per node, ignoring missing (NaN) scores.
+    """
+    if max_points is None or len(timestamps) <= max_points:
+        return timestamps, scores
+    starts = np.linspace(0, len(timestamps), max_points, endpoint=False).astype(int)
+    if agg == "min":
+        reduced = np.fmin.reduceat(scores, starts, axis=0)
+    elif agg == "max":
+        reduced = np.fmax.reduceat(scores, starts, axis=0)
+    else:
+        present = ~np.isnan(scores)
+        counts = np.add.reduceat(present, starts, axis=0)
+        with np.errstate(invalid="ignore"):
+            reduced = np.add.reduceat(np.where(present, scores, 0), starts, axis=0) / counts
+    return [timestamps[i] for i in starts], reduced
+
+
+class RingBuffer:
+    """Fixed-capacity time-sorted rows: an int64 ns timestamp array plus columns.
+
+    Row i (oldest first) lives in slot (start + i) % capacity, so appending a
+    newer row and evicting the oldest are O(nodes). Inserting between existing
+    rows (backfills) shifts the newer rows and costs O(capacity x nodes).
+    Columns are name -> (dtype, fill, per_node); per-node columns are
+    capacity x width and widen when a row with more nodes arrives.
+    """
+
+    def __init__(self, capacity, columns):
+        self.capacity = capacity
+        self.columns = columns
+        self.width = 0
+        self.start = 0
+        self.size = 0
+        self.ts = np.zeros(capacity, dtype=np.int64)
+        self.data = {
+            name: np.full((capacity, 0) if per_node else capacity, fill, dtype=dtype)
+            for name, (dtype, fill, per_node) in columns.items()
+        }
+
+    def __len__(self):
+        return self.size
+
+    def nbytes(self):
+        return self.ts.nbytes + sum(column.nbytes for column in self.data.values())
+
+    def slot(self, i):
+        return (self.start + i) % self.capacity
+
+    def slots(self, lo, hi):
+        return (self.start + np.arange(lo, hi)) % self.capacity
+
+    def newest(self):
+        return self.ts[self.slot(self.size - 1)] if self.size else None
+
+    def oldest(self):
+        return self.ts[self.start] if self.size else None
+
+    def search(self, t, side="left"):
+        """Logical position of t, as np.searchsorted over the rows oldest first."""
+        end = self.start + self.size
+        first = self.ts[self.start:min(end, self.capacity)]
+        pos = int(np.searchsorted(first, t, side))
+        if pos == len(first) and end > self.capacity:
+            pos += int(np.searchsorted(self.ts[:end - self.capacity], t, side))
+        return pos
+
+    def find(self, t):
+        """Slot of the row at t, or None."""
+        pos = self.search(t)
+        if pos < self.size and self.ts[self.slot(pos)] == t:
+            return self.slot(pos)
+        return None
+
+    def widen(self, width):
+        if width <= self.width:
+            return
+        for name, (dtype, fill, per_node) in self.columns.items():
+            if per_node:
+                column = np.full((self.capacity, width), fill, dtype=dtype)
+                column[:, :self.width] = self.data[name]
+                self.data[name] = column
+        self.width = width
+
+    def row(self, slot):
+        return self.ts[slot], {name: column[slot].copy() for name, column in self.data.items()}
+
+    def pop_oldest(self):
+        evicted = self.row(self.start)
+        self.start = (self.start + 1) % self.capacity
+        self.size -= 1
+        return evicted
+
+    def put(self, t, values):
+        """Insert or replace the row at t; returns the row evicted to make room, if any.
+
+        When the buffer is full and t is older than every row, the new row
+        itself is returned instead of being stored.
+        """
+        slot = self.find(t)
+        if slot is not None:
+            self._write(slot, t, values)
+            return None
+
+        pos = self.search(t)
+        evicted = None
+        if self.size == self.capacity:
+            if pos == 0:
+                return t, values
+            evicted = self.pop_oldest()
+            pos -= 1
+        if pos < self.size:
+            self._linearize()
+            self.ts[pos + 1:self.size + 1] = self.ts[pos:self.size]
+            for column in self.data.values():
+                column[pos + 1:self.size + 1] = column[pos:self.size]
+        self.size += 1
+        self._write(self.slot(pos), t, values)
+        return evicted
+
+    def _write(self, slot, t, values):
+        self.ts[slot] = t
+        for name, (dtype, fill, per_node) in self.columns.items():
+            value = values[name]
+            if per_node:
+                self.data[name][slot, :len(value)] = value
+                self.data[name][slot, len(value):] = fill
+            else:
+                self.data[name][slot] = value
+
+    def _linearize(self):
+        """Rotate the storage so the oldest row is in slot 0."""
+        if self.start:
+            self.ts[:] = np.roll(self.ts, -self.start)
+            for column in self.data.values():
+                column[:] = np.roll(column, -self.start, axis=0)
+            self.start = 0
+
+
+class FwSeries:
+    """Predictions of one (rack, FW): a raw ring buffer over the retention
+    horizon, and hourly/daily rollups (per-node max score and anomaly count)
+    of everything evicted from it.
+    """
+
+    def __init__(self, threshold, window=PREDICTION_WINDOW, retention_hours=PREDICTION_RETENTION_HOURS):
+        self.threshold = threshold
+        self.retention = int(retention_hours * HOUR_NS)
+        self.raw = RingBuffer(window, RAW_COLUMNS)
+        self.rollups = {
+            "hourly": RingBuffer(ROLLUP_HOURLY_WINDOW, ROLLUP_COLUMNS),
+            "daily": RingBuffer(ROLLUP_DAILY_WINDOW, ROLLUP_COLUMNS),
+        }
+        # newest timestamp evicted from the raw buffer into the rollups
+        self.rolled_until = None
+        # newest timestamp accounted for in the rollups (evicted or rolled up directly);
+        # every raw row is newer, so a restart replays only the predictions after it
+        self.resume_after = None
+        self.dirty = set()  # (resolution, bucket) changed since the last dirty_rollups()
+        # (resolution, bucket) that got a prediction at or before resume_after: it may be
+        # new (backfilled history) or re-scored, so the bucket is recomputed by rebuild()
+        self.stale = set()
+
+    def insert(self, t, scores):
+        scores = np.asarray(scores, dtype=np.float32)
+        newest = self.raw.newest()
+        if self.raw.find(t) is None:
+            if self.resume_after is not None and t <= self.resume_after:
+                # every raw row is newer, so this belongs to the rollups
+                for resolution, bucket_ns in ROLLUP_RESOLUTIONS.items():
+                    self.stale.add((resolution, t - t % bucket_ns))
+                return
+            if newest is not None and t < newest - self.retention:
+                self.roll_up(t, scores)
+                self.resume_after = t
+                return
+
+        self.raw.widen(len(scores))
+        evicted = self.raw.put(t, {"scores": scores, "nodes": len(scores)})
+        if evicted is not None:
+            self.evict(*evicted)
+        horizon = self.raw.newest() - self.retention
+        while self.raw.size and self.raw.oldest() < horizon:
+            self.evict(*self.raw.pop_oldest())
+
+    def evict(self, t, values):
+        self.roll_up(t, values["scores"][:values["nodes"]])
+        self.rolled_until = t if self.rolled_until is None else max(self.rolled_until, t)
+        self.resume_after = t if self.resume_after is None else max(self.resume_after, t)
+
+    def roll_up(self, t, scores):
+        anomalies = (scores > self.threshold).astype(np.int16)
+        for resolution, rollup in self.rollups.items():
+            bucket = t - t % ROLLUP_RESOLUTIONS[resolution]
+            self.dirty.add((resolution, bucket))
+            rollup.widen(len(scores))
+            slot = rollup.find(bucket)
+            if slot is None:
+                # a bucket older than every kept one is dropped when the rollup is full
+                rollup.put(bucket, {"max": scores, "anomalies": anomalies, "snapshots": 1})
+                continue
+            n = len(scores)
+            rollup.data["max"][slot, :n] = np.fmax(rollup.data["max"][slot, :n], scores)
+            rollup.data["anomalies"][slot, :n] += anomalies
+            rollup.data["snapshots"][slot] += 1
+
+    def stale_range(self):
+        """[since, until) ns covering every stale bucket."""
+        starts = [bucket for _, bucket in self.stale]
+        ends = [bucket + ROLLUP_RESOLUTIONS[resolution] for resolution, bucket in self.stale]
+        return min(starts), max(ends)
+
+    def rebuild(self, rows):
+        """Recompute the stale buckets from all (t ns, scores) predictions stored in stale_range().
+
+        Only predictions up to resume_after belong to the rollups, newer ones
+        are in the raw buffer.
+        """
+        members = {key: [] for key in self.stale}
+        for t, scores in rows:
+            if t > self.resume_after:
+                continue
+            for resolution, bucket_ns in ROLLUP_RESOLUTIONS.items():
+                bucket = members.get((resolution, t - t % bucket_ns))
+                if bucket is not None:
+                    bucket.append(np.asarray(scores, dtype=np.float32))
+
+        for (resolution, bucket), members_scores in members.items():
+            if not members_scores:
+                continue
+            width = max(len(scores) for scores in members_scores)
+            scores = np.full((len(members_scores), width), np.nan, dtype=np.float32)
+            for i, row in enumerate(members_scores):
+                scores[i, :len(row)] = row
+            with np.errstate(invalid="ignore"):
+                anomalies = (scores > self.threshold).sum(axis=0).astype(np.int16)
+            rollup = self.rollups[resolution]
+            rollup.widen(width)
+            # replaces the bucket; one older than every kept bucket of a full rollup is dropped
+            rollup.put(bucket, {"max": np.fmax.reduce(scores, axis=0), "anomalies": anomalies, "snapshots": len(members_scores)})
+            self.dirty.add((resolution, bucket))
+        self.stale.clear()
+
+    def nbytes(self):
+        return self.raw.nbytes() + sum(rollup.nbytes() for rollup in self.rollups.values())
+
+
+def series_entries(fw, raw, lo, hi):
+    for i in range(lo, hi):
+        slot = raw.slot(i)
+        yield raw.ts[slot], fw, slot
+
+
+class PredictionIndex:
+    """In-memory rack -> fw -> FwSeries of recent predictions.
+
+    Memory is bounded by the ring buffer and rollup capacities, independent of
+    uptime. Raw queries cost O(log n) to locate a time range plus the size of
+    the result. Timestamps are accepted and returned as the canonical
+    str(pd.Timestamp) keys used everywhere in the backend.
+    """
+
+    def __init__(self, thresholds):
+        self.thresholds = thresholds
+        self.series = {}  # rack -> fw -> FwSeries
+        self.versions = {}  # rack -> number of inserts, for ETags
+        self._lock = threading.Lock()
+
+    def insert(self, ts, rack, fw, scores):
+        t = to_ns(ts)
+        with self._lock:
+            self.versions[rack] = self.versions.get(rack, 0) + 1
+            fw_series = self.series.setdefault(rack, {}).get(fw)
+            if fw_series is None:
+                fw_series = self.series[rack][fw] = FwSeries(self.thresholds[fw])
+            fw_series.insert(t, scores)
+
+    def load(self, rows):
+        """Bulk insert (ts, rack, fw, scores) rows, e.g. from PredictionStore.iter_predictions.
+
+        Rows older than the retention horizon only end up in the rollups, and
+        rows a restored series already accounted for are skipped.
+        """
+        count = 0
+        for ts, rack, fw, scores in rows:
+            fw_series = self.series.get(rack, {}).get(fw)
+            if fw_series is not None and fw_series.resume_after is not None and to_ns(ts) <= fw_series.resume_after:
+                continue
+            self.insert(ts, rack, fw, scores)
+            count += 1
+        return count
+
+    def resume_after(self):
+        """Timestamp key after which every series still needs its stored predictions, None for all of them."""
+        with self._lock:
+            series = [fw_series for racks in self.series.values() for fw_series in racks.values()]
+            if not series or any(s.resume_after is None for s in series):
+                return None
+            return ts_strings([min(s.resume_after for s in series)])[0]
+
+    def restore(self, buckets, states):
+        """Rebuild the rollups saved by PredictionStore.save_rollups, before load()."""
+        with self._lock:
+            for rack, fw, rolled_until, resume_after in states:
+                fw_series = self.series.setdefault(rack, {}).setdefault(fw, FwSeries(self.thresholds[fw]))
+                fw_series.rolled_until = rolled_until
+                fw_series.resume_after = resume_after
+            for rack, fw, resolution, bucket, maxes, anomalies, snapshots in buckets:
+                fw_series = self.series.setdefault(rack, {}).setdefault(fw, FwSeries(self.thresholds[fw]))
+                rollup = fw_series.rollups[resolution]
+                rollup.widen(len(maxes))
+                rollup.put(bucket, {"max": maxes, "anomalies": anomalies, "snapshots": snapshots})
+
+    def rebuild_rollups(self, read_rows):
+        """Recompute the stale rollup buckets of every series from the store.
+
+        read_rows(rack, fw, since, until) returns the stored (ts, scores) of a
+        series in [since, until), e.g. PredictionStore.series_rows. It is
+        called under the index lock, so no prediction is indexed between the
+        read and the rebuild.
+        """
+        with self._lock:
+            for rack, racks in self.series.items():
+                for fw, fw_series in racks.items():
+                    if not fw_series.stale:
+                        continue
+                    since, until = ts_strings(fw_series.stale_range())
+                    fw_series.rebuild((to_ns(ts), scores) for ts, scores in read_rows(rack, fw, since, until))
+                    self.versions[rack] = self.versions.get(rack, 0) + 1
+
+    def dirty_rollups(self):
+        """(buckets, states, prune) changed since the last call, for PredictionStore.save_rollups."""
+        buckets, states, prune = [], [], []
+        with self._lock:
+            for rack, racks in self.series.items():
+                for fw, fw_series in racks.items():
+                    if not fw_series.dirty:
+                        continue
+                    for resolution, bucket in sorted(fw_series.dirty):
+                        rollup = fw_series.rollups[resolution]
+                        slot = rollup.find(bucket)
+                        if slot is not None:  # else already dropped from a full rollup
+                            buckets.append((
+                                rack, fw, resolution, int(bucket), rollup.data["max"][slot].copy(),
+                                rollup.data["anomalies"][slot].copy(), int(rollup.data["snapshots"][slot]),
+                            ))
+                    for resolution, rollup in fw_series.rollups.items():
+                        if rollup.size:
+                            prune.append((rack, fw, resolution, int(rollup.oldest())))
+                    states.append((rack, fw, to_int(fw_series.rolled_until), to_int(fw_series.resume_after)))
+                    fw_series.dirty.clear()
+        return buckets, states, prune
+
+    def ranges(self, rack, since=None, until=None, fws=None):
+        """(fw, raw ring buffer, lo, hi) of each FW's raw rows clipped to [since, until]."""
+        since, until = to_ns(since), to_ns(until)
+        result = []
+        for fw, fw_series in sorted(self.series.get(rack, {}).items()):
+            if fws is not None and fw not in fws:
+                continue
+            raw = fw_series.raw
+            lo = raw.search(since) if since is not None else 0
+            hi = raw.search(until, "right") if until is not None else len(raw)
+            if lo < hi:
+                result.append((fw, raw, lo, hi))
+        return result
+
+    def query(self, rack, since=None, until=None, fws=None, latest_only=False, limit=None, offset=0):
+        """Entries sorted by (timestamp, fw) and the total number matching before paging."""
+        with self._lock:
+            ranges = self.ranges(rack, since, until, fws)
+            if latest_only:
+                ranges = [(fw, raw, hi - 1, hi) for fw, raw, lo, hi in ranges]
+            total = sum(hi - lo for _, _, lo, hi in ranges)
+            raws = {fw: raw for fw, raw, _, _ in ranges}
+
+            # k-way merge of the per-FW slices, consumed only up to the requested page
+            merged = heapq.merge(*[series_entries(*r) for r in ranges])
+            stop = offset + limit if limit is not None else None
+            page = list(islice(merged, offset, stop))
+            timestamps = ts_strings([t for t, _, _ in page])
+            entries = [
+                {"timestamp": ts, "fw": fw, "prediction": {"prediction": self.scores(raws[fw], slot)}}
+                for ts, (_, fw, slot) in zip(timestamps, page)
+            ]
+        return entries, total
+
+    @staticmethod
+    def scores(raw, slot):
+        return raw.data["scores"][slot, :raw.data["nodes"][slot]].tolist()
+
+    def matrix(self, rack, since=None, until=None, fws=None):
+        """{fw: (timestamps, T x N float32 scores)} of a rack's raw rows clipped to
+        [since, until]; nodes missing from a snapshot are NaN.
+        """
+        with self._lock:
+            result = {}
+            for fw, raw, lo, hi in self.ranges(rack, since, until, fws):
+                slots = raw.slots(lo, hi)
+                width = int(raw.data["nodes"][slots].max())
+                result[fw] = (ts_strings(raw.ts[slots]), raw.data["scores"][slots, :width])
+            return result
+
+    def rollup(self, rack, resolution, since=None, until=None, fws=None):
+        """{fw: (bucket timestamps, B x N max scores, B x N anomaly counts, B snapshots)}.
+
+        Buckets cover both the rolled-up history and the raw rows still in the
+        ring buffer, aggregated on the fly. A bucket is included when its start
+        lies in [since, until].
+        """
+        bucket_ns = ROLLUP_RESOLUTIONS[resolution]
+        since, until = to_ns(since), to_ns(until)
+        with self._lock:
+            result = {}
+            for fw, fw_series in sorted(self.series.get(rack, {}).items()):
+                if fws is not None and fw not in fws:
+                    continue
+                rollup = fw_series.rollups[resolution]
+                raw = fw_series.raw
+                width = max(rollup.width, raw.width)
+
+                slots = rollup.slots(0, len(rollup))
+                raw_slots = raw.slots(0, len(raw))
+                raw_scores = raw.data["scores"][raw_slots]
+                bucket_ts = np.concatenate([rollup.ts[slots], raw.ts[raw_slots] - raw.ts[raw_slots] % bucket_ns])
+                maxes = np.full((len(bucket_ts), width), np.nan, dtype=np.float32)
+                maxes[:len(slots), :rollup.width] = rollup.data["max"][slots]
+                maxes[len(slots):, :raw.width] = raw_scores
+                anomalies = np.zeros((len(bucket_ts), width), dtype=np.int32)
+                anomalies[:len(slots), :rollup.width] = rollup.data["anomalies"][slots]
+                anomalies[len(slots):, :raw.width] = raw_scores > fw_series.threshold
+                snapshots = np.concatenate([rollup.data["snapshots"][slots], np.ones(len(raw_slots), dtype=np.int32)])
+
+                keep = np.ones(len(bucket_ts), dtype=bool)
+                if since is not None:
+                    keep &= bucket_ts >= since - since % bucket_ns
+                if until is not None:
+                    keep &= bucket_ts <= until
+                buckets, inverse = np.unique(bucket_ts[keep], return_inverse=True)
+                if not len(buckets):
+                    continue
+
+                merged_max = np.full((len(buckets), width), np.nan, dtype=np.float32)
+                np.fmax.at(merged_max, inverse, maxes[keep])
+                merged_anomalies = np.zeros((len(buckets), width), dtype=np.int32)
+                np.add.at(merged_anomalies, inverse, anomalies[keep])
+                merged_snapshots = np.zeros(len(buckets), dtype=np.int32)
+                np.add.at(merged_snapshots, inverse, snapshots[keep])
+                result[fw] = (ts_strings(buckets), merged_max, merged_anomalies, merged_snapshots)
+            return result
+
+    def stats(self):
+        with self._lock:
+            series = [fw_series for racks in self.series.values() for fw_series in racks.values()]
+            return {
+                "series": len(series),
+                "raw_rows": sum(len(s.raw) for s in series),
+                "rollup_buckets": {
+                    resolution: sum(len(s.rollups[resolution]) for s in series) for resolution in ROLLUP_RESOLUTIONS
+                },
+                "nbytes": sum(s.nbytes() for s in series),
+                "window": PREDICTION_WINDOW,
+                "retention_hours": PREDICTION_RETENTION_HOURS,
+            }
+
+    def version(self, rack):
+        return self.versions.get(rack, 0)
+
+    def __contains__(self, rack):
+        return rack in self.series
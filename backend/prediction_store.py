@@ -0,0 +1,181 @@
+import os
+import pickle
+import sqlite3
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def encode_scores(scores):
+    return np.atleast_1d(np.asarray(scores, dtype=np.float32)).tobytes()
+
+def decode_scores(blob):
+    return np.frombuffer(blob, dtype=np.float32).tolist()
+
+
+class PredictionStore:
+    """Append-only SQLite store of per-node scores keyed by (rack, timestamp, FW).
+
+    Runs in WAL mode: every append is one transaction, so a crash loses at
+    most the rows of the append in progress and never corrupts earlier ones.
+    Scores are stored as a float32 blob with one value per node.
+
+    Next to the predictions it keeps the PredictionIndex rollups of evicted
+    predictions, so a restart only replays the raw retention window.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            " rack INTEGER NOT NULL,"
+            " ts TEXT NOT NULL,"
+            " fw INTEGER NOT NULL,"
+            " scores BLOB NOT NULL,"
+            " PRIMARY KEY (rack, ts, fw)"
+            ") WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS predictions_ts ON predictions (ts)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rollups ("
+            " rack INTEGER NOT NULL,"
+            " fw INTEGER NOT NULL,"
+            " resolution TEXT NOT NULL,"
+            " bucket INTEGER NOT NULL,"
+            " max BLOB NOT NULL,"
+            " anomalies BLOB NOT NULL,"
+            " snapshots INTEGER NOT NULL,"
+            " PRIMARY KEY (rack, fw, resolution, bucket)"
+            ") WITHOUT ROWID"
+        )
+        # Per (rack, FW): newest timestamp evicted into the rollups, and newest one
+        # accounted for in them; predictions up to resume_after are never replayed
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rollup_state ("
+            " rack INTEGER NOT NULL,"
+            " fw INTEGER NOT NULL,"
+            " rolled_until INTEGER,"
+            " resume_after INTEGER,"
+            " PRIMARY KEY (rack, fw)"
+            ")"
+        )
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def append(self, rows):
+        """Insert (ts, rack, fw, scores) rows atomically; re-scored keys are replaced."""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO predictions (rack, ts, fw, scores) VALUES (?, ?, ?, ?)",
+                [(rack, str(ts), fw, encode_scores(scores)) for ts, rack, fw, scores in rows],
+            )
+
+    def last_timestamp(self):
+        with self._lock:
+            row = self.conn.execute("SELECT MAX(ts) FROM predictions").fetchone()
+        return row[0]
+
+    def stored_keys(self, rack, fws, since, until):
+        """Timestamps in [since, until] at which a rack already has a prediction for every FW in fws."""
+        fws = list(fws)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT ts FROM predictions"
+                f" WHERE rack = ? AND ts BETWEEN ? AND ? AND fw IN ({','.join('?' * len(fws))})"
+                " GROUP BY ts HAVING COUNT(*) = ?",
+                (rack, str(since), str(until), *fws, len(fws)),
+            ).fetchall()
+        return {ts for (ts,) in rows}
+
+    def iter_predictions(self, since=None, batch_size=1024):
+        """(ts, rack, fw, scores) of the stored rows after `since` (all when None), sorted by rack, timestamp and FW.
+
+        Rows are streamed from a separate read connection in batches, so memory
+        stays flat however long the history is and appends are not blocked.
+        """
+        conn = sqlite3.connect(self.path)
+        try:
+            if since is None:
+                cursor = conn.execute("SELECT rack, ts, fw, scores FROM predictions ORDER BY rack, ts, fw")
+            else:
+                cursor = conn.execute(
+                    "SELECT rack, ts, fw, scores FROM predictions WHERE ts > ? ORDER BY rack, ts, fw", (str(since),)
+                )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for rack, ts, fw, blob in rows:
+                    yield ts, rack, fw, decode_scores(blob)
+        finally:
+            conn.close()
+
+    def series_rows(self, rack, fw, since, until):
+        """(ts, scores) of one (rack, FW) with since <= ts < until, oldest first."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT ts, scores FROM predictions WHERE rack = ? AND fw = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (rack, fw, str(since), str(until)),
+            ).fetchall()
+        return [(ts, decode_scores(blob)) for ts, blob in rows]
+
+    def save_rollups(self, buckets, states, prune):
+        """Write PredictionIndex.dirty_rollups() in one transaction.
+
+        buckets are (rack, fw, resolution, bucket ns, max, anomalies, snapshots),
+        states (rack, fw, rolled_until, resume_after) and prune (rack, fw,
+        resolution, oldest kept bucket ns).
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rollups (rack, fw, resolution, bucket, max, anomalies, snapshots)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (rack, fw, resolution, bucket, maxes.astype(np.float32).tobytes(), anomalies.astype(np.int16).tobytes(), snapshots)
+                    for rack, fw, resolution, bucket, maxes, anomalies, snapshots in buckets
+                ],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rollup_state (rack, fw, rolled_until, resume_after) VALUES (?, ?, ?, ?)", states
+            )
+            self.conn.executemany(
+                "DELETE FROM rollups WHERE rack = ? AND fw = ? AND resolution = ? AND bucket < ?", prune
+            )
+
+    def load_rollups(self):
+        """(buckets, states) as written by save_rollups, buckets sorted oldest first."""
+        with self._lock:
+            buckets = self.conn.execute(
+                "SELECT rack, fw, resolution, bucket, max, anomalies, snapshots FROM rollups ORDER BY rack, fw, resolution, bucket"
+            ).fetchall()
+            states = self.conn.execute("SELECT rack, fw, rolled_until, resume_after FROM rollup_state").fetchall()
+        return [
+            (rack, fw, resolution, bucket, np.frombuffer(maxes, dtype=np.float32), np.frombuffer(anomalies, dtype=np.int16), snapshots)
+            for rack, fw, resolution, bucket, maxes, anomalies, snapshots in buckets
+        ], states
+
+    def migrate_pickle(self, pickle_path):
+        """One-time import of the legacy latest_predictions.pickle.
+
+        The pickle is renamed to *.migrated afterwards so it is never read again.
+        """
+        if not os.path.exists(pickle_path):
+            return 0
+
+        with open(pickle_path, "rb") as f:
+            legacy = pickle.load(f)
+
+        rows = []
+        for key, pred in legacy.items():
+            ts, fw_str, rack_str = key.split("|")
+            rows.append((ts, int(rack_str), int(fw_str), pred["prediction"]))
+        self.append(rows)
+
+        os.replace(pickle_path, pickle_path + ".migrated")
+        logger.info(f"Migrated {len(rows)} predictions from {pickle_path} into {self.path}")
+        return len(rows)
@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Where armed profiles are written, one collapsed-stack file per session
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/app/logs/profiles")
+# Default sampling interval of the stack sampler (ms)
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+
+# Threads whose innermost frame is in one of these are idle (waiting on a lock,
+# queue, selector or for executor work) and are not sampled
+IDLE_FILES = {"threading.py", "queue.py", "selectors.py", "thread.py"}
+
+
+def collapse(frame, root):
+    """root;outer (file:line);...;inner (file:line) of a frame, in collapsed-stack order."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(root)
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples the Python stack of every other thread at a fixed interval.
+
+    Counts are keyed by collapsed stack ("thread;outer;...;inner"), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own and os.path.basename(frame.f_code.co_filename) not in IDLE_FILES:
+                    self.counts[collapse(frame, names.get(ident, str(ident)))] += 1
+
+
+def sample_call(interval_ms, fn, *args):
+    """(fn(*args), collapsed-stack counts) with a sampler running around the call, for worker processes."""
+    sampler = StackSampler(interval_ms).start()
+    try:
+        result = fn(*args)
+    finally:
+        counts = sampler.stop()
+    return result, counts
+
+
+class CycleProfiler:
+    """Stack sampling of the next N scheduled cycles, armed through /admin/profile.
+
+    Disarmed, begin() returns None and the cycle runs unchanged. Armed, each
+    cycle is sampled in the backend process and in the fetch workers (stacks
+    prefixed with "fetch_worker"), and after the Nth cycle the merged counts
+    are written to PROFILE_DIR as one .collapsed file.
+    """
+
+    def __init__(self, out_dir=PROFILE_DIR):
+        self.out_dir = out_dir
+        self.remaining = 0
+        self.interval_ms = PROFILE_INTERVAL_MS
+        self.counts = Counter()
+        self.cycles = 0
+        self.started = None
+        self.last = None
+        self._lock = threading.Lock()
+
+    def arm(self, cycles, interval_ms=PROFILE_INTERVAL_MS):
+        with self._lock:
+            if self.remaining:
+                raise RuntimeError(f"already profiling, {self.remaining} cycles to go")
+            self.remaining = cycles
+            self.interval_ms = interval_ms
+            self.counts = Counter()
+            self.cycles = 0
+            self.started = None
+
+    def begin(self):
+        """A running StackSampler for this cycle, or None when disarmed."""
+        if not self.remaining:
+            return None
+        if self.started is None:
+            self.started = time.time()
+        return StackSampler(self.interval_ms).start()
+
+    def add(self, counts, prefix):
+        with self._lock:
+            for stack, count in counts.items():
+                self.counts[f"{prefix};{stack}"] += count
+
+    def end(self, sampler):
+        if sampler is None:
+            return
+        self.add(sampler.stop(), "backend")
+        with self._lock:
+            self.cycles += 1
+            self.remaining -= 1
+            if self.remaining:
+                return
+            os.makedirs(self.out_dir, exist_ok=True)
+            path = os.path.join(self.out_dir, f"backend-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))}.collapsed")
+            with open(path, "w") as f:
+                for stack, count in self.counts.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.last = {"path": path, "cycles": self.cycles, "samples": sum(self.counts.values()), "top": top_frames(self.counts)}
+        logger.info(f"Profile of {self.cycles} cycles written to {path}")
+
+    def status(self):
+        with self._lock:
+            return {"remaining_cycles": self.remaining, "interval_ms": self.interval_ms, "last": self.last}
+
+
+def top_frames(counts, n=15):
+    """The n frames most often on top of the stack, with their share of samples."""
+    leaves = Counter()
+    for stack, count in counts.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    total = sum(leaves.values()) or 1
+    return [{"frame": frame, "samples": count, "share": round(count / total, 4)} for frame, count in leaves.most_common(n)]
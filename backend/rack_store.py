@@ -0,0 +1,69 @@
+import os
+import json
+import numpy as np
+
+# Timestamp-major compacted telemetry written by compact_rack_store.py
+RACK_STORE_DIR = os.environ.get("RACK_STORE_DIR", "/app/storage/rack_store")
+
+_stores = {}  # rack -> (meta mtime_ns, RackStore)
+
+
+class RackStore:
+    """Read-only view over one compacted rack.
+
+    Files in `{RACK_STORE_DIR}/{rack}/`:
+      features.npy   float32 (timestamps x nodes x features), memory-mapped
+      valid.npy      bool (timestamps x nodes), False where the node had no clean row
+      timestamps.npy int64 ns since epoch, sorted, aligned to common_ts.pickle
+      meta.json      node ids and column order (col_list.pickle)
+    """
+
+    def __init__(self, rack_dir):
+        with open(os.path.join(rack_dir, "meta.json")) as f:
+            meta = json.load(f)
+        self.nodes = meta["nodes"]
+        self.columns = meta["columns"]
+        self.features = np.load(os.path.join(rack_dir, "features.npy"), mmap_mode="r")
+        self.valid = np.load(os.path.join(rack_dir, "valid.npy"), mmap_mode="r")
+        self.timestamps = np.load(os.path.join(rack_dir, "timestamps.npy"))
+        self.complete = self.valid.all(axis=1)
+
+    def position(self, ts_ns):
+        i = int(np.searchsorted(self.timestamps, ts_ns))
+        if i < len(self.timestamps) and self.timestamps[i] == ts_ns:
+            return i
+        return None
+
+    def snapshot(self, ts_ns):
+        """Features of all nodes at one timestamp, or None if it is not compacted.
+
+        Returns a zero-copy view when every node has a row at `ts_ns`; nodes
+        without a clean row are dropped (as data_fetch does), which copies.
+        """
+        i = self.position(ts_ns)
+        if i is None:
+            return None
+        if self.complete[i]:
+            return self.features[i]
+        return self.features[i][self.valid[i]]
+
+
+def rack_dir(rack):
+    return os.path.join(RACK_STORE_DIR, str(rack))
+
+def get_rack_store(rack):
+    """Open (and cache) the compacted store of a rack, None if it was never compacted."""
+    meta_path = os.path.join(rack_dir(rack), "meta.json")
+    try:
+        mtime = os.stat(meta_path).st_mtime_ns
+    except FileNotFoundError:
+        _stores.pop(rack, None)
+        return None
+
+    cached = _stores.get(rack)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    store = RackStore(rack_dir(rack))
+    _stores[rack] = (mtime, store)
+    return store
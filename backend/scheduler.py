@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from metrics import CYCLE_SLACK_SECONDS, DEADLINE_MISSES, SKIPPED_WORK
+
+logger = logging.getLogger(__name__)
+
+# Seconds between cycle starts; a cycle's deadline is the end of its slot
+CYCLE_INTERVAL = float(os.environ.get("CYCLE_INTERVAL", 15 * 60))
+# After an overrun: "catch_up" runs missed slots back to back, at most
+# SCHEDULER_MAX_CATCH_UP of them (older ones are skipped); "skip" drops every
+# missed slot and runs the newest one right away
+SCHEDULER_POLICY = os.environ.get("SCHEDULER_POLICY", "catch_up")
+SCHEDULER_MAX_CATCH_UP = int(os.environ.get("SCHEDULER_MAX_CATCH_UP", 2))
+# Horizons inferred for every rack before the longer ones
+PRIORITY_FWS = [int(fw) for fw in os.environ.get("PRIORITY_FWS", "4,6").split(",") if fw]
+
+
+def prioritize(fw_values, priority=PRIORITY_FWS):
+    """[priority FWs, remaining FWs], without empty groups."""
+    first = [fw for fw in fw_values if fw in priority]
+    rest = [fw for fw in fw_values if fw not in priority]
+    return [group for group in (first, rest) if group]
+
+
+class CycleScheduler:
+    """Runs `await run(deadline)` once per CYCLE_INTERVAL slot, never concurrently.
+
+    Slots are anchored at start time + interval, so a late cycle does not
+    shift the ones after it. Each cycle's deadline (time.monotonic()) is the
+    end of the current slot, and its slack (deadline minus finish time) is
+    recorded; a negative slack is a missed deadline. When cycles fall behind,
+    missed slots are caught up or skipped according to the policy, and
+    `skip(n)` is called to drop the work of n skipped slots.
+    """
+
+    def __init__(self, run, skip, interval=CYCLE_INTERVAL, policy=SCHEDULER_POLICY, max_catch_up=SCHEDULER_MAX_CATCH_UP):
+        if policy not in ("catch_up", "skip"):
+            raise ValueError(f"Unknown scheduler policy {policy!r}")
+        self.run = run
+        self.skip = skip
+        self.interval = interval
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.t0 = None
+        self.task = None
+        self.cycles = 0
+        self.catch_ups = 0
+        self.skipped_slots = 0
+        self.deadline_misses = 0
+        self.last = None
+        self.recent_skips = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.t0 = time.monotonic() + self.interval
+        self.task = asyncio.get_running_loop().create_task(self.loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def current_slot(self, now):
+        return int((now - self.t0) // self.interval)
+
+    async def loop(self):
+        slot = 0
+        while True:
+            now = time.monotonic()
+            current = self.current_slot(now)
+            if current < slot:
+                await asyncio.sleep(self.t0 + slot * self.interval - now)
+                continue
+
+            # slots slot..current have all started; run the newest `keep` of them
+            pending = current - slot + 1
+            keep = 1 if self.policy == "skip" else min(pending, self.max_catch_up + 1)
+            if pending > keep:
+                self.skip_slots(pending - keep)
+                slot += pending - keep
+            await self.run_slot(slot, catch_up=slot < current)
+            slot += 1
+
+    def skip_slots(self, count):
+        skipped = self.skip(count)
+        SKIPPED_WORK.labels(kind="slot").inc(count)
+        with self._lock:
+            self.skipped_slots += count
+            self.recent_skips.append({"at": time.time(), "slots": count, "skipped": skipped})
+        logger.warning(f"Scheduler behind by {count} slots, skipped {skipped}")
+
+    async def run_slot(self, slot, catch_up):
+        deadline = self.t0 + (self.current_slot(time.monotonic()) + 1) * self.interval
+        started = time.monotonic()
+        try:
+            summary = await self.run(deadline)
+        except Exception as e:
+            logger.error(f"Scheduled cycle failed: {e}")
+            summary = None
+        finished = time.monotonic()
+
+        slack = deadline - finished
+        skipped_fws = (summary or {}).get("skipped_fws", [])
+        SKIPPED_WORK.labels(kind="fw").inc(len(skipped_fws))
+        CYCLE_SLACK_SECONDS.observe(slack)
+        if slack < 0:
+            DEADLINE_MISSES.labels(kind="cycle").inc()
+        with self._lock:
+            self.cycles += 1
+            self.catch_ups += catch_up
+            self.deadline_misses += slack < 0
+            self.last = {
+                "slot": slot,
+                "catch_up": catch_up,
+                "start_lag_s": round(started - (self.t0 + slot * self.interval), 3),
+                "duration_s": round(finished - started, 3),
+                "slack_s": round(slack, 3),
+                "skipped_fws": skipped_fws,
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "interval_s": self.interval,
+                "policy": self.policy,
+                "max_catch_up": self.max_catch_up,
+                "cycles": self.cycles,
+                "catch_up_cycles": self.catch_ups,
+                "skipped_slots": self.skipped_slots,
+                "deadline_misses": self.deadline_misses,
+                "next_slot_in_s": round(self.t0 + (self.current_slot(time.monotonic()) + 1) * self.interval - time.monotonic(), 3)
+                if self.t0 is not None else None,
+                "last": self.last,
+                "recent_skips": list(self.recent_skips),
+            }
@@ -0,0 +1,72 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import pandas as pd
+import pytest
+
+# Backend modules import each other as top-level modules and read col_list.pickle
+# from the working directory, as in the container
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+# Storage of the modules under test, set before they are imported (and inherited
+# by the fetch worker processes) so tests never touch /data or /app/storage
+TEST_ROOT = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.update({
+    "DATA_DIR": os.path.join(TEST_ROOT, "data"),
+    "TS_INDEX_DIR": os.path.join(TEST_ROOT, "ts_index"),
+    "RACK_STORE_DIR": os.path.join(TEST_ROOT, "rack_store"),
+    "SCALING_STATS_DIR": os.path.join(TEST_ROOT, "scaling_stats"),
+    "INGEST_CURSOR_DIR": os.path.join(TEST_ROOT, "ingest"),
+    "PROFILE_DIR": os.path.join(TEST_ROOT, "profiles"),
+    "FETCH_WORKERS": "2",
+})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_ROOT, ignore_errors=True)
+
+
+@pytest.fixture
+def data_dir():
+    """An empty DATA_DIR, with the pools and caches that read it reset around the test."""
+    import data_fetch
+    from pipeline import shutdown_pools
+
+    path = os.environ["DATA_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    shutil.rmtree(os.environ["TS_INDEX_DIR"], ignore_errors=True)
+    shutil.rmtree(os.environ["INGEST_CURSOR_DIR"], ignore_errors=True)
+    os.makedirs(path)
+    data_fetch._rack_files.clear()
+    data_fetch._rack_index.clear()
+    yield path
+    shutdown_pools()
+
+
+def append_snapshots(data_dir, rack, timestamps, nodes=4, seed=0):
+    """Append one synthetic row group per node and timestamp, as generate_stream_data.py does."""
+    import numpy as np
+    from data_fetch import get_cols
+    from generate_stream_data import make_row_group, append_row_group
+
+    rng = np.random.default_rng(seed)
+    tmp_dir = os.path.join(data_dir, ".tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    os.makedirs(os.path.join(data_dir, str(rack)), exist_ok=True)
+    for ts in timestamps:
+        for node in range(nodes):
+            path = os.path.join(data_dir, str(rack), f"{node}.parquet")
+            append_row_group(path, make_row_group(pd.Timestamp(ts), get_cols(), rng, 0.0), tmp_dir)
+
+
+def fake_predictions(fws, x):
+    """Inference service response for a nodes x features snapshot: node i scores i / nodes."""
+    nodes = len(x)
+    return {
+        "predictions": {str(fw): [i / nodes for i in range(nodes)] for fw in fws},
+        "timings": {str(fw): 1.0 for fw in fws},
+    }
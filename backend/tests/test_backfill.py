@@ -0,0 +1,45 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import backfill
+from backfill import run_backfill
+from data_fetch import get_cols
+from prediction_store import PredictionStore
+from conftest import append_snapshots, fake_predictions
+
+FWS = [4, 6]
+
+
+def test_backfill_stores_and_resumes(data_dir, tmp_path, monkeypatch):
+    timestamps = list(pd.date_range("2020-05-11", periods=6, freq="15min", tz="UTC"))
+    for rack in (0, 2):
+        append_snapshots(data_dir, rack, timestamps, nodes=4, seed=rack)
+
+    requests = []
+
+    def request_inference(rack, fws, graph_payload):
+        x = np.load(io.BytesIO(graph_payload["data"]))
+        assert x.shape == (4, len(get_cols())) and 0 <= x.min() and x.max() <= 1
+        requests.append(rack)
+        return fake_predictions(fws, x)
+
+    monkeypatch.setattr(backfill, "request_inference", request_inference)
+    store = PredictionStore(str(tmp_path / "predictions.sqlite"))
+
+    progress = run_backfill(store, timestamps, [0, 2], FWS, chunk_size=4).snapshot()
+    assert (progress["done"], progress["failed"], progress["skipped"]) == (12, 0, 0)
+    rows = list(store.iter_predictions())
+    assert len(rows) == 2 * len(timestamps) * len(FWS)
+    assert {(rack, ts) for ts, rack, _, _ in rows} == {(rack, str(ts)) for rack in (0, 2) for ts in timestamps}
+    assert rows[0][3] == [0.0, 0.25, 0.5, 0.75]
+
+    # Stored keys are skipped, only the new timestamps are scored
+    requests.clear()
+    later = list(pd.date_range(timestamps[-1], periods=3, freq="15min", tz="UTC"))[1:]
+    append_snapshots(data_dir, 0, later, nodes=4, seed=5)
+    progress = run_backfill(store, timestamps + later, [0], FWS, chunk_size=4).snapshot()
+    assert (progress["done"], progress["failed"], progress["skipped"]) == (2, 0, 6)
+    assert requests == [0, 0]
+    assert len(list(store.iter_predictions())) == (2 * len(timestamps) + len(later)) * len(FWS)
@@ -0,0 +1,26 @@
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+import data_fetch
+from data_fetch import rack_index_path, save_rack_index
+
+
+def test_concurrent_index_writes_do_not_collide(data_dir):
+    # as fetch worker processes indexing the same rack do, without the in-process lock
+    def write(i):
+        for _ in range(25):
+            save_rack_index(0, {"writer": i})
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(write, range(8)))
+
+    with open(rack_index_path(0), "rb") as f:
+        assert pickle.load(f)["writer"] in range(8)
+    assert os.listdir(data_fetch.TS_INDEX_DIR) == ["0.pickle"]
+
+
+def test_list_racks_reads_data_dir(data_dir):
+    for name in ("10", "2", "tmp"):
+        os.makedirs(os.path.join(data_dir, name))
+    assert data_fetch.list_racks() == [2, 10]
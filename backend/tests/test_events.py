@@ -0,0 +1,41 @@
+import asyncio
+
+from events import CycleEvents
+
+
+def read_events(events, last_event_id, publish):
+    """Ids of the events a stream yields for the given publishes, heartbeats excluded."""
+    async def run():
+        stream = events.stream(last_event_id, heartbeat=0.05)
+        ids = []
+        task = asyncio.ensure_future(collect(stream, ids))
+        await asyncio.sleep(0.01)
+        for timestamp, details in publish:
+            events.publish(timestamp, **details)
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return ids
+
+    async def collect(stream, ids):
+        async for chunk in stream:
+            if chunk.startswith("id: "):
+                ids.append(chunk.split("\n", 1)[0][4:])
+
+    return asyncio.run(run())
+
+
+def test_rack_events_of_one_timestamp_have_distinct_ids():
+    events = CycleEvents("2030-01-01 00:00:00+00:00")
+    ts = "2030-01-01 00:15:00+00:00"
+    ids = read_events(events, "2030-01-01 00:00:00+00:00", [(ts, {"rack": 0}), (ts, {"rack": 2})])
+    assert ids == [f"{ts}:0", f"{ts}:2"]
+
+
+def test_reconnect_skips_seen_event():
+    events = CycleEvents()
+    events.publish("2030-01-01 00:15:00+00:00", rack=2)
+    assert read_events(events, "2030-01-01 00:15:00+00:00:2", []) == []
+    assert read_events(events, "2030-01-01 00:15:00+00:00:0", []) == ["2030-01-01 00:15:00+00:00:2"]
+    events.publish("2030-01-01 00:30:00+00:00")
+    assert read_events(events, None, []) == ["2030-01-01 00:30:00+00:00"]
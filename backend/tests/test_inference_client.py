@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import pytest
+
+import inference_client
+from inference_client import InferenceClient
+from metrics import INFERENCE_RETRY_COUNT
+
+PAYLOAD = {"json": {"x": [[0.0]]}}
+RESULT = {"predictions": {"4": [0.1]}, "timings": {"4": 1.0}}
+
+
+def make_client(statuses):
+    """InferenceClient whose requests get the given statuses in turn (200 returns RESULT)."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        return httpx.Response(status, json=RESULT if status == 200 else {})
+
+    client = InferenceClient(base_url="http://inference")
+    client.client = httpx.AsyncClient(base_url="http://inference", transport=httpx.MockTransport(handler))
+    return client, calls
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(inference_client, "INFERENCE_BACKOFF", 0.001)
+
+
+def test_retries_retryable_status():
+    async def run():
+        client, calls = make_client([503, 502, 200])
+        try:
+            return await client.predict(0, [4], PAYLOAD), client, calls
+        finally:
+            await client.aclose()
+
+    before = INFERENCE_RETRY_COUNT._value.get()
+    result, client, calls = asyncio.run(run())
+
+    assert result == RESULT
+    assert len(calls) == 3
+    assert client.stats()["retries"] == 2
+    assert INFERENCE_RETRY_COUNT._value.get() == before + 2
+
+
+def test_gives_up_after_retries():
+    async def run():
+        client, calls = make_client([503])
+        try:
+            with pytest.raises(RuntimeError, match="giving up"):
+                await client.predict(0, [4], PAYLOAD)
+            return calls
+        finally:
+            await client.aclose()
+
+    assert len(asyncio.run(run())) == inference_client.INFERENCE_RETRIES + 1
+
+
+def test_client_errors_are_not_retried():
+    async def run():
+        client, calls = make_client([400])
+        try:
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.predict(0, [4], PAYLOAD)
+            return calls
+        finally:
+            await client.aclose()
+
+    assert len(asyncio.run(run())) == 1
@@ -0,0 +1,132 @@
+import io
+import os
+import sys
+import asyncio
+import subprocess
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from data_fetch import get_cols
+from generate_stream_data import make_row_group, append_row_group
+from ingest import StreamIngest
+from pipeline import run_snapshot
+from prediction_store import PredictionStore
+from conftest import append_snapshots, fake_predictions
+
+FWS = [4, 6]
+
+
+def make_ingest(store, racks, fail=()):
+    """StreamIngest storing fake predictions; timestamps in `fail` raise like a failed inference."""
+    calls = []
+
+    async def on_snapshot(rack, ts, x, fetch_ms):
+        calls.append((rack, str(ts)))
+        if str(ts) in fail:
+            raise RuntimeError("inference service unavailable")
+        store.append([(ts, rack, fw, x[:, 0].tolist()) for fw in FWS])
+
+    return StreamIngest(racks, on_snapshot, interval=0), calls
+
+
+def stored(store):
+    return sorted({(rack, ts) for ts, rack, _, _ in store.iter_predictions()})
+
+
+def test_failed_snapshot_is_retried(data_dir, tmp_path):
+    timestamps = [str(ts) for ts in pd.date_range("2030-01-01", periods=3, freq="15min", tz="UTC")]
+    append_snapshots(data_dir, 0, timestamps[:1])
+    store = PredictionStore(str(tmp_path / "predictions.sqlite"))
+    fail = {timestamps[1]}
+    ingest, calls = make_ingest(store, [0], fail)
+    asyncio.run(ingest.poll_once())  # fresh cursor: starts at the end of the files
+
+    append_snapshots(data_dir, 0, timestamps[1:], seed=1)
+    asyncio.run(ingest.poll_once())
+    assert calls == [(0, timestamps[1])]  # the later snapshot waits behind the failed one
+    assert stored(store) == []
+    assert ingest.stats()["failed_snapshots"] == 1
+
+    fail.clear()
+    asyncio.run(ingest.poll_once())
+    assert stored(store) == [(0, ts) for ts in timestamps[1:]]
+    assert ingest.tails[0].stats()["emitted"] == timestamps[2]
+
+
+def test_restart_resumes_unstored_snapshot(data_dir, tmp_path):
+    timestamps = [str(ts) for ts in pd.date_range("2030-01-01", periods=2, freq="15min", tz="UTC")]
+    append_snapshots(data_dir, 0, timestamps[:1])
+    store = PredictionStore(str(tmp_path / "predictions.sqlite"))
+    ingest, _ = make_ingest(store, [0], fail={timestamps[1]})
+    asyncio.run(ingest.poll_once())
+    append_snapshots(data_dir, 0, timestamps[1:], seed=1)
+    asyncio.run(ingest.poll_once())
+    assert stored(store) == []
+
+    # A new process re-reads the rows its predecessor never stored
+    restarted, calls = make_ingest(store, [0])
+    asyncio.run(restarted.poll_once())
+    assert calls == [(0, timestamps[1])]
+    assert stored(store) == [(0, timestamps[1])]
+
+
+def generate(data_dir, start, steps, racks=(0, 2), nodes=4, seed=0):
+    subprocess.run(
+        [sys.executable, "generate_stream_data.py", "--out", data_dir, "--racks", *map(str, racks), "--nodes", str(nodes),
+         "--start", start, "--steps", str(steps), "--every", "0", "--seed", str(seed)],
+        check=True, capture_output=True,
+    )
+
+
+def make_pipeline_ingest(store, racks):
+    """StreamIngest through run_snapshot, with an inference stub writing to `store`; counts stores per (rack, ts)."""
+    stores = Counter()
+
+    async def infer(ts, rack, fws, graph_payload, fetch_time, preprocess_time, serialize_time):
+        x = np.load(io.BytesIO(graph_payload["data"]))
+        store.append([(ts, rack, fw, scores) for fw, scores in fake_predictions(fws, x)["predictions"].items()])
+        stores[(rack, str(ts))] += 1
+
+    async def on_snapshot(rack, ts, x, fetch_ms):
+        await run_snapshot(ts, rack, x, [FWS[:1], FWS[1:]], infer, fetch_ms)
+
+    return StreamIngest(racks, on_snapshot, interval=0), stores
+
+
+def test_generated_stream_is_stored_exactly_once(data_dir, tmp_path):
+    store = PredictionStore(str(tmp_path / "predictions.sqlite"))
+    timestamps = [str(ts) for ts in pd.date_range("2030-01-01", periods=6, freq="15min", tz="UTC")]
+    generate(data_dir, timestamps[0], 1)
+
+    ingest, stores = make_pipeline_ingest(store, [0, 2])
+    asyncio.run(ingest.poll_once())
+    assert stored(store) == []  # rows written before the first start are not replayed
+
+    generate(data_dir, timestamps[1], 2, seed=1)
+    asyncio.run(ingest.poll_once())
+    asyncio.run(ingest.poll_once())
+    assert stored(store) == [(rack, ts) for rack in (0, 2) for ts in timestamps[1:3]]
+
+    # Node 0 of rack 0 is ahead when the process stops: its row is only buffered
+    append_snapshots(data_dir, 0, timestamps[3:4], nodes=1, seed=2)
+    asyncio.run(ingest.poll_once())
+    assert (0, timestamps[3]) not in stored(store)
+
+    restarted, restarted_stores = make_pipeline_ingest(store, [0, 2])
+    for node in range(1, 4):
+        append_row_group(
+            os.path.join(data_dir, "0", f"{node}.parquet"),
+            make_row_group(pd.Timestamp(timestamps[3]), get_cols(), np.random.default_rng(node), 0.0),
+            os.path.join(data_dir, ".tmp"),
+        )
+    generate(data_dir, timestamps[4], 2, seed=3)
+    asyncio.run(restarted.poll_once())
+    asyncio.run(restarted.poll_once())
+
+    expected = [(0, ts) for ts in timestamps[1:]] + [(2, ts) for ts in timestamps[1:3] + timestamps[4:]]
+    assert stored(store) == sorted(expected)
+    assert len(list(store.iter_predictions())) == len(expected) * len(FWS)
+    assert all(count == 2 for count in (stores + restarted_stores).values())  # one store per FW group
+    assert set(stores + restarted_stores) == set(expected)
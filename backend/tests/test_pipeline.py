@@ -0,0 +1,56 @@
+import io
+import os
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pipeline
+from pipeline import get_pools, run_cycle, run_fetch
+from conftest import append_snapshots
+
+
+def die_once(marker, value):
+    """Kills its worker process the first time, like an OOM kill mid-fetch."""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return value * 2
+
+
+def die(marker, value):
+    os._exit(1)
+
+
+def test_run_fetch_retries_in_a_new_pool(data_dir, tmp_path):
+    restarts = pipeline.fetch_pool_restarts
+    broken, _ = get_pools()
+
+    assert asyncio.run(run_fetch(die_once, str(tmp_path / "died"), 21)) == 42
+    assert pipeline.fetch_pool_restarts == restarts + 1
+    assert get_pools()[0] is not broken
+    assert asyncio.run(run_fetch(die_once, str(tmp_path / "died"), 1)) == 2
+
+    with pytest.raises(BrokenProcessPool):  # retried once only
+        asyncio.run(run_fetch(die, str(tmp_path / "died"), 1))
+
+
+def test_cycle_after_a_worker_died(data_dir, tmp_path):
+    ts = pd.Timestamp("2030-01-01", tz="UTC")
+    for rack in (0, 2):
+        append_snapshots(data_dir, rack, [ts])
+    # a previous cycle left the pool broken
+    with pytest.raises(BrokenProcessPool):
+        get_pools()[0].submit(die, None, 0).result()
+
+    inferred = []
+
+    async def infer(ts, rack, fws, graph_payload, fetch_time, preprocess_time, serialize_time):
+        assert np.load(io.BytesIO(graph_payload["data"])).shape[0] == 4
+        inferred.append((rack, tuple(fws)))
+
+    summary = asyncio.run(run_cycle(ts, [0, 2], [[4, 6], [12]], infer))
+    assert sorted(inferred) == [(0, (4, 6)), (0, (12,)), (2, (4, 6)), (2, (12,))]
+    assert summary["racks"] == 2 and pipeline.fetch_stats.failed == 0
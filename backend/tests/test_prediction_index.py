@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from overview import thresholds_fw
+from prediction_index import PredictionIndex, PREDICTION_WINDOW
+from prediction_store import PredictionStore
+
+RACKS = [0, 2]
+FWS = [4, 6]
+
+
+def history(periods, seed=0):
+    """(ts, rack, fw, scores) rows in arrival order: one cycle per 15 minutes."""
+    rng = np.random.default_rng(seed)
+    for ts in pd.date_range("2020-05-11", periods=periods, freq="15min", tz="UTC"):
+        for rack in RACKS:
+            for fw in FWS:
+                yield str(ts), rack, fw, rng.random(4).astype(np.float32)
+
+
+def run_service(store, rows, flush_every, flush_until):
+    """A live index fed cycle by cycle like main.py: store append, index insert, rollup flush."""
+    index = PredictionIndex(thresholds_fw)
+    for i, row in enumerate(rows):
+        store.append([row])
+        index.insert(*row)
+        if i < flush_until and i % flush_every == 0:
+            store.save_rollups(*index.dirty_rollups())
+    return index
+
+
+def restart(store):
+    index = PredictionIndex(thresholds_fw)
+    index.restore(*store.load_rollups())
+    loaded = index.load(store.iter_predictions(since=index.resume_after()))
+    return index, loaded
+
+
+def assert_same(a, b):
+    for rack in RACKS:
+        for resolution in ("hourly", "daily"):
+            rollup_a, rollup_b = a.rollup(rack, resolution), b.rollup(rack, resolution)
+            assert rollup_a.keys() == rollup_b.keys()
+            for fw in rollup_a:
+                assert rollup_a[fw][0] == rollup_b[fw][0]
+                for x, y in zip(rollup_a[fw][1:], rollup_b[fw][1:]):
+                    np.testing.assert_array_equal(x, y)
+        matrix_a, matrix_b = a.matrix(rack), b.matrix(rack)
+        for fw in matrix_a:
+            assert matrix_a[fw][0] == matrix_b[fw][0]
+            np.testing.assert_array_equal(matrix_a[fw][1], matrix_b[fw][1])
+
+
+def test_restart_replays_only_the_retention_window(tmp_path):
+    periods = PREDICTION_WINDOW + 500
+    rows = list(history(periods))
+    store = PredictionStore(str(tmp_path / "predictions.sqlite"))
+    # the last flush is ~3 cycles before the end, as after a crash
+    live = run_service(store, rows, flush_every=len(RACKS) * len(FWS) * 8, flush_until=len(rows) - 20)
+
+    restarted, loaded = restart(store)
+    assert_same(live, restarted)
+    assert loaded < (PREDICTION_WINDOW + 20) * len(RACKS) * len(FWS)
+
+    # a second restart after a clean flush replays the raw window only
+    store.save_rollups(*restarted.dirty_rollups())
+    again, loaded = restart(store)
+    assert_same(live, again)
+    assert loaded == PREDICTION_WINDOW * len(RACKS) * len(FWS)
+
+
+def test_first_start_rolls_up_the_whole_history(tmp_path):
+    rows = list(history(PREDICTION_WINDOW + 100, seed=1))
+    store = PredictionStore(str(tmp_path / "predictions.sqlite"))
+    live = run_service(store, rows, flush_every=1, flush_until=0)  # rollups never saved
+
+    restarted, loaded = restart(store)
+    assert loaded == len(rows)
+    assert_same(live, restarted)
+
+
+def test_backfilled_history_is_rolled_up(tmp_path):
+    rows = list(history(PREDICTION_WINDOW + 500))
+    per_cycle = len(RACKS) * len(FWS)
+    split = 300 * per_cycle
+    store = PredictionStore(str(tmp_path / "predictions.sqlite"))
+    live = run_service(store, rows[split:], flush_every=per_cycle * 8, flush_until=len(rows))
+
+    # POST /backfill of the older history, one day per chunk and newest chunk first;
+    # it is older than everything evicted into the rollups already
+    chunk_size = 96 * per_cycle
+    for end in range(split, 0, -chunk_size):
+        chunk = rows[max(0, end - chunk_size):end]
+        store.append(chunk)
+        for row in chunk:
+            live.insert(*row)
+        live.rebuild_rollups(store.series_rows)
+        store.save_rollups(*live.dirty_rollups())
+
+    # re-scored history is not counted twice
+    for row in rows[:200]:
+        live.insert(*row)
+    live.rebuild_rollups(store.series_rows)
+    store.save_rollups(*live.dirty_rollups())
+
+    reference = PredictionIndex(thresholds_fw)
+    reference.load(iter(rows))
+    assert_same(live, reference)
+    assert_same(restart(store)[0], reference)
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import pre_process, scale_array
+
+
+def test_pre_process_memmap_frame(tmp_path):
+    # Rack-store snapshots are frames over a read-only memmap (copy=False)
+    path = tmp_path / "snapshot.npy"
+    np.save(path, np.arange(60, dtype=np.float32).reshape(20, 3))
+    snapshot = np.load(path, mmap_mode="r")
+    df = pd.DataFrame(snapshot, columns=["a", "b", "c"], copy=False)
+
+    payload = pre_process(df, "json")
+
+    x = np.array(payload["json"]["x"], dtype=np.float32)
+    assert x.shape == (20, 3)
+    np.testing.assert_allclose(x[:, 0], np.arange(20) / 19, rtol=1e-6)
+    assert snapshot[0, 0] == 0 and snapshot[-1, -1] == 59
+
+
+def test_pre_process_matches_minmax_scaler():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.random((20, 5)) * 100, columns=list("abcde"))
+    df["e"] = 7.0  # constant column scales to 0
+
+    x = np.array(pre_process(df, "json")["json"]["x"])
+    expected = (df - df.min()) / (df.max() - df.min()).replace(0, 1)
+    np.testing.assert_allclose(x, expected.to_numpy(), atol=1e-6)
+    np.testing.assert_array_equal(scale_array(df.to_numpy(dtype=np.float32, copy=True))[:, 4], 0)
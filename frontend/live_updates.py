@@ -0,0 +1,63 @@
+import time
+import requests
+import streamlit as st
+
+# The backend sends a keep-alive comment every few seconds on an idle stream
+STREAM_READ_TIMEOUT = 30
+# Polling interval when the event stream is unavailable
+FALLBACK_POLL_INTERVAL = 30
+
+
+def current_cycle():
+    """Id of the last cycle event this session has rendered (its timestamp, "timestamp:rack" in stream mode), or None."""
+    return st.session_state.get("cycle")
+
+
+def wait_for_next_cycle(backend_url):
+    """Block until the backend completes a new prediction cycle, then rerun the page.
+
+    Listens on the backend's /events stream; when the stream cannot be held
+    open it falls back to conditional GETs of /overview. Every received line,
+    keep-alives included, updates a status element: Streamlit only interrupts
+    a running script at st calls, so this lets widget interactions rerun the
+    page while it is waiting.
+    """
+    status = st.empty()
+    while True:
+        try:
+            last_event_id = current_cycle()
+            headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+            with requests.get(f"{backend_url}/events", headers=headers, stream=True, timeout=(5, STREAM_READ_TIMEOUT)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    status.caption(f"🟢 Live — last cycle `{current_cycle()}`")
+                    if line and line.startswith("id:"):
+                        on_cycle(line[3:].strip())
+        except requests.RequestException:
+            status.caption("🟡 Event stream unavailable, polling for new cycles")
+            poll_overview(backend_url)
+            time.sleep(FALLBACK_POLL_INTERVAL)
+
+
+def on_cycle(event_id):
+    seen = current_cycle()
+    st.session_state["cycle"] = event_id
+    # the first event only tells a fresh session which cycle it just rendered
+    if seen is not None and event_id != seen:
+        st.rerun()
+
+
+def poll_overview(backend_url):
+    etag = st.session_state.get("cycle_etag")
+    try:
+        response = requests.get(f"{backend_url}/overview", headers={"If-None-Match": etag} if etag else {}, timeout=5)
+        if response.status_code == 304:
+            return
+        response.raise_for_status()
+    except requests.RequestException:
+        return
+
+    st.session_state["cycle_etag"] = response.headers.get("ETag")
+    timestamp = response.json().get("timestamp")
+    if timestamp is not None:
+        on_cycle(timestamp)
@@ -5,7 +5,7 @@ import pandas as pd
 import numpy as np
 import requests
 from datetime import datetime
-from streamlit_autorefresh import st_autorefresh
+from live_updates import wait_for_next_cycle, current_cycle
 
 st.set_page_config(layout="wide", page_title="GNN Inference: Anomaly Prediction on M100 Data")
 
@@ -29,57 +29,24 @@ thresholds_fw = {
     "FW_192": 0.068205,
     "FW_288": 0.074615,
 } 
-# ------------------ Auto Refresh ------------------
-st_autorefresh(interval=5000, key="auto-refresh")
+# Time buckets of the time-series view; the backend keeps the max score per bucket
+max_points = 500
 
 # ------------------ Helper: Fetch predictions ------------------
 @st.cache_data(ttl=30)
-def fetch_predictions(rack_id):
+def fetch_matrix(rack_id, cycle=None):
+    # cycle is only part of the cache key, so a new cycle bypasses cached results
     try:
-        response = requests.get(f"{backend_url}/results/{rack_id}", timeout=5)
+        response = requests.get(
+            f"{backend_url}/results/{rack_id}/matrix",
+            params={"max_points": max_points, "agg": "max"},
+            timeout=5,
+        )
         response.raise_for_status()
         return response.json()
     except Exception as e:
         st.warning(f"Failed to fetch predictions for rack {rack_id}: {e}")
-        return []
-
-# ------------------ Helper: Infer node IDs from prediction array ------------------
-def extract_node_ids(predictions):
-    for entry in predictions:
-        prediction_array = entry.get("prediction", {}).get("prediction", [])
-        if isinstance(prediction_array, list) and prediction_array:
-            return [f"{i:02d}" for i in range(len(prediction_array))]
-            #return [f"node_{i:02d}" for i in range(len(prediction_array))]
-    return []
-
-# ------------------ Prepare parsed prediction history ------------------
-def parse_predictions(raw_data, node_ids):
-    history = {fw_id: {node_id: [] for node_id in node_ids} for fw_id in fw_ids}
-
-    if not raw_data or not isinstance(raw_data, list):
-        return history
-
-    for pred in raw_data:
-        fw = pred.get("fw")
-        timestamp = pred.get("timestamp")
-        fw_id = f"FW_{fw}"
-        if fw_id not in history:
-            continue
-        scores = pred.get("prediction", {}).get("prediction", [])
-        if len(scores) != len(node_ids):
-            continue
-
-        for i, node_id in enumerate(node_ids):
-            history[fw_id][node_id].append({
-                "timestamp": timestamp,
-                "score": scores[i]
-            })
-
-    for fw_data in history.values():
-        for series in fw_data.values():
-            series.sort(key=lambda x: x["timestamp"], reverse=True)
-
-    return history
+        return {}
 
 # ------------------ Sidebar & Layout ------------------
 st.sidebar.title("Dashboard: Rack")
@@ -89,23 +56,18 @@ st.title(f"Dashboard : Rack {selected_rack_id}")
 tab1, tab2 = st.tabs(["🔍 Anomaly Visualization", "⏱️ Inference Time"])
 
 # ------------------ Fetch & Prepare Data ------------------
-raw_predictions = fetch_predictions(selected_rack_id)
-prediction_entries = raw_predictions.get("predictions", [])
-node_ids = extract_node_ids(prediction_entries)
-history = parse_predictions(prediction_entries, node_ids)
+matrix = fetch_matrix(selected_rack_id, current_cycle())
+node_ids = matrix.get("nodes", [])
+series = {f"FW_{fw}": data for fw, data in matrix.get("fws", {}).items()}
 
 # ------------------ Tab 1: Anomaly Visualization ------------------
 with tab1:
     st.subheader("Anomaly Heatmap")
 
-    latest_scores = np.zeros((len(node_ids), len(fw_ids)), dtype=float)
+    latest_scores = np.full((len(node_ids), len(fw_ids)), np.nan)
     latest_anomaly = np.zeros((len(node_ids), len(fw_ids)), dtype=int)
 
-    all_timestamps = []
-    for fw_id in fw_ids:
-        for node_id in node_ids:
-            if history[fw_id][node_id]:
-                all_timestamps.append(history[fw_id][node_id][0]["timestamp"])
+    all_timestamps = [data["latest_timestamp"] for data in series.values()]
 
     if all_timestamps:
         latest_overall_timestamp = max(all_timestamps)
@@ -116,16 +78,10 @@ with tab1:
         st.warning("No prediction data available yet.")
 
     for fw_idx, fw_id in enumerate(fw_ids):
-        for node_idx, node_id in enumerate(node_ids):
-            time_series = history[fw_id][node_id]
-            if time_series:
-                score = time_series[0]["score"]
-                latest_scores[node_idx, fw_idx] = score
-                threshold = thresholds_fw[fw_id]
-                latest_anomaly[node_idx, fw_idx] = int(score > threshold)
-                #latest_anomaly[node_idx, fw_idx] = int(score > threshold)
-            else:
-                latest_scores[node_idx, fw_idx] = np.nan
+        if fw_id in series:
+            scores = np.asarray(series[fw_id]["latest"], dtype=float)
+            latest_scores[:len(scores), fw_idx] = scores
+            latest_anomaly[:len(scores), fw_idx] = scores > thresholds_fw[fw_id]
 
     # fig = go.Figure(data=go.Heatmap(
     #     z=latest_anomaly, #check if to change back to later_scores
@@ -203,7 +159,14 @@ with tab1:
     selected_fw = st.selectbox("Future Window", fw_ids)
     selected_node = st.selectbox("Node", node_ids)
 
-    df = pd.DataFrame(history[selected_fw][selected_node])
+    fw_series = series.get(selected_fw)
+    if fw_series and selected_node is not None:
+        df = pd.DataFrame({
+            "timestamp": fw_series["timestamps"],
+            "score": fw_series["scores"][node_ids.index(selected_node)],
+        })
+    else:
+        df = pd.DataFrame()
     if not df.empty:
         df['timestamp'] = pd.to_datetime(df['timestamp'])
         threshold = thresholds_fw[selected_fw]
@@ -232,42 +195,44 @@ with tab2:
     try:
         st.subheader("Time Metrics During Inference - Per Future Window")
 
-        url = backend_url + f"/timings/{selected_rack_id}/latest"
+        # Percentiles of every cycle since the backend started, from its /metrics histograms
+        url = backend_url + f"/timings/{selected_rack_id}/percentiles"
         response = requests.get(url)
         response.raise_for_status()
-        data = response.json()
-        timing_data = data["timings"]
-        latest_ts = data["timestamp"]  # Extract latest timestamp
+        timing_data = response.json()["timings"]
 
         if not timing_data:
             st.warning("No timing data available for the selected rack.")
         else:
-            st.markdown(f"🕒 **Current Timestamp:** `{latest_ts}`")
-            # Use the first row to get shared fetch/preprocess times
-            common_fetch_time = timing_data[0]["Data Fetch (ms)"]
-            common_preprocess_time = timing_data[0]["Preprocessing (ms)"]
-
-            st.markdown(f"**🗂️ Data Fetch Time:** {common_fetch_time} ms")
-            st.markdown(f"**⚙️ Preprocessing Time:** {common_preprocess_time} ms")
-
-            # Prepare DataFrame for Inference
             df_timing = pd.DataFrame(timing_data)
-            df_timing["FW"] = df_timing["FW"].astype(int)
-            df_timing = df_timing.sort_values("FW")
-
-            # Create FW labels like "FW_4"
-            df_timing["FW"] = df_timing["FW"].map(lambda fw: f"FW_{fw}")
-            fw_ids = df_timing["FW"].tolist()
-
-            # Prepare only inference time
-            df_inference = df_timing[["FW", "Inference (ms)"]].copy()
-            df_inference = df_inference.rename(columns={"Inference (ms)": "Time (ms)"})
+            percentile_cols = ["p50 (ms)", "p90 (ms)", "p99 (ms)"]
+
+            # Stages shared by all FWs of a request
+            df_stages = df_timing[df_timing["FW"] == "all"].set_index("Stage")
+            stage_labels = {
+                "fetch": "🗂️ Data Fetch",
+                "preprocess": "⚙️ Preprocessing",
+                "serialize": "📦 Serialization",
+                "http": "🌐 Inference Request",
+            }
+            df_stages = df_stages.loc[[stage for stage in stage_labels if stage in df_stages.index]]
+            df_stages.index = df_stages.index.map(stage_labels)
+            st.markdown(f"**Cycles observed:** {int(df_stages['count'].max()) if len(df_stages) else 0}")
+            st.dataframe(df_stages[percentile_cols], use_container_width=True)
+
+            # Per-FW GNN inference percentiles
+            df_inference = df_timing[(df_timing["Stage"] == "inference") & (df_timing["FW"] != "all")].copy()
+            df_inference["FW"] = df_inference["FW"].map(lambda fw: f"FW_{fw}")
+            fw_ids = df_inference["FW"].tolist()
+            df_inference = df_inference.melt(id_vars="FW", value_vars=percentile_cols, var_name="Percentile", value_name="Time (ms)")
 
             # Plot GNN Inference time bar chart
             fig = px.bar(
                 df_inference,
                 x="FW",
                 y="Time (ms)",
+                color="Percentile",
+                barmode="group",
                 title="🧠 GNN Inference",
                 category_orders={"FW": fw_ids}
             )
@@ -275,7 +240,6 @@ with tab2:
                 height=400,
                 xaxis_title="Future Window",
                 yaxis_title="Inference Time [ms]",
-                showlegend=False
             )
             st.plotly_chart(fig, use_container_width=True)
 
@@ -323,4 +287,8 @@ with tab2:
     #         st.plotly_chart(fig_ram, use_container_width=True)
 
     # except requests.RequestException as e:
-    #     st.error(f"Failed to fetch resource usage data: {e}")
\ No newline at end of file
+    #     st.error(f"Failed to fetch resource usage data: {e}")
+
+# ------------------ Live Updates ------------------
+# Rerun when the backend finishes the next prediction cycle
+wait_for_next_cycle(backend_url)
@@ -0,0 +1,70 @@
+from functools import lru_cache
+import torch
+
+
+class ChainAdjacency:
+    """GCN-normalized adjacency of the rack chain graph, kept as its three diagonals.
+
+    Node i is linked to i-1 and i+1 plus a self loop, so D^-1/2 (A + I) D^-1/2
+    is tridiagonal. `adj @ h` propagates h of shape (..., N, C) in O(N * C).
+    """
+
+    def __init__(self, num_nodes, device=None):
+        deg = torch.full((num_nodes,), 3.0, device=device)
+        deg[0] = deg[-1] = 2.0
+        if num_nodes == 1:
+            deg[0] = 1.0
+        deg_inv_sqrt = deg.pow(-0.5)
+        self.num_nodes = num_nodes
+        self.diag = (deg_inv_sqrt * deg_inv_sqrt).unsqueeze(-1)
+        self.off = (deg_inv_sqrt[:-1] * deg_inv_sqrt[1:]).unsqueeze(-1)
+
+    def __matmul__(self, h):
+        out = self.diag * h
+        out[..., 1:, :] += self.off * h[..., :-1, :]
+        out[..., :-1, :] += self.off * h[..., 1:, :]
+        return out
+
+    def to_dense(self):
+        return torch.diag(self.diag.squeeze(-1)) + torch.diag(self.off.squeeze(-1), 1) + torch.diag(self.off.squeeze(-1), -1)
+
+
+def gcn_norm_dense(edge_index, num_nodes, device=None):
+    """Dense D^-1/2 (A + I) D^-1/2 as computed by GCNConv's gcn_norm.
+
+    Row i aggregates from the sources of the edges pointing at node i.
+    """
+    adj = torch.zeros(num_nodes, num_nodes, device=device)
+    ones = torch.ones(edge_index.size(1), device=device)
+    adj.index_put_((edge_index[1], edge_index[0]), ones, accumulate=True)
+    # add_remaining_self_loops: a self loop only where the graph has none
+    diag = torch.diagonal(adj)
+    diag[diag == 0] = 1
+    deg_inv_sqrt = adj.sum(dim=1).pow(-0.5)
+    deg_inv_sqrt[torch.isinf(deg_inv_sqrt)] = 0
+    return deg_inv_sqrt.unsqueeze(1) * adj * deg_inv_sqrt.unsqueeze(0)
+
+
+@lru_cache(maxsize=None)
+def chain_adjacency(num_nodes, device=None):
+    return ChainAdjacency(num_nodes, device)
+
+@lru_cache(maxsize=None)
+def chain_edge_keys(num_nodes, device=None):
+    """Sorted src * N + dst keys of the chain edges, for topology comparison."""
+    src = torch.arange(num_nodes - 1, device=device)
+    keys = torch.cat([src * num_nodes + src + 1, (src + 1) * num_nodes + src])
+    return torch.sort(keys).values
+
+def is_chain(edge_index, num_nodes):
+    if edge_index.size(1) != 2 * (num_nodes - 1):
+        return False
+    keys = torch.sort(edge_index[0] * num_nodes + edge_index[1]).values
+    return torch.equal(keys, chain_edge_keys(num_nodes, edge_index.device))
+
+def resolve_adjacency(edge_index, num_nodes, device=None):
+    """Normalized adjacency for a request: cached for the chain topology or when
+    edge_index is omitted, computed per request for any other graph."""
+    if edge_index is None or is_chain(edge_index, num_nodes):
+        return chain_adjacency(num_nodes, device)
+    return gcn_norm_dense(edge_index, num_nodes, device)
@@ -0,0 +1,69 @@
+"""Throughput of /predict/{model_id}/batch against T single-snapshot requests.
+
+Usage (inside the gnn_inference container):
+    python bench_batch.py [--sizes 1 4 16 64 256] [--nodes 20] [--repeat 5]
+
+For each batch size T, sends T snapshots of one rack as T requests to
+/predict/{model_id} and as one .npy request to /predict/{model_id}/batch
+(in-process, all horizons), and reports snapshots per second of both.
+"""
+import io
+import time
+import logging
+import argparse
+import numpy as np
+from fastapi.testclient import TestClient
+
+import model_serve_app
+from model_serve_app import app, MAX_BATCH
+from wire import NPY_CONTENT_TYPE
+
+
+def encode_npy(x):
+    buf = io.BytesIO()
+    np.save(buf, x)
+    return buf.getvalue()
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return np.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1, 4, 16, 64, 256])
+    parser.add_argument("--nodes", type=int, default=20)
+    parser.add_argument("--features", type=int, default=417)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rack = next(iter(model_serve_app.models)).split("_")[1]
+    client = TestClient(app)
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one log line per request otherwise
+    headers = {"Content-Type": NPY_CONTENT_TYPE}
+    rng = np.random.default_rng(0)
+
+    print(f"MAX_BATCH={MAX_BATCH}")
+    print(f"{'T':>5} {'single snap/s':>14} {'batch snap/s':>13} {'speedup':>8}")
+    for size in args.sizes:
+        x = rng.random((size, args.nodes, args.features), dtype=np.float32)
+        singles = [encode_npy(snapshot) for snapshot in x]
+        batch = encode_npy(x)
+
+        def run_singles():
+            for body in singles:
+                client.post(f"/predict/{rack}", content=body, headers=headers).raise_for_status()
+
+        def run_batch():
+            client.post(f"/predict/{rack}/batch", content=batch, headers=headers).raise_for_status()
+
+        run_batch()  # warm-up: builds the rack's fused stack
+        single_rate = size / timed(run_singles, args.repeat)
+        batch_rate = size / timed(run_batch, args.repeat)
+        print(f"{size:>5} {single_rate:>14.1f} {batch_rate:>13.1f} {batch_rate / single_rate:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
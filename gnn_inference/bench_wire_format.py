@@ -0,0 +1,60 @@
+"""Compare the JSON and .npy request paths of /predict/{model_id}.
+
+Usage (inside the gnn_inference container):
+    python bench_wire_format.py [--nodes 20] [--features 417] [--repeat 200]
+
+Reports payload size, client-side encode time, server-side decode/tensorize
+time (parse_graph) and the end-to-end in-process request time.
+"""
+import io
+import json
+import time
+import argparse
+import numpy as np
+from fastapi.testclient import TestClient
+
+import model_serve_app
+from model_serve_app import app, parse_graph, MultiHorizonInput
+from wire import NPY_CONTENT_TYPE
+
+
+def encode_json(x):
+    return json.dumps({"x": x.tolist()}).encode(), "application/json"
+
+def encode_npy(x):
+    buf = io.BytesIO()
+    np.save(buf, x)
+    return buf.getvalue(), NPY_CONTENT_TYPE
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return np.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=20)
+    parser.add_argument("--features", type=int, default=417)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rack = next(iter(model_serve_app.models)).split("_")[1]
+    client = TestClient(app)
+    x = np.random.default_rng(0).random((args.nodes, args.features), dtype=np.float32)
+
+    print(f"{'format':<6} {'bytes':>9} {'encode ms':>10} {'decode ms':>10} {'request ms':>11}")
+    for name, encode in (("json", encode_json), ("npy", encode_npy)):
+        body, content_type = encode(x)
+        encode_ms = timed(lambda: encode(x), args.repeat)
+        decode_ms = timed(lambda: parse_graph(body, content_type, MultiHorizonInput), args.repeat)
+        request_ms = timed(
+            lambda: client.post(f"/predict/{rack}", content=body, headers={"Content-Type": content_type}).raise_for_status(),
+            args.repeat,
+        )
+        print(f"{name:<6} {len(body):>9} {encode_ms:>10.3f} {decode_ms:>10.3f} {request_ms:>11.3f}")
+
+if __name__ == "__main__":
+    main()
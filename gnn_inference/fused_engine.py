@@ -0,0 +1,214 @@
+import os
+import threading
+from collections import OrderedDict
+import torch
+from adjacency import chain_adjacency
+
+fw_values = [4, 6, 12, 24, 32, 64, 96, 192, 288]
+
+# Number of fused weight stacks (per rack, or per cluster request) kept in memory;
+# their bytes also count against the registry's MODEL_CACHE_MAX_MB
+FUSED_CACHE_SIZE = int(os.environ.get("FUSED_CACHE_SIZE", 64))
+
+
+class FusedGCN:
+    """Weights of many anomaly_anticipation models stacked along a model axis.
+
+    Evaluates M models with a handful of batched matmuls instead of M
+    separate forward passes. Layer k weights are stored as (M, in, out).
+    """
+
+    def __init__(self, states):
+        with torch.no_grad():
+            self.w1 = torch.stack([sd["conv1.lin.weight"].t() for sd in states]).contiguous()
+            self.b1 = torch.stack([sd["conv1.bias"] for sd in states]).unsqueeze(1)
+            self.w2 = torch.stack([sd["conv2.lin.weight"].t() for sd in states]).contiguous()
+            self.b2 = torch.stack([sd["conv2.bias"] for sd in states]).unsqueeze(1)
+            self.w3 = torch.stack([sd["conv3.lin.weight"].t() for sd in states]).contiguous()
+            self.b3 = torch.stack([sd["conv3.bias"] for sd in states]).unsqueeze(1)
+            self.w4 = torch.stack([sd["fc1.weight"].t() for sd in states]).contiguous()
+            self.b4 = torch.stack([sd["fc1.bias"] for sd in states]).unsqueeze(1)
+            self.w5 = torch.stack([sd["fc2.weight"].t() for sd in states]).contiguous()
+            self.b5 = torch.stack([sd["fc2.bias"] for sd in states]).unsqueeze(1)
+
+    def nbytes(self):
+        return sum(t.numel() * t.element_size() for t in self.params())
+
+    def params(self, index=None):
+        names = ("w1", "b1", "w2", "b2", "w3", "b3", "w4", "b4", "w5", "b5")
+        if index is None:
+            return [getattr(self, name) for name in names]
+        if isinstance(index, slice):
+            return [getattr(self, name)[index] for name in names]
+        return [getattr(self, name).index_select(0, index) for name in names]
+
+    @torch.no_grad()
+    def forward(self, x, adj, index=None):
+        """Logits of shape (M, N) for the models selected by `index`.
+
+        x is (N, F) when every model sees the same graph or (M, N, F) for one
+        graph per model; adj is the normalized adjacency (see adjacency.py).
+        """
+        w1, b1, w2, b2, w3, b3, w4, b4, w5, b5 = self.params(index)
+        h = torch.relu(adj @ torch.matmul(x, w1) + b1)
+        h = torch.relu(adj @ torch.matmul(h, w2) + b2)
+        h = torch.relu(adj @ torch.matmul(h, w3) + b3)
+        h = torch.matmul(h, w4) + b4
+        h = torch.matmul(h, w5) + b5
+        return h.squeeze(-1)
+
+    @torch.no_grad()
+    def forward_snapshots(self, x, adj, index=None):
+        """Logits of shape (M, T, N) for T snapshots x of shape (T, N, F) of one graph.
+
+        The T snapshots form a disjoint union of identical graphs, so the
+        block-diagonal propagation is `adj` applied to each snapshot along the
+        batch dimension; the linear maps run once over all T * N rows.
+        """
+        w1, b1, w2, b2, w3, b3, w4, b4, w5, b5 = self.params(index)
+        T, N, _ = x.shape
+        M = w1.size(0)
+        h = torch.relu(adj @ torch.matmul(x.reshape(T * N, -1), w1).view(M, T, N, -1) + b1.unsqueeze(1))
+        h = torch.relu(adj @ torch.matmul(h.view(M, T * N, -1), w2).view(M, T, N, -1) + b2.unsqueeze(1))
+        h = torch.relu(adj @ torch.matmul(h.view(M, T * N, -1), w3).view(M, T, N, -1) + b3.unsqueeze(1))
+        h = torch.matmul(h.view(M, T * N, -1), w4) + b4
+        h = torch.matmul(h, w5) + b5
+        return h.view(M, T, N)
+
+
+class FusedStack:
+    """FusedGCN over the models of some racks, rack-major.
+
+    A rack's horizons are contiguous in the stack, so the rack or the whole
+    stack evaluates on views of the stacked weights without copying.
+    """
+
+    def __init__(self, racks, registry):
+        self.keys = []
+        self.rack_slices = {}
+        for rack in racks:
+            start = len(self.keys)
+            self.keys += [(rack, fw) for fw in fw_values if f"{fw}/rack_{rack}" in registry]
+            self.rack_slices[rack] = slice(start, len(self.keys))
+        self.position = {key: i for i, key in enumerate(self.keys)}
+        # checkpoints are read straight into the stack, bypassing the module cache
+        self.gcn = FusedGCN([registry.load_state(f"{fw}/rack_{rack}") for rack, fw in self.keys])
+
+    def select(self, fws, device):
+        """Stack index restricted to `fws`, and its keys."""
+        keys = [key for key in self.keys if fws is None or key[1] in fws]
+        positions = [self.position[key] for key in keys]
+        if positions and positions == list(range(positions[0], positions[-1] + 1)):
+            return slice(positions[0], positions[-1] + 1), keys
+        return torch.tensor(positions, device=device), keys
+
+
+class FusedEngine:
+    """Lazily built FusedStacks, one per requested rack set, kept in a small LRU.
+
+    Single-rack requests use a per-rack stack; a cluster request builds (once)
+    a stack over all of its racks so it runs as a few kernel calls. Stacks
+    share the registry's byte budget with its cached models: the least
+    recently used ones are dropped while the two together exceed it.
+    """
+
+    def __init__(self, registry, device, max_stacks=FUSED_CACHE_SIZE):
+        self.registry = registry
+        self.device = device
+        self.max_stacks = max_stacks
+        self.stacks = OrderedDict()  # tuple of racks -> FusedStack
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get_stack(self, racks):
+        key = tuple(racks)
+        with self._lock:
+            stack = self.stacks.get(key)
+            if stack is None:
+                stack = FusedStack(racks, self.registry)
+                self.stacks[key] = stack
+                self.registry.add_fused_bytes(stack.gcn.nbytes())
+                self.evict()
+            self.stacks.move_to_end(key)
+            return stack
+
+    def evict(self):
+        # never evict the stack that was just inserted
+        while len(self.stacks) > 1 and (len(self.stacks) > self.max_stacks or self.registry.over_budget()):
+            _, stack = self.stacks.popitem(last=False)
+            self.registry.add_fused_bytes(-stack.gcn.nbytes())
+            self.evictions += 1
+
+    def predict(self, rack, x, adj, fws=None):
+        """Sigmoid scores {fw: (N,)} of one rack graph for all or some horizons."""
+        return self.predict_many({rack: x}, adj, fws)[rack]
+
+    def predict_many(self, graphs, adj, fws=None):
+        """Sigmoid scores {rack: {fw: (N,)}} for racks sharing one topology."""
+        racks = list(graphs)
+        stack = self.get_stack(racks)
+        index, keys = stack.select(fws, self.device)
+        if len(racks) == 1:
+            # one graph: broadcast it against every selected model
+            x = graphs[racks[0]]
+        else:
+            counts = [sum(1 for key in keys if key[0] == rack) for rack in racks]
+            x = torch.cat([graphs[rack].unsqueeze(0).expand(count, -1, -1) for rack, count in zip(racks, counts)])
+
+        scores = torch.sigmoid(stack.gcn.forward(x, adj, index))
+        results = {rack: {} for rack in racks}
+        for (rack, fw), row in zip(keys, scores):
+            results[rack][fw] = row
+        return results
+
+    def predict_batch(self, rack, x, adj, fws=None):
+        """Sigmoid scores {fw: (T, N)} of T snapshots x of shape (T, N, F) of one rack."""
+        stack = self.get_stack([rack])
+        index, keys = stack.select(fws, self.device)
+        scores = torch.sigmoid(stack.gcn.forward_snapshots(x, adj, index))
+        return {fw: row for (_, fw), row in zip(keys, scores)}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "stacks": len(self.stacks),
+                "max_stacks": self.max_stacks,
+                "models": sum(len(stack.keys) for stack in self.stacks.values()),
+                "mb": round(sum(stack.gcn.nbytes() for stack in self.stacks.values()) / (1024 * 1024), 2),
+                "evictions": self.evictions,
+            }
+
+
+def check_equivalence(engine, racks, num_nodes=20, atol=1e-5):
+    """Max |fused - per-module| sigmoid score over the models of `racks` on random chain graphs.
+
+    Each rack gets its own input, so the cluster path is checked to pair every
+    rack with its own graph. The per-module reference runs GCNConv on an
+    explicit edge_index, so this also checks the cached tridiagonal adjacency
+    against gcn_norm.
+    """
+    from torch_geometric.utils import to_undirected
+
+    registry = engine.registry
+    graphs = {rack: torch.rand(num_nodes, 417, device=engine.device) for rack in racks}
+    chain = torch.stack([torch.arange(num_nodes - 1), torch.arange(1, num_nodes)])
+    edge_index = to_undirected(chain).to(engine.device)
+    adj = chain_adjacency(num_nodes, engine.device)
+
+    fused = engine.predict_many(graphs, adj)
+    max_diff = 0.0
+    with torch.no_grad():
+        for rack in racks:
+            for fw, score in fused[rack].items():
+                expected = torch.sigmoid(registry.get(f"{fw}/rack_{rack}")(graphs[rack], edge_index)).squeeze(-1)
+                max_diff = max(max_diff, (score - expected).abs().max().item())
+    return max_diff, max_diff <= atol
+
+
+if __name__ == "__main__":
+    from load_models import ModelRegistry, rack_ids, device
+
+    registry = ModelRegistry()
+    engine = FusedEngine(registry, device)
+    max_diff, ok = check_equivalence(engine, rack_ids)
+    print(f"{len(registry)} models fused, max |fused - module| = {max_diff:.3e} -> {'OK' if ok else 'MISMATCH'}")
@@ -1,15 +1,29 @@
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 import torch
 from model import anomaly_anticipation
+from model_bundle import ModelBundle
+from exec_modes import optimize, INFERENCE_MODE
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 rack_ids = [0,2,8,9,10]
 #rack_ids = [0, 2, 8, 9, 10, 11, 12, 14, 15, 16, 17, 18, 22, 24, 25, 26, 28, 29, 30, 32, 33, 34, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48]
+fw_values = [4,6,12,24,32,64,96,192,288]
+
+# Model cache budget, shared with the fused weight stacks: 0 disables the corresponding limit
+MODEL_CACHE_MAX_MODELS = int(os.environ.get("MODEL_CACHE_MAX_MODELS", 0))
+MODEL_CACHE_MAX_MB = float(os.environ.get("MODEL_CACHE_MAX_MB", 0))
+# Warm set loaded at startup: "" (none), "all", or a comma-separated list of FWs
+MODEL_PRELOAD = os.environ.get("MODEL_PRELOAD", "")
+# Bundle written by pack_models.py; used instead of the .pth files when present
+MODEL_BUNDLE = os.environ.get("MODEL_BUNDLE", "/app/GNN_models/models.bundle")
 
 def load_all_models(base_dir = "/app/GNN_models"):
     models = {}
-    for fw in [4,6,12,24,32,64,96,192,288]:
+    for fw in fw_values:
         for i in rack_ids:
             model_path = os.path.join(base_dir, f"FW_{fw}/{i}_{fw}.pth")
             if os.path.exists(model_path):
@@ -18,4 +32,172 @@ def load_all_models(base_dir = "/app/GNN_models"):
                 model.to(device)
                 model.eval()
                 models[f"{fw}/rack_{i}"] = model
-    return models, device
\ No newline at end of file
+    return models, device
+
+def file_identity(path):
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def model_bytes(model):
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+
+class ModelRegistry:
+    """Lazily loaded `{fw}/rack_{i}` models kept under an LRU count/memory budget.
+
+    Behaves like the dict returned by load_all_models for `key in registry`,
+    `registry.get(key)` and iteration over available keys, but a checkpoint is
+    only read when its model is first requested. With a model bundle the
+    weights are zero-copy views of the memory-mapped file instead.
+
+    The byte budget also covers the FusedEngine's weight stacks, which report
+    their size through add_fused_bytes(). Models are built outside the
+    registry lock, so a slow load never blocks requests for other models;
+    concurrent misses on the same key share one build.
+    """
+
+    def __init__(self, base_dir="/app/GNN_models", max_models=MODEL_CACHE_MAX_MODELS, max_mb=MODEL_CACHE_MAX_MB, bundle_path=MODEL_BUNDLE):
+        self.base_dir = base_dir
+        self.max_models = max_models
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.bundle = ModelBundle(bundle_path) if bundle_path and os.path.exists(bundle_path) else None
+        self.paths = {}  # key -> checkpoint path, None when served from the bundle
+        self.identities = {}  # key -> string that changes whenever the weights file changes
+        for fw in fw_values:
+            for i in rack_ids:
+                key = f"{fw}/rack_{i}"
+                model_path = os.path.join(base_dir, f"FW_{fw}/{i}_{fw}.pth")
+                if self.bundle is not None:
+                    if key in self.bundle:
+                        self.paths[key] = None
+                        self.identities[key] = f"{key}@{file_identity(bundle_path)}"
+                elif os.path.exists(model_path):
+                    self.paths[key] = model_path
+                    self.identities[key] = f"{key}@{file_identity(model_path)}"
+
+        self.cache = OrderedDict()  # key -> model, least recently used first
+        self.cache_bytes = 0
+        self.fused_bytes = 0  # held by FusedEngine stacks
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._building = {}  # key -> Future of the model being built
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, key):
+        model = self.get(key)
+        if model is None:
+            raise KeyError(key)
+        return model
+
+    def identity(self, key):
+        """Model key plus the size and mtime of its weights file, for cache keys."""
+        return self.identities[key]
+
+    def load_state(self, key):
+        """State dict of a checkpoint, without caching."""
+        if self.bundle is not None:
+            return self.bundle.state(key)
+        return torch.load(self.paths[key], map_location=device)
+
+    def build(self, key):
+        if self.bundle is not None:
+            # skip weight initialization and adopt the mapped tensors as parameters
+            with torch.device("meta"):
+                model = anomaly_anticipation(417, 16)
+            model.load_state_dict(self.bundle.state(key), assign=True)
+        else:
+            model = anomaly_anticipation(417, 16)
+            model.load_state_dict(self.load_state(key))
+        model.to(device)
+        model.eval()
+        return optimize(model, key)
+
+    def get(self, key, default=None):
+        if key not in self.paths:
+            return default
+
+        with self._lock:
+            model = self.cache.get(key)
+            if model is not None:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                return model
+
+            building = self._building.get(key)
+            if building is None:
+                self.misses += 1
+                future = self._building[key] = Future()
+        if building is not None:
+            return building.result()
+
+        try:
+            model = self.build(key)
+        except BaseException as e:
+            with self._lock:
+                del self._building[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._building[key]
+            self.cache[key] = model
+            self.cache_bytes += model_bytes(model)
+            self.evict()
+        future.set_result(model)
+        return model
+
+    def evict(self):
+        # never evict the model that was just inserted
+        while len(self.cache) > 1 and (
+            (self.max_models and len(self.cache) > self.max_models) or self.over_budget()
+        ):
+            _, model = self.cache.popitem(last=False)
+            self.cache_bytes -= model_bytes(model)
+            self.evictions += 1
+
+    def over_budget(self):
+        """Whether cached models and fused stacks together exceed the byte budget."""
+        return bool(self.max_bytes) and self.cache_bytes + self.fused_bytes > self.max_bytes
+
+    def add_fused_bytes(self, nbytes):
+        """Account fused stacks built (nbytes > 0) or dropped (nbytes < 0) against the byte budget."""
+        with self._lock:
+            self.fused_bytes += nbytes
+            if nbytes > 0:
+                self.evict()
+
+    def preload(self, spec=MODEL_PRELOAD):
+        if not spec:
+            return
+        fws = fw_values if spec == "all" else [int(fw) for fw in spec.split(",")]
+        for key in self.paths:
+            if int(key.split("/")[0]) in fws:
+                self.get(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "source": self.bundle.path if self.bundle is not None else self.base_dir,
+                "mode": INFERENCE_MODE,
+                "available": len(self.paths),
+                "loaded": len(self.cache),
+                "loaded_mb": round(self.cache_bytes / (1024 * 1024), 2),
+                "fused_mb": round(self.fused_bytes / (1024 * 1024), 2),
+                # what max_mb bounds
+                "total_mb": round((self.cache_bytes + self.fused_bytes) / (1024 * 1024), 2),
+                "max_models": self.max_models,
+                "max_mb": self.max_bytes / (1024 * 1024),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,51 @@
+from prometheus_client import Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from fastapi import Response
+
+# Bucket upper bounds (s) from a sub-millisecond fused forward to a cold model load
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# tensorize: body -> tensor (fw="all"); forward: per-FW model time, the amortized
+# share of a fused pass; batch_forward: a whole batch request (fw="all")
+STAGE_SECONDS = Histogram(
+    "inference_stage_seconds", "Latency of one inference service stage", ["stage", "rack", "fw"], buckets=LATENCY_BUCKETS
+)
+PREDICTIONS = Counter("inference_predictions", "Per-FW predictions served", ["rack", "fw", "cached"])
+
+
+def observe_stage(stage, rack, ms, fw="all"):
+    STAGE_SECONDS.labels(stage=stage, rack=str(rack), fw=str(fw)).observe(ms / 1000)
+
+
+class StatsCollector:
+    """Exposes the numeric leaves of a stats() dict as gauges at scrape time.
+
+    {"registry": {"hits": 3}} becomes <prefix>_registry_hits; booleans,
+    strings and None are skipped.
+    """
+
+    def __init__(self, prefix, stats):
+        self.prefix = prefix
+        self.stats = stats
+
+    def collect(self):
+        for name, value in flatten(self.prefix, self.stats()):
+            yield GaugeMetricFamily(name, f"{name} from the service's stats", value=value)
+
+
+def flatten(prefix, stats):
+    for key, value in stats.items():
+        name = f"{prefix}_{key}".replace("+", "_").replace("-", "_").replace(" ", "_")
+        if isinstance(value, dict):
+            yield from flatten(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def register_stats(prefix, stats):
+    REGISTRY.register(StatsCollector(prefix, stats))
+
+
+def metrics_response():
+    """Prometheus text exposition of every metric, including process RSS and CPU."""
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
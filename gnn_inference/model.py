@@ -11,10 +11,20 @@ class anomaly_anticipation(nn.Module):
         self.fc1 = nn.Linear(out_channels, 16)
         self.fc2 = nn.Linear(16, 1)
         
-    def forward(self, x, edge_index):
-        x = self.conv1(x, edge_index).relu()
-        x = self.conv2(x, edge_index).relu()
-        x = self.conv3(x, edge_index).relu()                
+    def forward(self, x, edge_index=None, adj=None):
+        # adj: pre-normalized adjacency (see adjacency.py), skips GCNConv's per-call gcn_norm
+        if adj is not None:
+            x = self.propagate(self.conv1, x, adj).relu()
+            x = self.propagate(self.conv2, x, adj).relu()
+            x = self.propagate(self.conv3, x, adj).relu()
+        else:
+            x = self.conv1(x, edge_index).relu()
+            x = self.conv2(x, edge_index).relu()
+            x = self.conv3(x, edge_index).relu()                
         x = self.fc1(x)
         x = self.fc2(x)
         return x
+
+    @staticmethod
+    def propagate(conv, x, adj):
+        return adj @ conv.lin(x) + conv.bias
@@ -0,0 +1,80 @@
+import json
+import mmap
+import struct
+import warnings
+import torch
+
+# safetensors layout: u64 little-endian header size, JSON header, raw tensor data.
+# Tensor names are "{fw}/rack_{i}/{state_dict key}", so every (rack, FW) model
+# is addressable through the header without reading the data section.
+DTYPES = {torch.float32: "F32", torch.float16: "F16", torch.int64: "I64"}
+TORCH_DTYPES = {name: dtype for dtype, name in DTYPES.items()}
+
+
+def write_bundle(path, states, metadata=None):
+    """Write {model key: state dict} into one safetensors-compatible file."""
+    header = {}
+    tensors = []
+    offset = 0
+    for key, state in states.items():
+        for name, tensor in state.items():
+            tensor = tensor.detach().cpu().contiguous()
+            size = tensor.numel() * tensor.element_size()
+            header[f"{key}/{name}"] = {
+                "dtype": DTYPES[tensor.dtype],
+                "shape": list(tensor.shape),
+                "data_offsets": [offset, offset + size],
+            }
+            tensors.append(tensor)
+            offset += size
+    header["__metadata__"] = {k: str(v) for k, v in (metadata or {}).items()}
+
+    header_bytes = json.dumps(header).encode()
+    # pad so the data section starts 8-byte aligned
+    header_bytes += b" " * (-(8 + len(header_bytes)) % 8)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for tensor in tensors:
+            f.write(tensor.numpy().tobytes())
+
+
+class ModelBundle:
+    """Memory-mapped bundle; state dicts are zero-copy views of the file pages.
+
+    The mapping is read-only and shared, so every worker process serving from
+    the same bundle uses the same physical pages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (header_size,) = struct.unpack("<Q", self.mm[:8])
+        header = json.loads(self.mm[8:8 + header_size])
+        self.metadata = header.pop("__metadata__", {})
+        self.data_start = 8 + header_size
+
+        self.entries = {}  # model key -> {state dict key: header entry}
+        for name, entry in header.items():
+            fw, rack, param = name.split("/", 2)
+            self.entries.setdefault(f"{fw}/{rack}", {})[param] = entry
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def keys(self):
+        return self.entries.keys()
+
+    def state(self, key):
+        state = {}
+        with warnings.catch_warnings():
+            # read-only mapping: the views are never written to
+            warnings.simplefilter("ignore", UserWarning)
+            for name, entry in self.entries[key].items():
+                begin, end = entry["data_offsets"]
+                dtype = TORCH_DTYPES[entry["dtype"]]
+                count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+                tensor = torch.frombuffer(self.mm, dtype=dtype, offset=self.data_start + begin, count=count)
+                state[name] = tensor.view(entry["shape"])
+        return state
@@ -1,35 +1,370 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from typing import Optional
+import os
+import time
+import logging
 import torch
-from torch_geometric.data import Data
-from load_models import load_all_models
+from load_models import ModelRegistry, device
+from fused_engine import FusedEngine, check_equivalence, fw_values
+from adjacency import resolve_adjacency, ChainAdjacency
+from exec_modes import INFERENCE_MODE
+from result_cache import ResultCache, input_digest
+from wire import NPY_CONTENT_TYPE, decode_npy
+from metrics import PREDICTIONS, observe_stage, register_stats, metrics_response
+from profiling import RequestProfiler
 
-models, device = load_all_models()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+logger = logging.getLogger(__name__)
+
+# "fused" evaluates all horizons of a rack in one stacked pass, "module" runs each model separately.
+# The fused engine is fp32 eager only, so any other INFERENCE_MODE serves through "module"
+INFERENCE_ENGINE = os.environ.get("INFERENCE_ENGINE", "fused" if INFERENCE_MODE == "eager" else "module")
+if INFERENCE_ENGINE == "fused" and INFERENCE_MODE != "eager":
+    raise RuntimeError(
+        f"INFERENCE_MODE={INFERENCE_MODE} is not applied by INFERENCE_ENGINE=fused; "
+        "use INFERENCE_ENGINE=module or INFERENCE_MODE=eager"
+    )
+# Snapshots evaluated per forward pass of a batch request; larger batches are split
+MAX_BATCH = int(os.environ.get("MAX_BATCH", 64))
+
+# Models are loaded on first use; `models` keeps the dict-like interface of load_all_models
+models = ModelRegistry()
+models.preload()
 app = FastAPI()
 
+engine = None
+if INFERENCE_ENGINE == "fused" and len(models):
+    engine = FusedEngine(models, device)
+    # verify on one rack only, the other checkpoints stay unloaded until requested
+    probe_rack = int(next(iter(models)).split("_")[1])
+    max_diff, ok = check_equivalence(engine, [probe_rack])
+    if ok:
+        logger.info(f"Fused engine ready (max deviation {max_diff:.2e} on rack {probe_rack})")
+    else:
+        logger.warning(f"Fused engine deviates from the per-model path by {max_diff:.2e}, falling back to per-model inference")
+        engine = None
+
+# Scores of previously seen (input, model) pairs, persisted across restarts
+result_cache = ResultCache()
+
+# torch.profiler over the next N requests, armed through POST /admin/profile
+profiler = RequestProfiler()
+
+def run_profiled(name, fn, *args):
+    with profiler.request(name):
+        return fn(*args)
+
 class GraphInput(BaseModel):
     x: list[list[float]]
-    edge_index: list[list[int]]
+    edge_index: Optional[list[list[int]]] = None  # None: cached rack chain topology
+
+class MultiHorizonInput(GraphInput):
+    fws: Optional[list[int]] = None  # None runs every future window with a model
+
+class BatchInput(BaseModel):
+    x: list[list[list[float]]]  # snapshots x nodes x features
+    edge_index: Optional[list[list[int]]] = None
+    fws: Optional[list[int]] = None
+
+class ClusterInput(BaseModel):
+    graphs: dict[int, GraphInput]
+    fws: Optional[list[int]] = None
+
+def to_edge_index(edge_index):
+    if edge_index is None:
+        return None
+    return torch.tensor(edge_index, dtype=torch.long).to(device)
+
+def check_features(x, ndim):
+    """ValueError unless x has `ndim` dimensions and at least one element."""
+    if x.dim() != ndim:
+        raise ValueError(f"expected a {ndim}-d array, got shape {tuple(x.shape)}")
+    if x.numel() == 0:
+        raise ValueError(f"empty x of shape {tuple(x.shape)}")
+    return x
+
+def tensorize(rows, ndim=2):
+    """x of a JSON body as a float tensor; ValueError if it is ragged or empty."""
+    return check_features(torch.tensor(rows, dtype=torch.float), ndim).to(device)
+
+def parse_graph(body, content_type, schema, ndim=2):
+    """(x, edge_index, parsed JSON body) from a .npy or JSON request body.
+
+    .npy bodies are wrapped with torch.frombuffer and always use the cached
+    chain topology; JSON bodies go through pydantic validation. Malformed,
+    ragged or empty inputs are rejected with 422.
+    """
+    try:
+        if content_type.startswith(NPY_CONTENT_TYPE):
+            with profiler.scope("decode_npy"):
+                x = check_features(decode_npy(body), ndim).to(device)
+            return x, None, None
+        with profiler.scope("pydantic_validation"):
+            graph_input = schema.model_validate_json(body)
+        with profiler.scope("tensorize_json"):
+            x = tensorize(graph_input.x, ndim)
+            edge_index = to_edge_index(graph_input.edge_index)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid graph payload: {e}")
+    return x, edge_index, graph_input
+
+def adjacency_id(adj):
+    if isinstance(adj, ChainAdjacency):
+        return "chain"
+    return input_digest(adj, "dense")
+
+def model_identity(model_id, fw, engine_kind):
+    """Everything besides the input that determines a model's scores."""
+    return f"{models.identity(f'{fw}/rack_{model_id}')}|{INFERENCE_MODE}|{engine_kind}"
+
+def resolve_fws(model_id, fws):
+    if fws is None:
+        return [fw for fw in fw_values if f"{fw}/rack_{model_id}" in models]
+
+    missing = [f"{fw}/rack_{model_id}" for fw in fws if f"{fw}/rack_{model_id}" not in models]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Models {missing} not found")
+    return fws
+
+# Declared before /predict/{fw}/{model_id} so "batch" is not parsed as a rack id
+@app.post("/predict/{model_id}/batch")
+async def predict_batch(model_id: int, request: Request, fws: Optional[list[int]] = Query(None)):
+    body = await request.body()
+    return await run_in_threadpool(run_profiled, "predict_batch", run_batch, model_id, body, request.headers.get("content-type", ""), fws)
+
+def run_batch(model_id, body, content_type, fws):
+    """Scores of T snapshots (T x nodes x features) of one rack for all or some horizons.
+
+    Snapshots are evaluated MAX_BATCH at a time as one disjoint-union graph
+    sharing the rack adjacency; predictions are T x nodes per FW.
+    """
+    start_tensorize = time.perf_counter()
+    x, edge_index, graph_input = parse_graph(body, content_type, BatchInput, ndim=3)
+    tensorize_time = (time.perf_counter() - start_tensorize) * 1000  # ms
+
+    if fws is None and graph_input is not None:
+        fws = graph_input.fws
+    fws = resolve_fws(model_id, fws)
+    if not fws:
+        raise HTTPException(status_code=404, detail=f"No models found for rack {model_id}")
+
+    try:
+        adj = resolve_adjacency(edge_index, x.size(1), device)
+
+        chunks = {fw: [] for fw in fws}
+        start_forward = time.perf_counter()
+        for start in range(0, x.size(0), MAX_BATCH):
+            batch = x[start:start + MAX_BATCH]
+            with profiler.scope("anomaly_anticipation.forward"):
+                if engine is not None:
+                    scores = engine.predict_batch(model_id, batch, adj, fws)
+                else:
+                    with torch.no_grad():
+                        scores = {fw: torch.sigmoid(models[f"{fw}/rack_{model_id}"](batch, adj=adj)).squeeze(-1) for fw in fws}
+            for fw in fws:
+                chunks[fw].append(scores[fw])
+        forward_time = (time.perf_counter() - start_forward) * 1000  # ms
+        observe_stage("tensorize", model_id, tensorize_time)
+        observe_stage("batch_forward", model_id, forward_time)
+
+        return {
+            "rack": model_id,
+            "snapshots": x.size(0),
+            "predictions": {fw: torch.cat(chunks[fw]).tolist() for fw in fws},
+            "forward_ms": forward_time,
+            "tensorize_ms": tensorize_time,
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
 
 @app.post("/predict/{fw}/{model_id}")
-def predict(fw: int, model_id: int, graph_input: GraphInput):
+async def predict(fw: int, model_id: int, request: Request):
+    body = await request.body()
+    return await run_in_threadpool(run_profiled, "predict_single", run_single, fw, model_id, body, request.headers.get("content-type", ""))
+
+def run_single(fw, model_id, body, content_type):
     key = f"{fw}/rack_{model_id}"
     model = models.get(key)
 
     if not model:
         raise HTTPException(status_code=404, detail=f"Model {key} not found")
 
+    # Move data to the right device
+    start_tensorize = time.perf_counter()
+    x, edge_index, _ = parse_graph(body, content_type, GraphInput)
+    observe_stage("tensorize", model_id, (time.perf_counter() - start_tensorize) * 1000)
+
     try:
-        # Move data to the right device
-        x = torch.tensor(graph_input.x, dtype=torch.float).to(device)
-        edge_index = torch.tensor(graph_input.edge_index, dtype=torch.long).to(device)
-        data = Data(x=x, edge_index=edge_index)
+        adj = resolve_adjacency(edge_index, x.size(0), device)
+        cache_key = result_cache.key(input_digest(x, adjacency_id(adj)), model_identity(model_id, fw, "module"))
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            PREDICTIONS.labels(rack=str(model_id), fw=str(fw), cached="true").inc()
+            return {"prediction": cached, "cached": True}
 
-        with torch.no_grad():
-            out = model(data.x, data.edge_index)
+        start_forward = time.perf_counter()
+        with torch.no_grad(), profiler.scope("anomaly_anticipation.forward"):
+            out = model(x, adj=adj)
             pred = torch.sigmoid(out)
+        observe_stage("forward", model_id, (time.perf_counter() - start_forward) * 1000, fw)
+        PREDICTIONS.labels(rack=str(model_id), fw=str(fw), cached="false").inc()
+
+        scores = pred.squeeze().tolist()
+        result_cache.put_many({cache_key: scores})
+        return {"prediction": scores, "cached": False}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+
+# Declared before /predict/{model_id} so "cluster" is not parsed as a rack id
+@app.post("/predict/cluster")
+def predict_cluster(cluster_input: ClusterInput):
+    with profiler.request("predict_cluster"):
+        return run_cluster(cluster_input)
+
+def run_cluster(cluster_input):
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Cluster inference requires INFERENCE_ENGINE=fused")
+
+    racks = list(cluster_input.graphs)
+    for rack in racks:
+        if not resolve_fws(rack, cluster_input.fws):
+            raise HTTPException(status_code=404, detail=f"No models found for rack {rack}")
+
+    start_tensorize = time.perf_counter()
+    xs = {}
+    for rack, graph in cluster_input.graphs.items():
+        try:
+            xs[rack] = tensorize(graph.x)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid graph payload for rack {rack}: {e}")
+
+    try:
+        groups = {}  # id(adjacency) -> (adjacency, {rack: x})
+        for rack, graph in cluster_input.graphs.items():
+            x = xs[rack]
+            adj = resolve_adjacency(to_edge_index(graph.edge_index), x.size(0), device)
+            groups.setdefault(id(adj), (adj, {}))[1][rack] = x
+        tensorize_time = (time.perf_counter() - start_tensorize) * 1000  # ms
+
+        # One fused pass per distinct topology (chain graphs share the cached one per node count)
+        start_forward = time.perf_counter()
+        predictions = {}
+        for adj, graphs in groups.values():
+            with profiler.scope("anomaly_anticipation.forward"):
+                rack_scores = engine.predict_many(graphs, adj, cluster_input.fws)
+            for rack, scores in rack_scores.items():
+                predictions[rack] = {fw: score.tolist() for fw, score in scores.items()}
+        forward_time = (time.perf_counter() - start_forward) * 1000  # ms
+        observe_stage("tensorize", "cluster", tensorize_time)
+        observe_stage("batch_forward", "cluster", forward_time)
+
+        return {
+            "predictions": predictions,
+            "tensorize_ms": tensorize_time,
+            "forward_ms": forward_time,
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+
+@app.post("/predict/{model_id}")
+async def predict_all_horizons(model_id: int, request: Request, fws: Optional[list[int]] = Query(None)):
+    body = await request.body()
+    return await run_in_threadpool(run_profiled, "predict_horizons", run_horizons, model_id, body, request.headers.get("content-type", ""), fws)
+
+def run_horizons(model_id, body, content_type, fws):
+    # Tensorize the graph once and share it across all horizons
+    start_tensorize = time.perf_counter()
+    x, edge_index, graph_input = parse_graph(body, content_type, MultiHorizonInput)
+    tensorize_time = (time.perf_counter() - start_tensorize) * 1000  # ms
+
+    if fws is None and graph_input is not None:
+        fws = graph_input.fws
+    fws = resolve_fws(model_id, fws)
+    if not fws:
+        raise HTTPException(status_code=404, detail=f"No models found for rack {model_id}")
+
+    try:
+        adj = resolve_adjacency(edge_index, x.size(0), device)
+
+        # Horizons already scored for this exact input are served from the result cache
+        digest = input_digest(x, adjacency_id(adj))
+        engine_kind = "fused" if engine is not None else "module"
+        cache_keys = {fw: result_cache.key(digest, model_identity(model_id, fw, engine_kind)) for fw in fws}
+        predictions = {}
+        timings = {}
+        for fw in fws:
+            cached = result_cache.get(cache_keys[fw])
+            if cached is not None:
+                predictions[fw] = cached
+                timings[fw] = 0.0
+        missing = [fw for fw in fws if fw not in predictions]
+
+        if missing and engine is not None:
+            # All horizons in one stacked pass, timings are the amortized share per model
+            start_forward = time.perf_counter()
+            with profiler.scope("anomaly_anticipation.forward"):
+                scores = engine.predict(model_id, x, adj, missing)
+            forward_time = (time.perf_counter() - start_forward) * 1000  # ms
+            for fw in missing:
+                predictions[fw] = scores[fw].tolist()
+                timings[fw] = forward_time / len(missing)
+        elif missing:
+            with torch.no_grad():
+                for fw in missing:
+                    start_model = time.perf_counter()
+                    with profiler.scope("anomaly_anticipation.forward"):
+                        out = models[f"{fw}/rack_{model_id}"](x, adj=adj)
+                    predictions[fw] = torch.sigmoid(out).squeeze().tolist()
+                    timings[fw] = (time.perf_counter() - start_model) * 1000  # ms
+        result_cache.put_many({cache_keys[fw]: predictions[fw] for fw in missing})
 
-        return {"prediction": pred.squeeze().tolist()}
+        observe_stage("tensorize", model_id, tensorize_time)
+        for fw in fws:
+            if fw in missing:
+                observe_stage("forward", model_id, timings[fw], fw)
+            PREDICTIONS.labels(rack=str(model_id), fw=str(fw), cached="false" if fw in missing else "true").inc()
+
+        return {
+            "rack": model_id,
+            "predictions": {fw: predictions[fw] for fw in fws},
+            "timings": {fw: timings[fw] for fw in fws},
+            "cached": [fw for fw in fws if fw not in missing],
+            "tensorize_ms": tensorize_time,
+        }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Inference failed: {str(e)}")
+
+@app.get("/models/stats")
+def get_model_stats():
+    return {
+        "registry": models.stats(),
+        "fused": engine.stats() if engine is not None else None,
+        "result_cache": result_cache.stats(),
+    }
+
+# Model cache, fused stack and result cache stats also exported as gauges on /metrics
+register_stats("inference_models", get_model_stats)
+
+@app.post("/admin/profile", status_code=202)
+def start_profile(requests: int = Query(10, ge=1, le=1000), record_shapes: bool = False):
+    """torch.profiler trace of the next `requests` prediction requests under /app/logs/profiles."""
+    try:
+        profiler.arm(requests, record_shapes)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.status()
+
+@app.get("/admin/profile")
+def get_profile_status():
+    return profiler.status()
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: stage histograms, prediction counters, cache gauges, process RSS."""
+    return metrics_response()
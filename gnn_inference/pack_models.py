@@ -0,0 +1,42 @@
+"""Pack every GNN_models/FW_*/{rack}_{fw}.pth checkpoint into one model bundle.
+
+Usage (inside the gnn_inference container, GNN_models is the host mount):
+    python pack_models.py                          # -> /app/GNN_models/models.bundle
+    python pack_models.py --base-dir GNN_models --output GNN_models/models.bundle
+"""
+import os
+import re
+import argparse
+import torch
+
+from model_bundle import write_bundle
+
+CHECKPOINT = re.compile(r"(\d+)_(\d+)\.pth$")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack GNN checkpoints into one memory-mappable bundle.")
+    parser.add_argument("--base-dir", default="/app/GNN_models")
+    parser.add_argument("--output", default=None, help="bundle path (default: <base-dir>/models.bundle)")
+    args = parser.parse_args()
+    output = args.output or os.path.join(args.base_dir, "models.bundle")
+
+    states = {}
+    for fw_dir in sorted(os.listdir(args.base_dir)):
+        if not fw_dir.startswith("FW_"):
+            continue
+        for filename in sorted(os.listdir(os.path.join(args.base_dir, fw_dir))):
+            match = CHECKPOINT.match(filename)
+            if match is None:
+                continue
+            rack, fw = match.groups()
+            path = os.path.join(args.base_dir, fw_dir, filename)
+            states[f"{fw}/rack_{rack}"] = torch.load(path, map_location="cpu")
+
+    tmp_output = output + ".tmp"
+    write_bundle(tmp_output, states, metadata={"format": "pt", "models": len(states)})
+    os.replace(tmp_output, output)
+    print(f"Packed {len(states)} models into {output} ({os.path.getsize(output) / (1024 * 1024):.1f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from torch.profiler import profile, record_function, ProfilerActivity
+
+logger = logging.getLogger(__name__)
+
+# Where armed profiles are written: a Chrome trace and an operator table per session
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/app/logs/profiles")
+
+_disabled = nullcontext()
+
+
+class RequestProfiler:
+    """torch.profiler over the next N prediction requests, armed through /admin/profile.
+
+    One profiler session spans from the first armed request to the end of the
+    Nth; concurrent requests land in the same trace. Disarmed, request() and
+    scope() return a shared no-op context, so the hot path pays one attribute
+    check. The trace (chrome://tracing, Perfetto) and a table of operators by
+    self CPU time are written to PROFILE_DIR.
+    """
+
+    def __init__(self, out_dir=PROFILE_DIR):
+        self.out_dir = out_dir
+        self.remaining = 0
+        self.active = 0
+        self.requests = 0
+        self.record_shapes = False
+        self.session = None
+        self.started = None
+        self.last = None
+        self._lock = threading.Lock()
+
+    def arm(self, requests, record_shapes=False):
+        with self._lock:
+            if self.remaining or self.session is not None:
+                raise RuntimeError(f"already profiling, {self.remaining} requests to go")
+            self.remaining = requests
+            self.record_shapes = record_shapes
+            self.requests = 0
+
+    def request(self, name):
+        """Context of one request: profiled under `name` while armed."""
+        if not self.remaining:
+            return _disabled
+        return self._profiled(name)
+
+    def scope(self, name):
+        """record_function(name) inside a profiled request, otherwise a no-op."""
+        if self.session is None:
+            return _disabled
+        return record_function(name)
+
+    @contextmanager
+    def _profiled(self, name):
+        with self._lock:
+            taken = self.remaining > 0
+            if taken:
+                self.remaining -= 1
+                self.active += 1
+                if self.session is None:
+                    self.session = profile(activities=[ProfilerActivity.CPU], record_shapes=self.record_shapes)
+                    self.session.__enter__()
+                    self.started = time.time()
+        if not taken:
+            yield
+            return
+        try:
+            with record_function(name):
+                yield
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.requests += 1
+                if not self.remaining and not self.active:
+                    self._finish()
+
+    def _finish(self):
+        session, self.session = self.session, None
+        session.__exit__(None, None, None)
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, f"inference-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))}")
+        session.export_chrome_trace(base + ".trace.json")
+        table = session.key_averages(group_by_input_shape=self.record_shapes).table(sort_by="self_cpu_time_total", row_limit=40)
+        with open(base + ".ops.txt", "w") as f:
+            f.write(table)
+        self.last = {"trace": base + ".trace.json", "ops": base + ".ops.txt", "requests": self.requests}
+        logger.info(f"Profile of {self.requests} requests written to {base}.*")
+
+    def status(self):
+        with self._lock:
+            return {
+                "remaining_requests": self.remaining,
+                "in_progress": self.session is not None,
+                "last": self.last,
+            }
@@ -0,0 +1,136 @@
+import os
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Cached (input, model) results: 0 entries disables the cache, a TTL of 0 never expires
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 100000))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 7 * 24 * 3600))
+# SQLite file the cache is written through to and reloaded from at startup; "" keeps it in memory
+RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH", "/app/cache/result_cache.sqlite")
+
+
+def input_digest(x, adjacency_id):
+    """Content hash of a request's node features and graph topology."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((tuple(x.shape), adjacency_id)).encode())
+    h.update(np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32).data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Bounded LRU of sigmoid scores keyed by input digest and model identity.
+
+    Entries older than the TTL are treated as misses. Every insert is written
+    through to SQLite so the most recent entries survive a restart; evicted
+    and expired entries are deleted from the file as well.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, path=RESULT_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()  # key -> (created, scores), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.loaded = 0
+        self._lock = threading.Lock()
+
+        self.conn = None
+        if max_entries and path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL NOT NULL, scores BLOB NOT NULL)")
+            self.conn.commit()
+            self.load()
+
+    def key(self, digest, model_identity):
+        return f"{digest}|{model_identity}"
+
+    def fresh(self, created, now):
+        return not self.ttl or now - created < self.ttl
+
+    def load(self):
+        now = time.time()
+        with self.conn:
+            if self.ttl:
+                self.conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+            rows = self.conn.execute(
+                "SELECT key, created, scores FROM results ORDER BY created DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+            # anything beyond the newest max_entries would be evicted immediately
+            self.conn.execute("DELETE FROM results WHERE key NOT IN (SELECT key FROM results ORDER BY created DESC LIMIT ?)", (self.max_entries,))
+        for key, created, blob in reversed(rows):
+            self.entries[key] = (created, np.frombuffer(blob, dtype=np.float32).tolist())
+        self.loaded = len(rows)
+        logger.info(f"Result cache: {self.loaded} entries loaded from {self.path}")
+
+    def get(self, key):
+        if not self.max_entries:
+            return None
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and not self.fresh(entry[0], time.time()):
+                del self.entries[key]
+                self.expired += 1
+                self._delete([key])
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put_many(self, items):
+        """Insert {key: scores list} and write them through in one transaction."""
+        if not self.max_entries or not items:
+            return
+        now = time.time()
+        with self._lock:
+            for key, scores in items.items():
+                self.entries[key] = (now, scores)
+                self.entries.move_to_end(key)
+            evicted = []
+            while len(self.entries) > self.max_entries:
+                evicted.append(self.entries.popitem(last=False)[0])
+            self.evictions += len(evicted)
+
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO results (key, created, scores) VALUES (?, ?, ?)",
+                        [(key, now, np.asarray(scores, dtype=np.float32).tobytes()) for key, scores in items.items()],
+                    )
+                self._delete(evicted)
+
+    def _delete(self, keys):
+        if self.conn is not None and keys:
+            with self.conn:
+                self.conn.executemany("DELETE FROM results WHERE key = ?", [(key,) for key in keys])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "loaded_from_disk": self.loaded,
+                "path": self.path if self.conn is not None else None,
+            }
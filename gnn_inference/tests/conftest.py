@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# Service modules import each other as top-level modules, as in the container
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+os.environ["INFERENCE_MODE"] = "eager"
+# model_serve_app: no persistent result cache, no bundle
+os.environ["RESULT_CACHE_PATH"] = ""
+os.environ["MODEL_BUNDLE"] = ""
+
+MODELS_DIR = os.path.join(SERVICE_DIR, "GNN_models")
+
+
+@pytest.fixture(scope="session")
+def registry():
+    """Registry over the repository's .pth checkpoints, without a bundle or cache limits."""
+    from load_models import ModelRegistry
+
+    registry = ModelRegistry(base_dir=MODELS_DIR, max_models=0, max_mb=0, bundle_path=None)
+    if not len(registry):
+        pytest.skip(f"no checkpoints under {MODELS_DIR}")
+    return registry
+
+
+def chain_edge_index(num_nodes):
+    import torch
+    from torch_geometric.utils import to_undirected
+
+    return to_undirected(torch.stack([torch.arange(num_nodes - 1), torch.arange(1, num_nodes)]))
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+
+import pytest
+import torch
+
+from adjacency import chain_adjacency
+from exec_modes import MODE_MAX_DRIFT, OptimizedModel, build_runner, optimize
+from load_models import rack_ids, fw_values
+from conftest import SERVICE_DIR
+
+NUM_NODES = 20
+
+
+def held_out_inputs(count=16, seed=1234):
+    """Inputs other than drift_check's probes (seed 0)."""
+    generator = torch.Generator().manual_seed(seed)
+    return [torch.rand(NUM_NODES, 417, generator=generator) for _ in range(count)]
+
+
+def assert_within_tolerance(model, served, key):
+    adj = chain_adjacency(NUM_NODES)
+    with torch.no_grad():
+        for x in held_out_inputs():
+            expected = torch.sigmoid(model(x, adj=adj))
+            actual = torch.sigmoid(served(x, adj=adj))
+            drift = (actual - expected).abs().max().item()
+            assert drift <= MODE_MAX_DRIFT, f"{key}: drift {drift:.2e}"
+
+
+@pytest.mark.parametrize("mode", ["torchscript", "compile"])
+def test_exact_modes_match_eager(registry, mode):
+    for rack in rack_ids:
+        for fw in (4, 24, 288):
+            key = f"{fw}/rack_{rack}"
+            model = registry.get(key)
+            try:
+                runner = build_runner(model, mode)
+            except Exception as e:  # e.g. torch.compile without a working C compiler
+                pytest.skip(f"{mode} unavailable here: {e}")
+            served = optimize(model, key, mode=mode)
+            assert isinstance(served, OptimizedModel), f"{key}: {mode} fell back to eager"
+            assert_within_tolerance(model, OptimizedModel(model, runner, mode), key)
+            assert_within_tolerance(model, served, key)
+
+
+def test_int8_served_within_tolerance(registry):
+    # int8 drift depends on the model; optimize must only serve it where it stays within tolerance
+    served_int8 = 0
+    for rack in rack_ids:
+        for fw in fw_values:
+            key = f"{fw}/rack_{rack}"
+            model = registry.get(key)
+            served = optimize(model, key, mode="int8")
+            served_int8 += served is not model
+            assert_within_tolerance(model, served, key)
+    assert served_int8  # the check does not just reject every model
+
+
+def test_optimize_falls_back_to_eager_past_tolerance(registry, monkeypatch):
+    import exec_modes
+
+    key = f"4/rack_{rack_ids[0]}"
+    model = registry.get(key)
+    monkeypatch.setattr(exec_modes, "MODE_MAX_DRIFT", -1.0)
+    assert optimize(model, key, mode="int8") is model
+
+
+def test_fused_engine_refuses_other_modes():
+    env = dict(os.environ, INFERENCE_ENGINE="fused", INFERENCE_MODE="int8")
+    result = subprocess.run(
+        [sys.executable, "-c", "import model_serve_app"], cwd=SERVICE_DIR, env=env, capture_output=True, text=True
+    )
+    assert result.returncode != 0
+    assert "INFERENCE_ENGINE=module" in result.stderr
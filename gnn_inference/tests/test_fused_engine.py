@@ -0,0 +1,85 @@
+import torch
+
+from adjacency import chain_adjacency
+from fused_engine import FusedEngine, check_equivalence
+from load_models import ModelRegistry, rack_ids, fw_values
+from conftest import MODELS_DIR, chain_edge_index
+
+NUM_NODES = 20
+ATOL = 1e-5
+
+
+def module_scores(registry, rack, fw, x):
+    """Reference: the per-model GCNConv forward on an explicit edge_index."""
+    with torch.no_grad():
+        return torch.sigmoid(registry.get(f"{fw}/rack_{rack}")(x, chain_edge_index(len(x)))).squeeze(-1)
+
+
+def rack_inputs(racks, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    return {rack: torch.rand(NUM_NODES, 417, generator=generator) for rack in racks}
+
+
+def assert_matches(registry, results, graphs, fws=None):
+    for rack, x in graphs.items():
+        expected_fws = [fw for fw in fw_values if f"{fw}/rack_{rack}" in registry and (fws is None or fw in fws)]
+        assert sorted(results[rack]) == expected_fws
+        for fw, score in results[rack].items():
+            torch.testing.assert_close(score, module_scores(registry, rack, fw, x), atol=ATOL, rtol=0)
+
+
+def test_single_rack_matches_modules(registry):
+    engine = FusedEngine(registry, torch.device("cpu"))
+    adj = chain_adjacency(NUM_NODES)
+    for rack, x in rack_inputs(rack_ids).items():
+        assert_matches(registry, {rack: engine.predict(rack, x, adj)}, {rack: x})
+
+
+def test_cluster_matches_modules(registry):
+    # distinct inputs per rack, so a rack scored with another rack's graph or models fails
+    engine = FusedEngine(registry, torch.device("cpu"))
+    adj = chain_adjacency(NUM_NODES)
+    graphs = rack_inputs(rack_ids, seed=1)
+    assert_matches(registry, engine.predict_many(graphs, adj), graphs)
+    assert_matches(registry, engine.predict_many(graphs, adj, fws=[6, 96]), graphs, fws=[6, 96])
+
+    subset = {rack: graphs[rack] for rack in rack_ids[1:4]}
+    assert_matches(registry, engine.predict_many(subset, adj, fws=[4, 288]), subset, fws=[4, 288])
+
+
+def test_batch_matches_modules(registry):
+    engine = FusedEngine(registry, torch.device("cpu"))
+    adj = chain_adjacency(NUM_NODES)
+    snapshots = torch.rand(3, NUM_NODES, 417, generator=torch.Generator().manual_seed(2))
+    rack = rack_ids[0]
+    scores = engine.predict_batch(rack, snapshots, adj, fws=[4, 12])
+    for fw, batch in scores.items():
+        for x, score in zip(snapshots, batch):
+            torch.testing.assert_close(score, module_scores(registry, rack, fw, x), atol=ATOL, rtol=0)
+
+
+def test_check_equivalence(registry):
+    max_diff, ok = check_equivalence(FusedEngine(registry, torch.device("cpu")), rack_ids, NUM_NODES, ATOL)
+    assert ok, max_diff
+
+
+def test_stacks_share_the_registry_byte_budget(registry):
+    stack_bytes = FusedEngine(registry, torch.device("cpu")).get_stack([rack_ids[0]]).gcn.nbytes()
+    # room for two single-rack stacks plus a few cached models
+    budget = ModelRegistry(base_dir=MODELS_DIR, max_models=0, max_mb=2.5 * stack_bytes / (1024 * 1024), bundle_path=None)
+    engine = FusedEngine(budget, torch.device("cpu"))
+    for fw in fw_values:
+        budget.get(f"{fw}/rack_{rack_ids[0]}")
+    loaded = len(budget.cache)
+
+    adj = chain_adjacency(NUM_NODES)
+    for rack, x in rack_inputs(rack_ids).items():
+        assert_matches(registry, {rack: engine.predict(rack, x, adj)}, {rack: x})
+        stats = budget.stats()
+        assert stats["total_mb"] <= stats["max_mb"]
+        assert stats["fused_mb"] == engine.stats()["mb"]
+
+    # stacks pushed out the cached models first, then older stacks
+    assert len(budget.cache) < loaded
+    assert len(engine.stacks) == 2 and engine.evictions == len(rack_ids) - 2
+    assert budget.fused_bytes == sum(stack.gcn.nbytes() for stack in engine.stacks.values())
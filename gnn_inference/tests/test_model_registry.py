@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from load_models import ModelRegistry, rack_ids
+from conftest import MODELS_DIR
+
+
+def blocking_registry():
+    """Registry whose build of the 4/rack_0 model waits for the returned event."""
+    registry = ModelRegistry(base_dir=MODELS_DIR, max_models=0, max_mb=0, bundle_path=None)
+    if not len(registry):
+        pytest.skip(f"no checkpoints under {MODELS_DIR}")
+    release = threading.Event()
+    builds = []
+    build = registry.build
+
+    def slow_build(key):
+        builds.append(key)
+        if key == f"4/rack_{rack_ids[0]}":
+            assert release.wait(10)
+        return build(key)
+
+    registry.build = slow_build
+    return registry, release, builds
+
+
+def test_slow_build_does_not_block_other_models():
+    registry, release, builds = blocking_registry()
+    slow, other = f"4/rack_{rack_ids[0]}", f"6/rack_{rack_ids[0]}"
+    cached = registry.get(other)
+
+    with ThreadPoolExecutor(3) as pool:
+        waiting = [pool.submit(registry.get, slow) for _ in range(2)]
+        # a hit and another miss complete while the slow build is still running
+        assert pool.submit(registry.get, other).result(timeout=5) is cached
+        assert pool.submit(registry.get, f"12/rack_{rack_ids[0]}").result(timeout=5) is not None
+        assert not any(future.done() for future in waiting)
+        release.set()
+        first, second = (future.result(timeout=10) for future in waiting)
+
+    assert first is second is registry.get(slow)
+    assert builds.count(slow) == 1
+    assert registry.stats()["misses"] == 3
+
+
+def test_failed_build_is_retried():
+    registry = ModelRegistry(base_dir=MODELS_DIR, max_models=0, max_mb=0, bundle_path=None)
+    key = f"6/rack_{rack_ids[0]}"
+    build = registry.build
+    calls = []
+
+    def flaky_build(key):
+        calls.append(key)
+        if len(calls) == 1:
+            raise OSError("checkpoint not readable")
+        return build(key)
+
+    registry.build = flaky_build
+    with pytest.raises(OSError):
+        registry.get(key)
+    assert registry.get(key) is not None
+    assert len(calls) == 2 and registry.stats()["loaded"] == 1
@@ -0,0 +1,48 @@
+import io
+
+import numpy as np
+import pytest
+import torch
+from fastapi.testclient import TestClient
+
+import model_serve_app
+from fused_engine import FusedEngine
+from load_models import rack_ids
+from wire import NPY_CONTENT_TYPE
+
+
+@pytest.fixture
+def client(registry, monkeypatch):
+    monkeypatch.setattr(model_serve_app, "models", registry)
+    monkeypatch.setattr(model_serve_app, "engine", FusedEngine(registry, torch.device("cpu")))
+    return TestClient(model_serve_app.app)
+
+
+def npy(array):
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(array, dtype=np.float32))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("x", [[[0.5] * 417, [0.5] * 416], [], [[]], [[0.5, "a"]]])
+def test_malformed_json_graph_is_422(client, x):
+    rack = rack_ids[0]
+    assert client.post(f"/predict/{rack}", json={"x": x}).status_code == 422
+    assert client.post(f"/predict/4/{rack}", json={"x": x}).status_code == 422
+    assert client.post("/predict/cluster", json={"graphs": {str(rack): {"x": x}}}).status_code == 422
+
+
+def test_malformed_batch_is_422(client):
+    rack = rack_ids[0]
+    for x in ([], [[]], [[[0.5] * 417], [[0.5] * 417, [0.5] * 417]]):
+        assert client.post(f"/predict/{rack}/batch", json={"x": x}).status_code == 422
+    headers = {"content-type": NPY_CONTENT_TYPE}
+    assert client.post(f"/predict/{rack}/batch", content=npy(np.zeros((0, 20, 417))), headers=headers).status_code == 422
+    assert client.post(f"/predict/{rack}", content=npy(np.zeros((0, 417))), headers=headers).status_code == 422
+
+
+def test_valid_graph_is_scored(client):
+    rack = rack_ids[0]
+    response = client.post(f"/predict/{rack}", json={"x": [[0.5] * 417] * 20, "fws": [4]})
+    assert response.status_code == 200
+    assert len(response.json()["predictions"]["4"]) == 20
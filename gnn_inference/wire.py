@@ -0,0 +1,31 @@
+import io
+import warnings
+import numpy as np
+import torch
+
+# Binary request body: one NumPy .npy float32 array (N x F) or (T x N x F)
+NPY_CONTENT_TYPE = "application/x-npy"
+
+
+def decode_npy(body):
+    """Wrap a .npy float32 payload as a tensor without copying or per-element checks."""
+    buf = io.BytesIO(body)
+    try:
+        major, _ = np.lib.format.read_magic(buf)
+    except ValueError:
+        raise ValueError("payload is not a .npy array")
+    read_header = np.lib.format.read_array_header_1_0 if major == 1 else np.lib.format.read_array_header_2_0
+    shape, fortran_order, dtype = read_header(buf)
+    offset = buf.tell()
+
+    if dtype != np.dtype("<f4") or fortran_order:
+        raise ValueError(f"expected a C-ordered little-endian float32 array, got {dtype} (fortran_order={fortran_order})")
+
+    count = int(np.prod(shape))
+    if len(body) - offset != count * 4:
+        raise ValueError(f"payload size does not match shape {shape}")
+
+    with warnings.catch_warnings():
+        # the request body is immutable bytes; the tensor is only ever read
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.frombuffer(body, dtype=torch.float32, offset=offset, count=count).view(shape)